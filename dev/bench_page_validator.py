@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+"""
+Time PageValidator on a generated glyph-level PAGE.
+
+Run from the repository root, e.g. with ``make bench``:
+
+    python dev/bench_page_validator.py [N_LINES [N_WORDS]]
+"""
+
+from sys import argv, path
+from os.path import dirname, join
+from time import perf_counter
+
+path.insert(0, join(dirname(__file__), '..'))
+
+# pylint: disable=wrong-import-position
+from ocrd_models.ocrd_page import parseString, to_xml
+from ocrd_validators import PageValidator
+from tests.validator.test_page_validator import make_glyph_page # pylint: disable=import-error
+
+n_lines = int(argv[1]) if len(argv) > 1 else 100
+n_words = int(argv[2]) if len(argv) > 2 else 15
+ocrd_page = parseString(to_xml(make_glyph_page(n_lines=n_lines, n_words=n_words, text=True)).encode('utf-8'), silence=True)
+for consistency in ['off', 'strict']:
+    start = perf_counter()
+    report = PageValidator.validate(ocrd_page=ocrd_page, page_textequiv_consistency=consistency)
+    print("page_textequiv_consistency=%s: validated %d glyphs in %.2fs (%d errors)" % (
+        consistency, n_lines * n_words * 8, perf_counter() - start, len(report.errors)))
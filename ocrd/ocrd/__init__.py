@@ -17,6 +17,9 @@ Related (and dependent) packages:
 from ocrd.processor.base import run_processor, run_cli, Processor
 from ocrd_models import OcrdMets, OcrdExif, OcrdFile, OcrdAgent
 from ocrd.resolver import Resolver
+from ocrd.download_cache import DownloadCache
+from ocrd.async_resolver import AsyncResolver
+from ocrd.remote_file import RemoteFile
 from ocrd_validators import *
 from ocrd.workspace import Workspace
 from ocrd.workspace_backup import WorkspaceBackupManager
@@ -0,0 +1,71 @@
+"""
+asyncio counterpart of :py:class:`ocrd.resolver.Resolver`.
+"""
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from ocrd.constants import DOWNLOAD_JOBS
+from ocrd.resolver import Resolver
+
+# get_running_loop is new in Python 3.7, which deprecates get_event_loop inside coroutines
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+class AsyncResolver():
+    """
+    Awaitable versions of the :py:class:`ocrd.resolver.Resolver` methods that
+    do not block the event loop.
+
+    HTTP requests and file I/O run in a dedicated thread pool, through the
+    pooled session of the wrapped :py:class:`ocrd.resolver.Resolver`. At most
+    ``concurrency`` of them run at the same time, however many workspaces
+    are being staged.
+
+    Args:
+        resolver (:py:class:`ocrd.resolver.Resolver`): Resolver to delegate to. Default: A new one
+        concurrency (integer): Maximum number of concurrent blocking operations
+    """
+
+    def __init__(self, resolver=None, concurrency=DOWNLOAD_JOBS):
+        self.resolver = resolver if resolver else Resolver(jobs=concurrency)
+        self.concurrency = concurrency
+        # max_workers limits the concurrency, regardless of the event loop
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run the blocking ``fn(*args, **kwargs)`` in the thread pool and return its result.
+        """
+        return await _running_loop().run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def download_to_directory(self, directory, url, **kwargs):
+        """
+        See :py:meth:`ocrd.resolver.Resolver.download_to_directory`
+        """
+        return await self.run(self.resolver.download_to_directory, directory, url, **kwargs)
+
+    async def workspace_from_url(self, mets_url, download=False, progress=None, staging=None, if_exists='skip', **kwargs):
+        """
+        See :py:meth:`ocrd.resolver.Resolver.workspace_from_url`.
+
+        Files are downloaded with :py:meth:`ocrd.workspace.Workspace.download_files_async`.
+        """
+        workspace = await self.run(self.resolver.workspace_from_url, mets_url, **kwargs)
+        workspace.async_resolver = self
+        if download:
+            await workspace.download_files_async(workspace.mets.find_files(), progress=progress, staging=staging, if_exists=if_exists)
+        return workspace
+
+    async def workspace_from_nothing(self, directory, **kwargs):
+        """
+        See :py:meth:`ocrd.resolver.Resolver.workspace_from_nothing`
+        """
+        workspace = await self.run(self.resolver.workspace_from_nothing, directory, **kwargs)
+        workspace.async_resolver = self
+        return workspace
+
+    def shutdown(self):
+        """
+        Shut down the thread pool.
+        """
+        self._executor.shutdown()
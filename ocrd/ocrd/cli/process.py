@@ -4,7 +4,7 @@ CLI for task_sequence
 import click
 
 from ocrd_utils import getLogger
-from ocrd.task_sequence import run_tasks
+from ocrd.task_sequence import run_tasks, ProcessorTask
 
 from ..decorators import ocrd_loglevel
 
@@ -16,12 +16,18 @@ from ..decorators import ocrd_loglevel
 @ocrd_loglevel
 @click.option('-m', '--mets', help="METS to process", default="mets.xml")
 @click.option('-g', '--page-id', help="ID(s) of the pages to process")
+@click.option('-C', '--checkpoint-pages', type=int, default=0, help="Run each task on batches of this many pages and record finished pages in the workspace, so that running the same tasks again resumes where it stopped")
+@click.option('--profile', type=click.Choice(['jsonl', 'csv']), help="Let processors write per-page profiles in this format next to the METS and log them aggregated per task")
+@click.option('--clear-tool-json-cache', is_flag=True, default=False, help="Forget the cached ocrd-tool.json of all processors and query them with --dump-json again")
 @click.argument('tasks', nargs=-1, required=True)
-def process_cli(log_level, mets, page_id, tasks):
+def process_cli(log_level, mets, page_id, checkpoint_pages, profile, clear_tool_json_cache, tasks):
     """
     Process a series of tasks
     """
     log = getLogger('ocrd.cli.process')
 
-    run_tasks(mets, log_level, page_id, tasks)
+    if clear_tool_json_cache and ProcessorTask.ocrd_tool_json_cache:
+        ProcessorTask.ocrd_tool_json_cache.clear()
+
+    run_tasks(mets, log_level, page_id, tasks, checkpoint_pages=checkpoint_pages, profile=profile)
     log.info("Finished")
@@ -1,11 +1,16 @@
+import re
 import sys
+from glob import glob
+from multiprocessing import Pool
+from pathlib import Path
+from traceback import format_exc
 
 import click
-from json import loads
+from json import loads, dumps
 import codecs
 
 from ocrd import Resolver, Workspace
-from ocrd.task_sequence import ProcessorTask, validate_tasks
+from ocrd.task_sequence import ProcessorTask, validate_tasks, validate_each_task
 
 from ocrd_utils import (
     parse_json_string_or_file
@@ -16,13 +21,67 @@ from ocrd_validators import (
     PageValidator,
     ParameterValidator,
     WorkspaceValidator,
+    ValidationReport,
+    ValidationCache,
+    PageXsdValidator,
 )
+from ocrd_validators.constants import VALIDATION_CACHE_DIR, PAGE_XSD
 
 def _inform_of_result(report):
     if not report.is_valid:
         print(report.to_xml())
         sys.exit(1)
 
+def _expand_batch_paths(paths):
+    """
+    Yield the paths and glob matches in ``paths``, reading paths line by line
+    from STDIN for ``-``.
+    """
+    for path in paths:
+        if path == '-':
+            for line in sys.stdin:
+                if line.strip():
+                    yield line.strip()
+        elif re.search(r'[*?[]', path):
+            for match in sorted(glob(path, recursive=True)):
+                yield match
+        else:
+            yield path
+
+def _validate_batch_item(args):
+    """
+    Validate one PAGE-XML file or workspace for ``ocrd validate batch``, possibly in a worker process.
+    """
+    path, kwargs = args
+    result = {'path': path}
+    try:
+        mets = Path(path, 'mets.xml') if Path(path).is_dir() else Path(path)
+        if not mets.exists():
+            raise FileNotFoundError("No such file or directory: %s" % path)
+        if mets.name == 'mets.xml':
+            result['type'] = 'workspace'
+            if kwargs['check_coords'] and kwargs['check_baseline']:
+                page_coordinate_consistency = 'both'
+            elif kwargs['check_coords'] or kwargs['check_baseline']:
+                page_coordinate_consistency = 'poly' if kwargs['check_coords'] else 'baseline'
+            else:
+                page_coordinate_consistency = 'off'
+            report = WorkspaceValidator.validate(Resolver(), str(mets.resolve()), src_dir=str(mets.resolve().parent),
+                                                 page_strictness=kwargs['page_textequiv_consistency'],
+                                                 page_coordinate_consistency=page_coordinate_consistency,
+                                                 max_errors=kwargs['max_errors'], cache=kwargs['cache'],
+                                                 page_xsd=kwargs['xsd'])
+        else:
+            result['type'] = 'page'
+            report = PageValidator.validate(filename=path, **kwargs)
+    except Exception: # pylint: disable=broad-except
+        report = ValidationReport()
+        report.add_error("Validation aborted with exception: %s" % format_exc())
+    result['valid'] = report.is_valid
+    for level in ['errors', 'warnings', 'notices']:
+        result[level] = [str(msg) for msg in report.__dict__[level]]
+    return result
+
 
 @click.group("validate")
 def validate_cli():
@@ -60,11 +119,65 @@ def validate_parameters(ocrd_tool, executable, param_json):
 @click.option('--page-textequiv-strategy', help="Strategy to determine the correct textequiv", type=click.Choice(['first']), default='first')
 @click.option('--check-baseline', help="Whether Baseline must be fully within TextLine/Coords", is_flag=True, default=False)
 @click.option('--check-coords', help="Whether *Region/TextLine/Word/Glyph must each be fully contained within Border/*Region/TextLine/Word, resp.", is_flag=True, default=False)
-def validate_page(page, **kwargs):
+@click.option('--max-errors', help="Stop validating after this many errors", type=click.IntRange(min=1), default=None)
+@click.option('--fail-fast', help="Stop validating after the first error, same as --max-errors 1", is_flag=True, default=False)
+@click.option('--cache', help="Reuse the result for a file validated before with the same options, from the cache in %s" % VALIDATION_CACHE_DIR, is_flag=True, default=False)
+@click.option('--check-xsd', help="Validate against the PAGE XML Schema first and skip the consistency checks if that fails", is_flag=True, default=False)
+def validate_page(page, fail_fast, max_errors, cache, check_xsd, **kwargs):
     '''
     Validate PAGE against OCR-D conventions
     '''
-    _inform_of_result(PageValidator.validate(filename=page, **kwargs))
+    _inform_of_result(PageValidator.validate(filename=page, max_errors=1 if fail_fast else max_errors,
+                                             cache=ValidationCache() if cache else None,
+                                             xsd=PAGE_XSD if check_xsd else None, **kwargs))
+
+@validate_cli.command('page-xsd')
+@click.argument('page', required=True, nargs=1)
+@click.option('--iterparse', help="Validate while parsing, with constant memory but without line numbers", is_flag=True, default=False)
+@click.option('--max-errors', help="Stop validating after this many errors", type=click.IntRange(min=1), default=None)
+def validate_page_xsd(page, iterparse, max_errors):
+    '''
+    Validate PAGE against the PAGE XML Schema only
+    '''
+    _inform_of_result(PageXsdValidator.validate(page, iterparse=iterparse, max_errors=max_errors))
+
+@validate_cli.command('batch')
+@click.argument('paths', nargs=-1)
+@click.option('-j', '--jobs', help="Number of processes validating in parallel", type=click.IntRange(min=1), default=1, show_default=True)
+@click.option('--page-textequiv-consistency', help="How strict to check PAGE multi-level textequiv consistency", type=click.Choice(['strict', 'lax', 'off']), default='strict')
+@click.option('--check-baseline', help="Whether Baseline must be fully within TextLine/Coords", is_flag=True, default=False)
+@click.option('--check-coords', help="Whether *Region/TextLine/Word/Glyph must each be fully contained within Border/*Region/TextLine/Word, resp.", is_flag=True, default=False)
+@click.option('--max-errors', help="Stop validating a file after this many errors", type=click.IntRange(min=1), default=None)
+@click.option('--cache', help="Skip files validated before with the same options, using the cache in %s" % VALIDATION_CACHE_DIR, is_flag=True, default=False)
+@click.option('--check-xsd', help="Validate PAGE-XML against the PAGE XML Schema first and skip the consistency checks if that fails", is_flag=True, default=False)
+def validate_batch(paths, jobs, cache, check_xsd, **kwargs):
+    '''
+    Validate many PAGE-XML files and workspaces in one go
+
+    PATHS may be files, directories and glob patterns (with ** for any
+    number of subdirectories). A directory or a file named mets.xml is
+    validated as workspace, any other file as PAGE-XML. With - or without
+    PATHS, paths are read from STDIN, one per line.
+
+    For each path, a JSON object with "path", "type", "valid", "errors",
+    "warnings" and "notices" is printed on a line of its own, in the order of
+    the paths, as soon as it is validated. Exits with 1 if any is invalid.
+    '''
+    kwargs['cache'] = ValidationCache() if cache else None
+    kwargs['xsd'] = PAGE_XSD if check_xsd else None
+    items = ((path, kwargs) for path in _expand_batch_paths(paths or ['-']))
+    all_valid = True
+    pool = Pool(jobs) if jobs > 1 else None
+    try:
+        results = pool.imap(_validate_batch_item, items, chunksize=4) if pool else map(_validate_batch_item, items)
+        for result in results:
+            all_valid = all_valid and result['valid']
+            print(dumps(result), flush=True)
+    finally:
+        if pool:
+            pool.terminate()
+    if not all_valid:
+        sys.exit(1)
 
 #  @validate_cli.command('zip')
 #  @click.argument('src', type=click.Path(dir_okay=True, readable=True, resolve_path=True), required=True)
@@ -100,8 +213,9 @@ def validate_process(tasks, workspace):
     '''
     Validate a sequence of tasks passable to 'ocrd process'
     '''
+    tasks = [ProcessorTask.parse(t) for t in tasks]
     if workspace:
-        _inform_of_result(validate_tasks([ProcessorTask.parse(t) for t in tasks], Workspace(Resolver(), directory=workspace)))
+        _inform_of_result(validate_tasks(tasks, Workspace(Resolver(), directory=workspace)))
     else:
-        for t in [ProcessorTask.parse(t) for t in tasks]:
-            _inform_of_result(t.validate())
+        for report in validate_each_task(tasks):
+            _inform_of_result(report)
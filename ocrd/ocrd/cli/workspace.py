@@ -4,16 +4,18 @@ import sys
 
 import click
 
-from ocrd import Resolver, Workspace, WorkspaceValidator, WorkspaceBackupManager
+from ocrd import Resolver, Workspace, WorkspaceValidator, StreamingValidationReport, ValidationCache, WorkspaceBackupManager, DownloadCache
+from ocrd_validators.constants import VALIDATION_CACHE_DIR, PAGE_XSD
+from ocrd.constants import DOWNLOAD_JOBS, DOWNLOAD_RETRIES, DOWNLOAD_CACHE_DIR
 from ocrd_utils import getLogger, pushd_popd
 
 log = getLogger('ocrd.cli.workspace')
 
 class WorkspaceCtx():
 
-    def __init__(self, directory, mets_basename, automatic_backup):
+    def __init__(self, directory, mets_basename, automatic_backup, download_jobs=DOWNLOAD_JOBS, download_retries=DOWNLOAD_RETRIES, download_cache=False):
         self.directory = directory
-        self.resolver = Resolver()
+        self.resolver = Resolver(jobs=download_jobs, retries=download_retries, download_cache=DownloadCache() if download_cache else None)
         self.mets_basename = mets_basename
         self.automatic_backup = automatic_backup
 
@@ -27,12 +29,15 @@ pass_workspace = click.make_pass_decorator(WorkspaceCtx)
 @click.option('-d', '--directory', envvar='WORKSPACE_DIR', default='.', type=click.Path(file_okay=False), metavar='WORKSPACE_DIR', help='Changes the workspace folder location.', show_default=True)
 @click.option('-M', '--mets-basename', default="mets.xml", help='The basename of the METS file.', show_default=True)
 @click.option('--backup', default=False, help="Backup mets.xml whenever it is saved.", is_flag=True)
+@click.option('-j', '--download-jobs', default=DOWNLOAD_JOBS, type=int, help="Number of files to download concurrently.", show_default=True)
+@click.option('--download-retries', envvar='OCRD_DOWNLOAD_RETRIES', default=DOWNLOAD_RETRIES, type=click.IntRange(min=0), help="How often to retry failed downloads.", show_default=True)
+@click.option('--download-cache', default=False, is_flag=True, help="Serve remote files from a download cache in %s" % DOWNLOAD_CACHE_DIR)
 @click.pass_context
-def workspace_cli(ctx, directory, mets_basename, backup):
+def workspace_cli(ctx, directory, mets_basename, backup, download_jobs, download_retries, download_cache):
     """
     Working with workspace
     """
-    ctx.obj = WorkspaceCtx(os.path.abspath(directory), mets_basename, automatic_backup=backup)
+    ctx.obj = WorkspaceCtx(os.path.abspath(directory), mets_basename, automatic_backup=backup, download_jobs=download_jobs, download_retries=download_retries, download_cache=download_cache)
 
 # ----------------------------------------------------------------------
 # ocrd workspace validate
@@ -48,8 +53,14 @@ def workspace_cli(ctx, directory, mets_basename, backup):
 @click.option('-s', '--skip', help="Tests to skip", default=[], multiple=True, type=click.Choice(['imagefilename', 'dimension', 'mets_unique_identifier', 'mets_file_group_names', 'mets_files', 'pixel_density', 'page', 'url']))
 @click.option('--page-textequiv-consistency', '--page-strictness', help="How strict to check PAGE multi-level textequiv consistency", type=click.Choice(['strict', 'lax', 'fix', 'off']), default='strict')
 @click.option('--page-coordinate-consistency', help="How fierce to check PAGE multi-level coordinate consistency", type=click.Choice(['poly', 'baseline', 'both', 'off']), default='poly')
+@click.option('-j', '--jobs', help="Number of processes validating PAGE-XML files in parallel", type=click.IntRange(min=1), default=1, show_default=True)
+@click.option('--max-errors', help="Stop validating after this many errors", type=click.IntRange(min=1), default=None)
+@click.option('--fail-fast', help="Stop validating after the first error, same as --max-errors 1", is_flag=True, default=False)
+@click.option('--stream-report', help="Write each message as soon as it is found, as JSON lines or XML elements, instead of the whole report at the end", type=click.Choice(['jsonl', 'xml']), default=None)
+@click.option('--cache', help="Skip image and PAGE-XML checks of files validated before with the same options, using the cache in %s" % VALIDATION_CACHE_DIR, is_flag=True, default=False)
+@click.option('--page-check-xsd', help="Validate PAGE-XML against the PAGE XML Schema first and skip the consistency checks if that fails", is_flag=True, default=False)
 @click.argument('mets_url', nargs=-1)
-def validate_workspace(ctx, mets_url, download, skip, page_textequiv_consistency, page_coordinate_consistency):
+def validate_workspace(ctx, mets_url, download, skip, page_textequiv_consistency, page_coordinate_consistency, jobs, max_errors, fail_fast, stream_report, cache, page_check_xsd):
     if not mets_url:
         mets_url = 'mets.xml'
     else:
@@ -61,9 +72,17 @@ def validate_workspace(ctx, mets_url, download, skip, page_textequiv_consistency
         skip=skip,
         download=download,
         page_strictness=page_textequiv_consistency,
-        page_coordinate_consistency=page_coordinate_consistency
+        page_coordinate_consistency=page_coordinate_consistency,
+        jobs=jobs,
+        max_errors=1 if fail_fast else max_errors,
+        report=StreamingValidationReport(sys.stdout, format=stream_report) if stream_report else None,
+        cache=ValidationCache() if cache else None,
+        page_xsd=PAGE_XSD if page_check_xsd else None
     )
-    print(report.to_xml())
+    if stream_report:
+        report.close()
+    else:
+        print(report.to_xml())
     if not report.is_valid:
         sys.exit(128)
 
@@ -74,10 +93,12 @@ def validate_workspace(ctx, mets_url, download, skip, page_textequiv_consistency
 @workspace_cli.command('clone')
 @click.option('-f', '--clobber-mets', help="Overwrite existing METS file", default=False, is_flag=True)
 @click.option('-a', '--download', is_flag=True, help="Download all files and change location in METS file after cloning")
+@click.option('--staging', type=click.Choice(['copy', 'hardlink', 'reflink', 'symlink', 'auto']), default='copy', show_default=True, help="How to put local files into the workspace when downloading. 'auto' tries hardlink, then reflink, then copy")
+@click.option('--if-exists', type=click.Choice(['skip', 'overwrite', 'revalidate']), default='skip', show_default=True, help="What to do with files already downloaded. 'revalidate' only downloads files that changed")
 @click.argument('mets_url')
 @click.argument('workspace_dir', default=None, required=False)
 @pass_workspace
-def workspace_clone(ctx, clobber_mets, download, mets_url, workspace_dir):
+def workspace_clone(ctx, clobber_mets, download, staging, if_exists, mets_url, workspace_dir):
     """
     Create a workspace from a METS_URL and return the directory
 
@@ -93,6 +114,9 @@ def workspace_clone(ctx, clobber_mets, download, mets_url, workspace_dir):
         mets_basename=ctx.mets_basename,
         clobber_mets=clobber_mets,
         download=download,
+        progress=lambda done, total, url: log.info("Downloaded %d/%d: %s", done, total, url),
+        staging=staging,
+        if_exists=if_exists,
     )
     workspace.save_mets()
     print(workspace.directory)
@@ -187,15 +211,18 @@ def workspace_find(ctx, file_grp, mimetype, page_id, file_id, output_field, down
     modified_mets = False
     ret = list()
     workspace = Workspace(ctx.resolver, directory=ctx.directory, mets_basename=ctx.mets_basename)
-    for f in workspace.mets.find_files(
-            ID=file_id,
-            fileGrp=file_grp,
-            mimetype=mimetype,
-            pageId=page_id,
-        ):
-        if download and not f.local_filename:
-            workspace.download_file(f)
+    files = workspace.mets.find_files(
+        ID=file_id,
+        fileGrp=file_grp,
+        mimetype=mimetype,
+        pageId=page_id,
+    )
+    if download:
+        to_download = [f for f in files if not f.local_filename]
+        if to_download:
+            workspace.download_files(to_download)
             modified_mets = True
+    for f in files:
         ret.append([f.ID if field == 'pageId' else getattr(f, field) or ''
                     for field in output_field])
     if modified_mets:
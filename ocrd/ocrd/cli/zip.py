@@ -6,7 +6,7 @@ from ocrd_validators import OcrdZipValidator
 
 from ..resolver import Resolver
 from ..workspace import Workspace
-from ..workspace_bagger import WorkspaceBagger
+from ..workspace_bagger import WorkspaceBagger, ZIP_COMPRESSIONS
 
 @click.group("zip")
 def zip_cli():
@@ -37,7 +37,9 @@ def zip_cli():
 @click.option('-t', '--tag-file', help="Add a non-payload file to bag", type=click.Path(file_okay=True, dir_okay=False, readable=True, resolve_path=True), multiple=True)
 @click.option('-Z', '--skip-zip', help="Create a directory but do not ZIP it", is_flag=True, default=False)
 @click.option('-j', '--processes', help="Number of parallel processes", type=int, default=1)
-def bag(directory, mets_basename, dest, identifier, in_place, manifestation_depth, mets, base_version_checksum, tag_file, skip_zip, processes):
+@click.option('-c', '--compression', help="How to compress files in the ZIP, 'auto' stores already compressed images", type=click.Choice(ZIP_COMPRESSIONS), default='auto', show_default=True)
+@click.option('-l', '--compression-level', help="Deflate level (0-9)", type=click.IntRange(0, 9))
+def bag(directory, mets_basename, dest, identifier, in_place, manifestation_depth, mets, base_version_checksum, tag_file, skip_zip, processes, compression, compression_level):
     """
     Bag workspace as OCRD-ZIP at DEST
     """
@@ -54,7 +56,9 @@ def bag(directory, mets_basename, dest, identifier, in_place, manifestation_dept
         processes=processes,
         tag_files=tag_file,
         skip_zip=skip_zip,
-        in_place=in_place
+        in_place=in_place,
+        compression=compression,
+        compression_level=compression_level
     )
 
 # ----------------------------------------------------------------------
@@ -67,8 +71,10 @@ def bag(directory, mets_basename, dest, identifier, in_place, manifestation_dept
               type=click.Path(file_okay=False, dir_okay=True, writable=True, resolve_path=True),
               help='Workspace folder location.',
               show_default=True)
+@click.option('-j', '--processes', help="Number of files to extract in parallel", type=int, default=1)
+@click.option('-V', '--verify', help="Verify checksums against manifest-sha512.txt while extracting", is_flag=True, default=False)
 @click.argument('src', type=click.Path(dir_okay=False, readable=True, resolve_path=True), required=True)
-def spill(dest, src):
+def spill(dest, src, processes, verify):
     """
     Spill/unpack OCRD-ZIP bag at SRC to DEST
 
@@ -77,7 +83,7 @@ def spill(dest, src):
     """
     resolver = Resolver()
     workspace_bagger = WorkspaceBagger(resolver)
-    workspace = workspace_bagger.spill(src, dest)
+    workspace = workspace_bagger.spill(src, dest, processes=processes, verify=verify)
     print(workspace)
 
 # ----------------------------------------------------------------------
@@ -91,6 +97,7 @@ def spill(dest, src):
 @click.option('-C', '--skip-checksums', help="Whether to omit checksum checks but still check basic BagIt conformance", is_flag=True, default=False)
 @click.option('-D', '--skip-delete', help="Whether to skip deleting the unpacked OCRD-ZIP dir after valdiation", is_flag=True, default=False)
 @click.option('-j', '--processes', help="Number of parallel processes", type=int, default=1)
+@click.option('-S', '--stream', help="Read the payload straight from the ZIP instead of unpacking it", is_flag=True, default=False)
 def validate(src, **kwargs):
     """
     Validate OCRD-ZIP
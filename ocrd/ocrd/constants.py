@@ -1,11 +1,27 @@
 """
 Constants for ocrd.
 """
+from os import environ
+from os.path import join, expanduser
 from pkg_resources import resource_filename
 
 TMP_PREFIX = 'ocrd-core-'
 DEFAULT_UPLOAD_FOLDER = '/tmp/uploads-ocrd-core'
 DOWNLOAD_DIR = '/tmp/ocrd-core-downloads'
+DOWNLOAD_JOBS = 8
+DOWNLOAD_MAX_PER_HOST = 4
+DOWNLOAD_RETRIES = int(environ.get('OCRD_DOWNLOAD_RETRIES', 3))
+DOWNLOAD_BACKOFF = 0.5
+DOWNLOAD_TIMEOUT = (10, 60)
+DOWNLOAD_CHUNK_SIZE = 2 ** 20
+DOWNLOAD_RANGE_BLOCK_SIZE = 2 ** 16
+DOWNLOAD_VALIDATORS_DIR = '.ocrd-download-validators'
 DEFAULT_REPOSITORY_URL = 'http://localhost:5000/'
 BASHLIB_FILENAME = resource_filename(__name__, 'lib.bash')
 BACKUP_DIR = '.backup'
+CHECKPOINT_FILENAME = '.ocrd-process-checkpoint'
+PROFILE_BASENAME = 'ocrd-profile'
+CACHE_DIR = join(environ.get('XDG_CACHE_HOME', join(expanduser('~'), '.cache')), 'ocrd')
+OCRD_TOOL_JSON_CACHE_DIR = join(CACHE_DIR, 'ocrd-tool-json')
+DOWNLOAD_CACHE_DIR = join(CACHE_DIR, 'downloads')
+DOWNLOAD_CACHE_MAX_SIZE = 10 * 2 ** 30
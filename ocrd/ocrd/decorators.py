@@ -11,7 +11,7 @@ from ocrd_utils import (
 
 from ocrd_utils import getLogger
 from .resolver import Resolver
-from .processor.base import run_processor
+from .processor.base import run_processor, find_stale_pages
 from ocrd_validators import WorkspaceValidator
 
 def _set_root_logger_version(ctx, param, value):    # pylint: disable=unused-argument
@@ -27,7 +27,7 @@ parameter_option = click.option('-p', '--parameter',
                                 default='{}',
                                 callback=lambda ctx, param, value: parse_json_string_or_file(value))
 
-def ocrd_cli_wrap_processor(processorClass, ocrd_tool=None, mets=None, working_dir=None, dump_json=False, help=False, version=False, **kwargs):
+def ocrd_cli_wrap_processor(processorClass, ocrd_tool=None, mets=None, working_dir=None, dump_json=False, help=False, version=False, incremental=None, **kwargs):
     LOG = getLogger('ocrd_cli_wrap_processor')
     if dump_json:
         processorClass(workspace=None, dump_json=True)
@@ -46,12 +46,23 @@ def ocrd_cli_wrap_processor(processorClass, ocrd_tool=None, mets=None, working_d
             raise Exception(msg)
         resolver = Resolver()
         workspace = resolver.workspace_from_url(mets, working_dir)
+        if incremental:
+            stale_pages = find_stale_pages(workspace, kwargs['input_file_grp'], kwargs['output_file_grp'], page_id=kwargs.get('page_id'), compare=incremental)
+            if not stale_pages:
+                LOG.info("Output is up to date, nothing to do")
+                return
+            LOG.info("Processing %d stale page(s): %s", len(stale_pages), stale_pages)
+            kwargs['page_id'] = ','.join(stale_pages)
         # TODO once we implement 'overwrite' CLI option and mechanism, disable the
         # `output_file_grp_ check by setting to False-y value if 'overwrite' is set
-        report = WorkspaceValidator.check_file_grp(workspace, kwargs['input_file_grp'], kwargs['output_file_grp'])
+        # With --incremental, only stale pages are processed and their outdated
+        # output is replaced by run_processor, so existing output is no conflict.
+        report = WorkspaceValidator.check_file_grp(workspace, kwargs['input_file_grp'],
+                                                   None if incremental else kwargs['output_file_grp'],
+                                                   page_id=kwargs.get('page_id'))
         if not report.is_valid:
             raise Exception("Invalid input/output file grps:\n\t%s" % '\n\t'.join(report.errors))
-        run_processor(processorClass, ocrd_tool, mets, workspace=workspace, **kwargs)
+        run_processor(processorClass, ocrd_tool, mets, workspace=workspace, incremental=incremental, **kwargs)
 
 def ocrd_loglevel(f):
     """
@@ -79,6 +90,8 @@ def ocrd_cli_options(f):
         click.option('-I', '--input-file-grp', help='File group(s) used as input.', default='INPUT'),
         click.option('-O', '--output-file-grp', help='File group(s) used as output.', default='OUTPUT'),
         click.option('-g', '--page-id', help="ID(s) of the pages to process"),
+        click.option('--incremental', help="Only process pages whose output is missing (exists) or older than the input (mtime)", type=click.Choice(['exists', 'mtime']), default=None),
+        click.option('--profile', help="Process page by page and write timing and resource usage to a profile file next to the METS", type=click.Choice(['jsonl', 'csv']), default=None),
         parameter_option,
         click.option('-J', '--dump-json', help="Dump tool description as JSON and exit", is_flag=True, default=False),
         loglevel_option,
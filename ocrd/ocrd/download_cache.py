@@ -0,0 +1,246 @@
+"""
+Content-addressed cache for remote files, shared between workspaces.
+"""
+import os
+import json
+import hashlib
+from pathlib import Path
+from time import time
+from threading import Lock
+from collections import Counter
+from uuid import uuid4
+
+from atomicwrites import atomic_write
+
+from ocrd_utils import getLogger
+from ocrd.constants import DOWNLOAD_CACHE_DIR, DOWNLOAD_CACHE_MAX_SIZE
+
+class DownloadCache():
+    """
+    Cache of downloaded files, keyed by URL and by content hash.
+
+    For every URL, the ETag, Last-Modified and SHA-256 of the last response
+    are recorded in ``urls/``. The content is stored once per SHA-256 in
+    ``objects/``, however many URLs point to it. Cached URLs are revalidated
+    with a conditional GET unless they were fetched less than ``max_age``
+    seconds ago. Files are put into workspaces by hardlink if possible. Cached
+    objects are read-only, so hardlinked workspace files cannot be modified
+    in place.
+
+    Least recently used objects are evicted when the cache grows beyond
+    ``max_size`` bytes. The time of last use is recorded in ``urls/``, so
+    the mtime of the hardlinked workspace files is left alone.
+
+    Args:
+        directory (string): Directory of the cache
+        max_size (integer): Maximum size of all cached objects in bytes
+        max_age (integer): Seconds after fetching during which a URL is not revalidated
+    """
+
+    def __init__(self, directory=DOWNLOAD_CACHE_DIR, max_size=DOWNLOAD_CACHE_MAX_SIZE, max_age=0):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.max_age = max_age
+        self._size = None
+        self._in_use = Counter()
+        self._lock = Lock()
+        for subdir in ['urls', 'objects', 'tmp']:
+            Path(self.directory, subdir).mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, url):
+        return Path(self.directory, 'urls', '%s.json' % hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def _object_path(self, sha256):
+        return Path(self.directory, 'objects', sha256[:2], sha256)
+
+    def _read_entry(self, url):
+        try:
+            with open(str(self._entry_path(url)), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['url'] != url or not self._object_path(entry['sha256']).exists():
+            return None
+        return entry
+
+    def _write_entry(self, entry):
+        with atomic_write(str(self._entry_path(entry['url'])), overwrite=True) as f:
+            json.dump(entry, f)
+
+    def _store(self, resolver, response):
+        """
+        Store the body of ``response`` and return its SHA-256.
+
+        The object is marked as in use, so it is not evicted before it has
+        been staged; see :py:meth:`_release`.
+        """
+        tmp_path = Path(self.directory, 'tmp', uuid4().hex)
+        sha256 = resolver._write_response(response, tmp_path) # pylint: disable=protected-access
+        obj = self._object_path(sha256)
+        with self._lock:
+            self._in_use[obj] += 1
+            if obj.exists():
+                tmp_path.unlink()
+                return sha256
+            obj.parent.mkdir(exist_ok=True)
+            tmp_path.chmod(0o444)
+            size = tmp_path.stat().st_size
+            os.replace(str(tmp_path), str(obj))
+            if self._size is None:
+                self._size = self._scan()[0]
+            else:
+                self._size += size
+        return sha256
+
+    def _release(self, obj):
+        """
+        Unmark ``obj`` as in use and evict if the cache has grown too large.
+        """
+        with self._lock:
+            self._in_use[obj] -= 1
+            if not self._in_use[obj]:
+                del self._in_use[obj]
+            over_size = self._size is not None and self._size > self.max_size
+        if over_size:
+            self.evict()
+
+    def _acquire(self, entry):
+        """
+        Mark the object of a cached ``entry`` as in use and return its path,
+        or ``None`` if it has been evicted in the meantime.
+        """
+        obj = self._object_path(entry['sha256'])
+        with self._lock:
+            if not obj.exists():
+                return None
+            self._in_use[obj] += 1
+        return obj
+
+    def _last_used(self):
+        """
+        Time each object was last fetched, from the URL entries pointing to it.
+        """
+        ret = {}
+        for path in Path(self.directory, 'urls').glob('*.json'):
+            try:
+                with open(str(path), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            obj = self._object_path(entry['sha256'])
+            ret[obj] = max(ret.get(obj, 0), entry.get('used', entry['fetched']))
+        return ret
+
+    def _scan(self):
+        objects = []
+        for obj in Path(self.directory, 'objects').glob('*/*'):
+            try:
+                stat = obj.stat()
+            except FileNotFoundError:
+                continue
+            objects.append((stat.st_mtime, stat.st_size, obj))
+        return sum(size for _, size, _ in objects), objects
+
+    def evict(self):
+        """
+        Delete least recently used objects until the cache is at most ``max_size`` bytes.
+
+        Objects that are just being stored or staged are kept.
+        """
+        log = getLogger('ocrd.download_cache')
+        with self._lock:
+            total, objects = self._scan()
+            last_used = self._last_used()
+            for _, size, obj in sorted(objects, key=lambda o: (last_used.get(o[2], o[0]), o[2])):
+                if total <= self.max_size:
+                    break
+                if obj in self._in_use:
+                    continue
+                log.debug("Evicting %s (%d bytes)", obj, size)
+                try:
+                    obj.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._size = total
+
+    def fetch(self, resolver, url, dst_path, checksum=None):
+        """
+        Put the file at ``url`` at ``dst_path``, downloading it with
+        ``resolver`` only if it is not cached or has changed.
+
+        Args:
+            resolver (:py:class:`ocrd.resolver.Resolver`): Resolver to send requests with
+            checksum (string, None): Expected checksum as ``algorithm:hexdigest``
+        """
+        log = getLogger('ocrd.download_cache')
+        entry = self._read_entry(url)
+        obj = None
+        if entry and self.max_age and time() - entry['fetched'] < self.max_age:
+            obj = self._acquire(entry)
+            if obj:
+                log.debug("Serving %s from cache without revalidation", url)
+        if obj is None:
+            entry, obj = self._download(resolver, url, entry)
+        try:
+            try:
+                self._stage(resolver, url, obj, dst_path, checksum)
+            except FileNotFoundError:
+                # evicted by another process after all
+                log.debug("%s was evicted, downloading %s again", obj, url)
+                self._release(obj)
+                obj = None
+                entry, obj = self._download(resolver, url, None)
+                self._stage(resolver, url, obj, dst_path, checksum)
+        finally:
+            if obj:
+                self._release(obj)
+        # mark as recently used here, not by touching the object, which is
+        # hardlinked into workspaces
+        entry['used'] = time()
+        self._write_entry(entry)
+
+    def _download(self, resolver, url, entry):
+        """
+        Revalidate the cached ``entry`` of ``url`` or download it anew.
+
+        Returns:
+            the entry and the path of its object, which is marked as in use
+        """
+        log = getLogger('ocrd.download_cache')
+        headers = {}
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        with resolver.http_get(url, stream=True, headers=headers) as response:
+            if entry and response.status_code == 304:
+                obj = self._acquire(entry)
+                if obj is None:
+                    log.debug("Cached %s was evicted", url)
+                    return self._download(resolver, url, None)
+                log.debug("Cached %s still valid", url)
+            elif response.status_code == 200:
+                entry = {
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'sha256': self._store(resolver, response),
+                }
+                obj = self._object_path(entry['sha256'])
+            else:
+                raise Exception("HTTP request failed: %s (HTTP %d)" % (url, response.status_code))
+        entry['fetched'] = time()
+        return entry, obj
+
+    @staticmethod
+    def _stage(resolver, url, obj, dst_path, checksum):
+        if checksum:
+            algorithm, expected_digest = checksum.split(':', 1)
+            hasher = hashlib.new(algorithm)
+            with open(str(obj), 'rb') as f:
+                for chunk in iter(lambda: f.read(2 ** 20), b''):
+                    hasher.update(chunk)
+            if hasher.hexdigest() != expected_digest.lower():
+                raise Exception("Checksum mismatch: %s (%s %s != %s)" % (url, algorithm, hasher.hexdigest(), expected_digest))
+        resolver._stage_local_file(obj, dst_path, 'auto') # pylint: disable=protected-access
@@ -64,6 +64,7 @@ ocrd__parse_argv () {
             -J|--dump-json) ocrd__dumpjson; exit ;;
             -p|--parameter) ocrd__argv[parameter]="$2" ; shift ;;
             -g|--page-id) ocrd__argv[page_id]=$2 ; shift ;;
+            --profile) echo >&2 "WARNING: bashlib processors do not support profiling, ignoring '$1 $2'" ; shift ;;
             -O|--output-file-grp) ocrd__argv[output_file_grp]=$2 ; shift ;;
             -I|--input-file-grp) ocrd__argv[input_file_grp]=$2 ; shift ;;
             -w|--working-dir) ocrd__argv[working_dir]=$(realpath "$2") ; shift ;;
@@ -2,5 +2,9 @@ from .base import (
     Processor,
     run_cli,
     run_processor,
+    find_stale_pages,
+    profile_path,
+    read_profile,
+    aggregate_profile,
     generate_processor_help
 )
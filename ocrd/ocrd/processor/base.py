@@ -1,13 +1,37 @@
 import os
+import sys
+import csv
 import json
+from pathlib import Path
 from click import wrap_text
-from time import time
+from time import time, process_time
 import subprocess
 from ocrd_utils import getLogger, VERSION as OCRD_VERSION
 from ocrd_validators import ParameterValidator
+from ocrd.constants import PROFILE_BASENAME
+try:
+    from resource import getrusage, RUSAGE_SELF
+except ImportError:
+    # not available on Windows
+    getrusage = None
 
 log = getLogger('ocrd.processor')
 
+PROFILE_FORMATS = ['jsonl', 'csv']
+PROFILE_FIELDS = [
+    'executable',
+    'input_file_grp',
+    'output_file_grp',
+    'page_id',
+    'wall_time',
+    'cpu_time',
+    'peak_rss',
+    'bytes_read',
+    'bytes_written',
+    'image_decode_time',
+    'mets_save_time',
+]
+
 def _get_workspace(workspace=None, resolver=None, mets_url=None, working_dir=None):
     if workspace is None:
         if resolver is None:
@@ -17,6 +41,209 @@ def _get_workspace(workspace=None, resolver=None, mets_url=None, working_dir=Non
         workspace = resolver.workspace_from_url(mets_url, dst_dir=working_dir)
     return workspace
 
+def _resource_usage():
+    """
+    Snapshot of CPU time, peak RSS (in bytes) and bytes read/written of this process.
+
+    Peak RSS is ``None`` without the :py:mod:`resource` module (i.e. on
+    Windows), bytes read/written are only available on Linux and ``None``
+    otherwise.
+    """
+    ret = {
+        'cpu_time': process_time(),
+        'peak_rss': None,
+        'bytes_read': None,
+        'bytes_written': None,
+    }
+    if getrusage:
+        usage = getrusage(RUSAGE_SELF)
+        ret['cpu_time'] = usage.ru_utime + usage.ru_stime
+        # ru_maxrss is in bytes on macOS, in KiB everywhere else
+        ret['peak_rss'] = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    try:
+        with open('/proc/self/io', 'r') as f:
+            io = dict(line.split(': ', 1) for line in f.read().splitlines())
+        ret['bytes_read'] = int(io['rchar'])
+        ret['bytes_written'] = int(io['wchar'])
+    except (OSError, KeyError, ValueError):
+        pass
+    return ret
+
+def _profile_record(usage_before, t0, decode_before, workspace):
+    """
+    Profile record of the work done since ``usage_before``, ``t0`` and ``decode_before``
+    """
+    usage = _resource_usage()
+    ret = {
+        'wall_time': time() - t0,
+        'cpu_time': usage['cpu_time'] - usage_before['cpu_time'],
+        'peak_rss': usage['peak_rss'],
+        'image_decode_time': workspace.image_decode_time - decode_before,
+    }
+    for k in ['bytes_read', 'bytes_written']:
+        ret[k] = None if usage[k] is None else usage[k] - usage_before[k]
+    return ret
+
+def _process_page_by_page(processor):
+    """
+    Run ``processor.process`` once per page and return a profile record for each page.
+    """
+    workspace = processor.workspace
+    page_id = processor.page_id
+    pages_with_input = set(
+        f.pageId
+        for grp in (processor.input_file_grp or '').split(',')
+        for f in workspace.mets.find_files(fileGrp=grp, pageId=page_id))
+    records = []
+    try:
+        for page in workspace.mets.physical_pages:
+            if page not in pages_with_input:
+                continue
+            processor.page_id = page
+            usage, t0, decode = _resource_usage(), time(), workspace.image_decode_time
+            processor.process()
+            record = _profile_record(usage, t0, decode, workspace)
+            record['page_id'] = page
+            records.append(record)
+    finally:
+        processor.page_id = page_id
+    return records
+
+def profile_path(workspace, profile):
+    """
+    Path of the profile file in format ``profile`` next to the METS of ``workspace``
+    """
+    if profile not in PROFILE_FORMATS:
+        raise ValueError("Unknown profile format '%s', must be one of %s" % (profile, PROFILE_FORMATS))
+    return Path(Path(workspace.mets_target).parent, '%s.%s' % (PROFILE_BASENAME, profile))
+
+def write_profile(path, records):
+    """
+    Append profile records to a JSON lines or CSV file, depending on the suffix of ``path``.
+    """
+    path = Path(path)
+    if path.suffix == '.csv':
+        write_header = not path.exists()
+        with open(str(path), 'a', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, PROFILE_FIELDS)
+            if write_header:
+                writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(str(path), 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps({k: record.get(k) for k in PROFILE_FIELDS}) + '\n')
+
+def read_profile(path):
+    """
+    Read the profile records from a file written by :py:func:`write_profile`.
+    """
+    path = Path(path)
+    if not path.exists():
+        return []
+    if path.suffix != '.csv':
+        with open(str(path), 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    ret = []
+    with open(str(path), 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            for k, v in row.items():
+                if v == '':
+                    row[k] = None
+                elif k not in ['executable', 'input_file_grp', 'output_file_grp', 'page_id']:
+                    row[k] = float(v)
+            ret.append(row)
+    return ret
+
+def aggregate_profile(records):
+    """
+    Aggregate the profile records of one or more runs of a processor.
+
+    Sums times and bytes of the per-run records (those without ``page_id``),
+    takes the maximum peak RSS and finds the slowest page.
+
+    Returns:
+        dict with the measurements of :py:data:`PROFILE_FIELDS`, the number
+        of ``pages`` and ``runs`` and the ``slowest_page`` record (or ``None``)
+    """
+    runs = [r for r in records if r['page_id'] is None]
+    pages = [r for r in records if r['page_id'] is not None]
+    ret = {'pages': len(pages), 'runs': len(runs)}
+    for k in ['wall_time', 'cpu_time', 'bytes_read', 'bytes_written', 'image_decode_time', 'mets_save_time']:
+        ret[k] = sum(r[k] or 0 for r in runs)
+    ret['peak_rss'] = max([r['peak_rss'] or 0 for r in runs], default=0)
+    ret['slowest_page'] = max(pages, key=lambda r: r['wall_time'], default=None)
+    return ret
+
+def find_stale_pages(workspace, input_file_grp, output_file_grp, page_id=None, compare='exists'):
+    """
+    Find the pages whose output needs to be (re)generated.
+
+    A page is stale if it has files in the input file group(s) but lacks a
+    file in any of the output file group(s). With ``compare='mtime'``, a page
+    is also stale if one of its local output files is older than one of its
+    local input files.
+
+    Args:
+        input_file_grp (string): Comma-separated input file groups
+        output_file_grp (string): Comma-separated output file groups
+        page_id (string, None): Comma-separated page IDs to restrict the search to
+        compare ("exists"|"mtime"): How to decide whether existing output is up to date
+
+    Returns:
+        List of page IDs in the order of the physical structMap
+    """
+    if compare not in ['exists', 'mtime']:
+        raise ValueError("Unknown comparison for stale pages: %s" % compare)
+
+    def files_by_page(file_grp):
+        ret = {}
+        for grp in file_grp.split(',') if file_grp else []:
+            for f in workspace.mets.find_files(fileGrp=grp, pageId=page_id):
+                ret.setdefault(f.pageId, {}).setdefault(grp, []).append(f)
+        return ret
+
+    def mtimes(files):
+        ret = []
+        for f in files:
+            if f.local_filename:
+                path = Path(workspace.directory, f.local_filename)
+                ret.append(path.stat().st_mtime if path.exists() else None)
+        return ret
+
+    input_files = files_by_page(input_file_grp)
+    output_files = files_by_page(output_file_grp)
+    output_file_grps = output_file_grp.split(',') if output_file_grp else []
+    stale = []
+    for page in workspace.mets.physical_pages:
+        if page not in input_files:
+            continue
+        outputs = output_files.get(page, {})
+        if not all(grp in outputs for grp in output_file_grps):
+            stale.append(page)
+        elif compare == 'mtime':
+            input_mtimes = [t for t in mtimes(f for files in input_files[page].values() for f in files) if t]
+            output_mtimes = mtimes(f for files in outputs.values() for f in files)
+            if None in output_mtimes or (input_mtimes and output_mtimes and min(output_mtimes) < max(input_mtimes)):
+                stale.append(page)
+    return stale
+
+def remove_stale_output(workspace, output_file_grp, pages):
+    """
+    Remove the files of the output file group(s) for pages that are about to
+    be reprocessed, so the processor can write their output anew.
+
+    Args:
+        output_file_grp (string): Comma-separated output file groups
+        pages (list): Page IDs as returned by :py:func:`find_stale_pages`
+    """
+    if not pages:
+        return
+    for grp in output_file_grp.split(',') if output_file_grp else []:
+        for f in workspace.mets.find_files(fileGrp=grp, pageId=','.join(pages)):
+            log.info("Removing outdated output %s of page %s", f.ID, f.pageId)
+            workspace.remove_file(f.ID, force=True)
+
 def run_processor(
         processorClass,
         ocrd_tool=None,
@@ -29,12 +256,23 @@ def run_processor(
         output_file_grp=None,
         parameter=None,
         working_dir=None,
+        incremental=None,
+        profile=None,
 ): # pylint: disable=too-many-locals
     """
     Create a workspace for mets_url and run processor through it
 
     Args:
         parameter (string): URL to the parameter
+        profile ("jsonl"|"csv", None): Run the processor page by page and
+            append wall and CPU time, peak RSS, bytes read and written and
+            image decode time per page, plus a record for the whole run
+            (``page_id`` is ``None``) that includes the METS save time, to
+            the file :py:func:`profile_path` next to the METS.
+        incremental ("exists"|"mtime", None): Only process the pages found by
+            :py:func:`find_stale_pages` with this comparison, replacing any
+            outdated output of those pages. If there are none, the processor
+            is not run and ``None`` is returned.
     """
     workspace = _get_workspace(
         workspace,
@@ -42,6 +280,13 @@ def run_processor(
         mets_url,
         working_dir
     )
+    if incremental:
+        stale_pages = find_stale_pages(workspace, input_file_grp, output_file_grp, page_id=page_id, compare=incremental)
+        if not stale_pages:
+            log.info("No stale pages for %s [--input-file-grp='%s' --output-file-grp='%s'], skipping", processorClass, input_file_grp, output_file_grp)
+            return None
+        remove_stale_output(workspace, output_file_grp, stale_pages)
+        page_id = ','.join(stale_pages)
     log.debug("Running processor %s", processorClass)
     processor = processorClass(
         workspace,
@@ -56,8 +301,16 @@ def run_processor(
     otherrole = ocrd_tool['steps'][0]
     logProfile = getLogger('ocrd.process.profile')
     log.debug("Processor instance %s (%s doing %s)", processor, name, otherrole)
+    usage0, decode0 = _resource_usage(), workspace.image_decode_time
     t0 = time()
-    processor.process()
+    if profile:
+        workspace.profile_image_decoding = True
+        try:
+            records = _process_page_by_page(processor)
+        finally:
+            workspace.profile_image_decoding = False
+    else:
+        processor.process()
     t1 = time() - t0
     logProfile.info("Executing processor '%s' took %fs [--input-file-grp='%s' --output-file-grp='%s' --parameter='%s']" % (
         ocrd_tool['executable'],
@@ -73,7 +326,15 @@ def run_processor(
         role='OTHER',
         otherrole=otherrole
     )
+    t_save = time()
     workspace.save_mets()
+    if profile:
+        record = _profile_record(usage0, t0, decode0, workspace)
+        record.update(page_id=None, mets_save_time=time() - t_save)
+        records.append(record)
+        for record in records:
+            record.update(executable=ocrd_tool['executable'], input_file_grp=input_file_grp, output_file_grp=output_file_grp)
+        write_profile(profile_path(workspace, profile), records)
     return processor
 
 def run_cli(
@@ -87,6 +348,7 @@ def run_cli(
         output_file_grp=None,
         parameter=None,
         working_dir=None,
+        profile=None,
 ):
     """
     Create a workspace for mets_url and run MP CLI through it
@@ -104,6 +366,8 @@ def run_cli(
         args += ['--output-file-grp', output_file_grp]
     if parameter:
         args += ['--parameter', parameter]
+    if profile:
+        args += ['--profile', profile]
     log.debug("Running subprocess '%s'", ' '.join(args))
     return subprocess.call(args)
 
@@ -135,6 +399,11 @@ Options:
   -p, --parameter TEXT            Parameters, either JSON string or path 
                                   JSON file
   -g, --page-id TEXT              ID(s) of the pages to process
+  --incremental [exists|mtime]    Only process pages whose output is missing
+                                  (exists) or older than the input (mtime)
+  --profile [jsonl|csv]           Process page by page and write timing and
+                                  resource usage to a profile file next to
+                                  the METS
   -O, --output-file-grp TEXT      File group(s) used as output.
   -I, --input-file-grp TEXT       File group(s) used as input.
   -w, --working-dir TEXT          Working Directory
@@ -0,0 +1,180 @@
+"""
+Lazy, seekable file handles for remote files.
+"""
+import io
+import re
+from tempfile import TemporaryFile
+
+from ocrd_utils import getLogger
+from ocrd.constants import DOWNLOAD_CHUNK_SIZE, DOWNLOAD_RANGE_BLOCK_SIZE
+
+class RemoteFile(io.RawIOBase):
+    """
+    Read-only binary file handle for an HTTP(S) URL that only transfers the
+    bytes that are actually read.
+
+    Reads are served with HTTP range requests in blocks of ``block_size``
+    bytes, which are kept for the lifetime of the handle. Consecutive missing
+    blocks are fetched with a single request. If the server does not support
+    range requests, the whole file is downloaded to a temporary file on the
+    first read and served from there. The same is done without ``ranges``,
+    for files that will be read completely anyway.
+
+    Usually wrapped in a :py:class:`io.BufferedReader`, see
+    :py:meth:`ocrd.workspace.Workspace.open_file`.
+
+    Args:
+        resolver (:py:class:`ocrd.resolver.Resolver`): Resolver to send requests with
+        url (string): URL of the file
+        block_size (integer): Number of bytes to request at least
+        ranges (boolean): Whether to send range requests at all
+    """
+
+    def __init__(self, resolver, url, block_size=DOWNLOAD_RANGE_BLOCK_SIZE, ranges=True):
+        super().__init__()
+        self.resolver = resolver
+        self.url = url
+        self.block_size = block_size
+        self.ranges = ranges
+        # Number of bytes of response bodies received so far
+        self.bytes_transferred = 0
+        self._pos = 0
+        self._size = None
+        self._blocks = {}
+        self._full = None
+
+    def __repr__(self):
+        return '<RemoteFile %s>' % self.url
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError("Invalid whence: %s" % whence)
+        if pos < 0:
+            raise ValueError("Negative seek position %d" % pos)
+        self._pos = pos
+        return pos
+
+    @property
+    def size(self):
+        """
+        Size of the file in bytes. Requests the first block if not known yet.
+        """
+        if self._size is None:
+            self._fetch(0, 0)
+        return self._size
+
+    @property
+    def range_support(self):
+        """
+        Whether the server answers range requests. Requests the first block if not known yet.
+        """
+        if self._size is None:
+            self._fetch(0, 0)
+        return self._full is None
+
+    def _fetch(self, first_block, last_block):
+        """
+        Fetch blocks ``first_block`` to ``last_block`` (inclusive) into the block cache.
+        """
+        log = getLogger('ocrd.remote_file')
+        if not self.ranges:
+            self._get()
+            return
+        start = first_block * self.block_size
+        end = (last_block + 1) * self.block_size - 1
+        log.debug("GET %s bytes=%d-%d", self.url, start, end)
+        with self.resolver.http_get(self.url, stream=True, headers={'Range': 'bytes=%d-%d' % (start, end)}) as response:
+            content_range = re.match(r'bytes (\d+)-\d+/(\d+)', response.headers.get('Content-Range', ''))
+            usable = response.status_code == 206 and content_range and int(content_range.group(1)) == start
+            if usable:
+                data = response.content
+                self.bytes_transferred += len(data)
+                self._size = int(content_range.group(2))
+                for i, block in enumerate(range(first_block, last_block + 1)):
+                    self._blocks[block] = data[i * self.block_size:(i + 1) * self.block_size]
+            elif response.status_code == 416:
+                # start is beyond the end of the file
+                content_range = re.match(r'bytes \*/(\d+)', response.headers.get('Content-Range', ''))
+                self._size = int(content_range.group(1)) if content_range else start
+                usable = True
+            elif response.status_code == 200:
+                self._download(response)
+                usable = True
+            elif response.status_code != 206:
+                raise Exception("HTTP request failed: %s (HTTP %d)" % (self.url, response.status_code))
+        if not usable:
+            # partial content with unknown total size or unexpected offset
+            self._get()
+
+    def _get(self):
+        """
+        Download the whole file with a plain GET request.
+        """
+        getLogger('ocrd.remote_file').debug("GET %s", self.url)
+        with self.resolver.http_get(self.url, stream=True) as response:
+            if response.status_code != 200:
+                raise Exception("HTTP request failed: %s (HTTP %d)" % (self.url, response.status_code))
+            self._download(response)
+
+    def _download(self, response):
+        """
+        Store the complete body of ``response`` in a temporary file.
+        """
+        if self.ranges:
+            getLogger('ocrd.remote_file').debug("No usable range support for %s, downloading it completely", self.url)
+        self._full = TemporaryFile()
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            self._full.write(chunk)
+            self.bytes_transferred += len(chunk)
+        self._size = self._full.tell()
+        self._blocks = {}
+
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        if not len(b):
+            return 0
+        if self._size is None:
+            self._fetch(self._pos // self.block_size, (self._pos + len(b) - 1) // self.block_size)
+        if self._full is not None:
+            self._full.seek(self._pos)
+            n = self._full.readinto(b)
+            self._pos += n
+            return n
+        end = min(self._pos + len(b), self._size)
+        if self._pos >= end:
+            return 0
+        first_block, last_block = self._pos // self.block_size, (end - 1) // self.block_size
+        missing = [block for block in range(first_block, last_block + 1) if block not in self._blocks]
+        if missing:
+            self._fetch(missing[0], missing[-1])
+            if self._full is not None:
+                return self.readinto(b)
+        data = b''.join(self._blocks[block] for block in range(first_block, last_block + 1))
+        offset = self._pos - first_block * self.block_size
+        n = end - self._pos
+        b[:n] = data[offset:offset + n]
+        self._pos = end
+        return n
+
+    def close(self):
+        if self._full is not None:
+            self._full.close()
+            self._full = None
+        self._blocks = {}
+        super().close()
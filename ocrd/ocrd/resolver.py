@@ -1,9 +1,29 @@
+import os
+import json
+import errno
+import shutil
+import hashlib
 import tempfile
 from pathlib import Path
+from time import sleep
+from threading import Lock, BoundedSemaphore
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
-
-from ocrd.constants import TMP_PREFIX
+from requests.adapters import HTTPAdapter
+from atomicwrites import atomic_write
+
+from ocrd.constants import (
+    TMP_PREFIX,
+    DOWNLOAD_JOBS,
+    DOWNLOAD_MAX_PER_HOST,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_BACKOFF,
+    DOWNLOAD_TIMEOUT,
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_VALIDATORS_DIR,
+)
 from ocrd_utils import (
     getLogger,
     is_local_filename,
@@ -16,12 +36,276 @@ from ocrd_models import OcrdMets
 
 log = getLogger('ocrd.resolver')
 
+# HTTP status codes worth retrying
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# How to stage local files into a workspace, in the order to try them
+STAGING_STRATEGIES = {
+    'copy': ['copy'],
+    'hardlink': ['hardlink', 'copy'],
+    'reflink': ['reflink', 'copy'],
+    'symlink': ['symlink'],
+    'auto': ['hardlink', 'reflink', 'copy'],
+}
+
+# ioctl to clone a file on copy-on-write filesystems (btrfs, XFS), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+def _reflink(src_path, dst_path):
+    """
+    Clone ``src_path`` to ``dst_path`` sharing data blocks, falling back to
+    in-kernel ``copy_file_range``. Raise ``OSError`` if neither is supported.
+    """
+    with open(str(src_path), 'rb') as fsrc, open(str(dst_path), 'wb') as fdst:
+        try:
+            import fcntl # pylint: disable=import-outside-toplevel
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return
+        except (ImportError, OSError):
+            pass
+        if not hasattr(os, 'copy_file_range'):
+            raise OSError(errno.ENOTSUP, "Neither FICLONE nor copy_file_range supported")
+        remaining = os.fstat(fsrc.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining) # pylint: disable=no-member
+            if copied == 0:
+                break
+            remaining -= copied
+
 class Resolver():
     """
     Handle Uploads, Downloads, Repository access and manage temporary directories
+
+    HTTP requests share one pooled :py:class:`requests.Session`.
+
+    Args:
+        jobs (integer): Number of threads for concurrent downloads
+        max_per_host (integer): Maximum number of concurrent requests to the same host
+        retries (integer): How often to retry a request after a connection error or a 429/5xx response,
+            by default ``$OCRD_DOWNLOAD_RETRIES`` or 3
+        backoff (float): Seconds to wait before the first retry, doubled for every further retry
+        timeout (float|tuple): Default connect and read timeout of requests in seconds
+        staging (string): Default strategy to stage local files, see :py:meth:`download_to_directory`
+        download_cache (:py:class:`ocrd.download_cache.DownloadCache`): Cache to serve remote files from
     """
 
-    def download_to_directory(self, directory, url, basename=None, if_exists='skip', subdir=None):
+    def __init__(self, jobs=DOWNLOAD_JOBS, max_per_host=DOWNLOAD_MAX_PER_HOST, retries=DOWNLOAD_RETRIES, backoff=DOWNLOAD_BACKOFF, timeout=DOWNLOAD_TIMEOUT, staging='copy', download_cache=None):
+        self.download_cache = download_cache
+        if staging not in STAGING_STRATEGIES:
+            raise ValueError("Unknown staging strategy '%s', must be one of %s" % (staging, list(STAGING_STRATEGIES)))
+        self.staging = staging
+        self.jobs = jobs
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._session = None
+        self._host_semaphores = {}
+        self._lock = Lock()
+
+    @property
+    def session(self):
+        """
+        The :py:class:`requests.Session` used for all HTTP requests, created on first access.
+        """
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=max(self.jobs, self.max_per_host))
+                self._session.mount('http://', adapter)
+                self._session.mount('https://', adapter)
+            return self._session
+
+    def _host_semaphore(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = BoundedSemaphore(self.max_per_host)
+            return self._host_semaphores[host]
+
+    @staticmethod
+    def _release_on_close(response, semaphore):
+        """
+        Release ``semaphore`` once ``response`` is closed, i.e. after its body
+        has been streamed.
+        """
+        close = response.close
+        released = []
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released:
+                    released.append(True)
+                    semaphore.release()
+        response.close = close_and_release
+        return response
+
+    def http_get(self, url, **kwargs):
+        """
+        GET ``url`` with the shared session, respecting the per-host limit and
+        retrying with exponential backoff.
+
+        With ``stream=True``, the slot of the host is held until the response
+        is closed, so use the response as a context manager.
+
+        Args:
+            **kwargs: Passed on to :py:meth:`requests.Session.get`, with
+                ``timeout`` defaulting to :py:attr:`timeout`
+
+        Returns:
+            :py:class:`requests.Response` of the last attempt
+        """
+        log = getLogger('ocrd.resolver.http_get') # pylint: disable=redefined-outer-name
+        kwargs.setdefault('timeout', self.timeout)
+        semaphore = self._host_semaphore(url)
+        semaphore.acquire()
+        try:
+            for attempt in range(self.retries + 1):
+                delay = self.backoff * 2 ** attempt
+                try:
+                    response = self.session.get(url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == self.retries:
+                        raise
+                    log.warning("Request to %s failed (%s), retrying in %.1fs", url, e, delay)
+                else:
+                    if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                        if not kwargs.get('stream'):
+                            semaphore.release()
+                            return response
+                        return self._release_on_close(response, semaphore)
+                    response.close()
+                    log.warning("Request to %s failed (HTTP %d), retrying in %.1fs", url, response.status_code, delay)
+                sleep(delay)
+        except BaseException:
+            semaphore.release()
+            raise
+
+    def map_concurrently(self, fn, items, progress=None):
+        """
+        Call ``fn`` for each of ``items`` in a pool of :py:attr:`jobs` threads.
+
+        Args:
+            progress (callable): Called as ``progress(done, total, item)`` in
+                the calling thread whenever a call finished
+
+        Returns:
+            List of the return values of ``fn``, in the order of ``items``.
+            If any calls raised an exception, the one of the first such item
+            is re-raised after all calls finished.
+        """
+        items = list(items)
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = {executor.submit(fn, item): n for n, item in enumerate(items)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                if progress:
+                    progress(done, len(items), items[futures[future]])
+        return [future.result() for future in sorted(futures, key=futures.get)]
+
+    @staticmethod
+    def _write_response(response, dst_path, checksum=None):
+        """
+        Stream the body of ``response`` to ``dst_path`` via a temporary file in
+        the same directory that is renamed once it is complete.
+
+        Returns:
+            SHA-256 hex digest of the body
+        """
+        hasher = None
+        if checksum:
+            algorithm, expected_digest = checksum.split(':', 1)
+            hasher = hashlib.new(algorithm)
+        sha256 = hashlib.sha256()
+        length = 0
+        fd, tmp_path = tempfile.mkstemp(dir=str(dst_path.parent), prefix='.%s.' % dst_path.name, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    length += len(chunk)
+                    sha256.update(chunk)
+                    if hasher:
+                        hasher.update(chunk)
+            # Content-Length is the size of the encoded body
+            expected_length = response.headers.get('Content-Length')
+            if expected_length is not None and response.headers.get('Content-Encoding', 'identity') == 'identity' and int(expected_length) != length:
+                raise Exception("Incomplete download: %s (%d of %s bytes)" % (response.url, length, expected_length))
+            if hasher and hasher.hexdigest() != expected_digest.lower():
+                raise Exception("Checksum mismatch: %s (%s %s != %s)" % (response.url, algorithm, hasher.hexdigest(), expected_digest))
+            os.replace(tmp_path, str(dst_path))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return sha256.hexdigest()
+
+    @staticmethod
+    def _validators_path(directory, ret):
+        return Path(directory, DOWNLOAD_VALIDATORS_DIR, '%s.json' % hashlib.sha1(ret.encode('utf-8')).hexdigest())
+
+    def _read_validators(self, directory, ret, url):
+        """
+        ETag and Last-Modified recorded for the file ``ret`` in ``directory`` when downloaded from ``url``
+        """
+        try:
+            with open(str(self._validators_path(directory, ret)), 'r', encoding='utf-8') as f:
+                validators = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return validators if validators.get('url') == url else {}
+
+    def _write_validators(self, directory, ret, url, response):
+        path = self._validators_path(directory, ret)
+        if 'ETag' not in response.headers and 'Last-Modified' not in response.headers:
+            if path.exists():
+                path.unlink()
+            return
+        path.parent.mkdir(exist_ok=True)
+        with atomic_write(str(path), overwrite=True) as f:
+            json.dump({
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }, f)
+
+    @staticmethod
+    def _stage_local_file(src_path, dst_path, staging):
+        """
+        Put local file ``src_path`` at ``dst_path`` with the first strategy
+        for ``staging`` in :py:data:`STAGING_STRATEGIES` that works.
+        """
+        log = getLogger('ocrd.resolver.download_to_directory') # pylint: disable=redefined-outer-name
+        if staging not in STAGING_STRATEGIES:
+            raise ValueError("Unknown staging strategy '%s', must be one of %s" % (staging, list(STAGING_STRATEGIES)))
+        strategies = STAGING_STRATEGIES[staging]
+        fd, tmp_path = tempfile.mkstemp(dir=str(dst_path.parent), prefix='.%s.' % dst_path.name, suffix='.part')
+        os.close(fd)
+        try:
+            for strategy in strategies:
+                try:
+                    if strategy == 'hardlink':
+                        os.unlink(tmp_path)
+                        os.link(str(src_path), tmp_path)
+                    elif strategy == 'symlink':
+                        os.unlink(tmp_path)
+                        os.symlink(str(src_path), tmp_path)
+                    elif strategy == 'reflink':
+                        _reflink(src_path, tmp_path)
+                    else:
+                        shutil.copyfile(str(src_path), tmp_path)
+                    break
+                except OSError as e:
+                    if strategy == strategies[-1]:
+                        raise
+                    log.debug("Staging '%s' by %s failed, trying next strategy: %s", src_path, strategy, e)
+            log.debug("Staged '%s' to '%s' by %s", src_path, dst_path, strategy)
+            os.replace(tmp_path, str(dst_path))
+        except BaseException:
+            if os.path.lexists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def download_to_directory(self, directory, url, basename=None, if_exists='skip', subdir=None, checksum=None, staging=None):
         """
         Download a file to a directory.
 
@@ -34,8 +318,14 @@ class Resolver():
             directory (string): Directory to download files to
             basename (string, None): basename part of the filename on disk.
             url (string): URL to download from
-            if_exists (string, "skip"): What to do if target file already exists. One of ``skip`` (default), ``overwrite`` or ``raise``
+            if_exists (string, "skip"): What to do if target file already exists. One of ``skip`` (default), ``overwrite``, ``raise``
+                or ``revalidate``, which only replaces the file if it changed: Remote files are requested with a
+                conditional GET using the ETag/Last-Modified of the last download, local files are compared by size and mtime.
             subdir (string, None): Subdirectory to create within the directory. Think fileGrp.
+            checksum (string, None): Expected checksum of a remote file as ``algorithm:hexdigest``, e.g. ``sha512:cf83e...``
+            staging (string, None): How to stage a local file: ``copy`` (streamed),
+                ``hardlink`` or ``reflink`` (falling back to ``copy``), ``symlink``,
+                or ``auto`` (hardlink, then reflink, then copy). Default: :py:attr:`staging`
 
         Returns:
             Local filename, __relative__ to directory
@@ -80,29 +370,50 @@ class Resolver():
                 return ret
 
         # Respect 'if_exists' arg
+        revalidate = False
         if dst_path.exists():
             if if_exists == 'skip':
                 return ret
             if if_exists == 'raise':
                 raise FileExistsError("File already exists and if_exists == 'raise': %s" % (dst_path))
+            revalidate = if_exists == 'revalidate'
+
+        if revalidate and src_path:
+            src_stat, dst_stat = src_path.stat(), dst_path.stat()
+            if src_stat.st_size == dst_stat.st_size and src_stat.st_mtime <= dst_stat.st_mtime:
+                log.debug("Keeping '%s', not older than '%s'", dst_path, src_path)
+                return ret
 
         # Create dst_path parent dir
         dst_path.parent.mkdir(parents=True, exist_ok=True)
 
         # Copy files or download remote assets
         if src_path:
-            log.debug("Copying file '%s' to '%s'", src_path, dst_path)
-            dst_path.write_bytes(src_path.read_bytes())
+            self._stage_local_file(src_path, dst_path, staging or self.staging)
         else:
             log.debug("Downloading URL '%s' to '%s'", url, dst_path)
-            response = requests.get(url)
-            if response.status_code != 200:
-                raise Exception("HTTP request failed: %s (HTTP %d)" % (url, response.status_code))
-            dst_path.write_bytes(response.content)
+            if self.download_cache:
+                self.download_cache.fetch(self, url, dst_path, checksum=checksum)
+            else:
+                headers = {}
+                if revalidate:
+                    validators = self._read_validators(directory, ret, url)
+                    if validators.get('etag'):
+                        headers['If-None-Match'] = validators['etag']
+                    if validators.get('last_modified'):
+                        headers['If-Modified-Since'] = validators['last_modified']
+                with self.http_get(url, stream=True, headers=headers) as response:
+                    if headers and response.status_code == 304:
+                        log.debug("Keeping '%s', not modified at <%s>", dst_path, url)
+                        return ret
+                    if response.status_code != 200:
+                        raise Exception("HTTP request failed: %s (HTTP %d)" % (url, response.status_code))
+                    self._write_response(response, dst_path, checksum=checksum)
+                    self._write_validators(directory, ret, url, response)
 
         return ret
 
-    def workspace_from_url(self, mets_url, dst_dir=None, clobber_mets=False, mets_basename=None, download=False, src_baseurl=None):
+    def workspace_from_url(self, mets_url, dst_dir=None, clobber_mets=False, mets_basename=None, download=False, src_baseurl=None, progress=None, staging=None, if_exists='skip'):
         """
         Create a workspace from a METS by URL (i.e. clone it).
 
@@ -114,6 +425,9 @@ class Resolver():
             clobber_mets (boolean, False): Whether to overwrite existing mets.xml. By default existing mets.xml will raise an exception.
             download (boolean, False): Whether to download all the files
             src_baseurl (string, None): Base URL for resolving relative file locations
+            progress (callable, None): Progress callback for downloading, see :py:meth:`map_concurrently`
+            staging (string, None): How to stage local files, see :py:meth:`download_to_directory`. The METS is always copied.
+            if_exists (string, "skip"): What to do with files that were already downloaded, see :py:meth:`download_to_directory`
 
         Returns:
             Workspace
@@ -151,13 +465,12 @@ class Resolver():
         log.debug("workspace_from_url\nmets_basename='%s'\nmets_url='%s'\nsrc_baseurl='%s'\ndst_dir='%s'",
             mets_basename, mets_url, src_baseurl, dst_dir)
 
-        self.download_to_directory(dst_dir, mets_url, basename=mets_basename, if_exists='overwrite' if clobber_mets else 'skip')
+        self.download_to_directory(dst_dir, mets_url, basename=mets_basename, if_exists='overwrite' if clobber_mets else 'skip', staging='copy')
 
         workspace = Workspace(self, dst_dir, mets_basename=mets_basename, baseurl=src_baseurl)
 
         if download:
-            for f in workspace.mets.find_files():
-                workspace.download_file(f)
+            workspace.download_files(workspace.mets.find_files(), progress=progress, staging=staging, if_exists=if_exists)
 
         return workspace
 
@@ -1,15 +1,127 @@
 import json
+from os import stat, fsync
+from os.path import realpath, basename
+from pathlib import Path
+from hashlib import sha1
 from shlex import split as shlex_split
 from distutils.spawn import find_executable as which # pylint: disable=import-error,no-name-in-module
 from subprocess import run, PIPE
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 
-from ocrd_utils import getLogger, parse_json_string_or_file
-from ocrd.processor.base import run_cli
+from atomicwrites import atomic_write
+from pkg_resources import working_set
+
+from ocrd_utils import getLogger, parse_json_string_or_file, VERSION as OCRD_VERSION
+from ocrd.constants import OCRD_TOOL_JSON_CACHE_DIR, CHECKPOINT_FILENAME
+from ocrd.processor.base import run_cli, profile_path, read_profile, aggregate_profile
 from ocrd.resolver import Resolver
 from ocrd_validators import ParameterValidator, WorkspaceValidator, ValidationReport
 
+class OcrdToolJsonCache():
+    """
+    Persistent on-disk cache of the ``ocrd-tool.json`` that processor
+    executables print with ``--dump-json``.
+
+    Entries are keyed by the resolved path, modification time and size of the
+    executable and the version of ocrd/core, so reinstalling or upgrading a
+    processor invalidates its entry. For processors installed as Python
+    console scripts, the version of their distribution and the modification
+    time of its ``ocrd-tool.json`` are part of the key, too, so editing the
+    ``ocrd-tool.json`` of a development install takes effect immediately.
+    Anything else is covered by :py:meth:`clear` (``ocrd process
+    --clear-tool-json-cache``).
+    """
+
+    def __init__(self, cache_dir=OCRD_TOOL_JSON_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def _distribution_key(executable_path):
+        """
+        Name and version of the Python distribution providing the console
+        script ``executable_path`` and the modification time of the nearest
+        ``ocrd-tool.json`` above its entry point module, if any.
+        """
+        script = basename(executable_path)
+        for dist in working_set:
+            entry_point = dist.get_entry_map('console_scripts').get(script)
+            if not entry_point:
+                continue
+            module_path = entry_point.module_name.split('.')
+            ocrd_tool_mtime = None
+            for depth in range(len(module_path) - 1, 0, -1):
+                ocrd_tool_path = Path(dist.location, *module_path[:depth], 'ocrd-tool.json')
+                if ocrd_tool_path.exists():
+                    ocrd_tool_mtime = ocrd_tool_path.stat().st_mtime_ns
+                    break
+            return [dist.project_name, dist.version, ocrd_tool_mtime]
+        return None
+
+    def _cache_file(self, executable_path):
+        executable_stat = stat(executable_path)
+        key = json.dumps([executable_path, executable_stat.st_mtime_ns, executable_stat.st_size, OCRD_VERSION,
+                          self._distribution_key(executable_path)])
+        return Path(self.cache_dir, '%s.json' % sha1(key.encode('utf-8')).hexdigest())
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        for cache_file in Path(self.cache_dir).glob('*.json'):
+            cache_file.unlink()
+
+    def get(self, executable):
+        """
+        Get the ``ocrd-tool.json`` of ``executable``, running ``--dump-json`` only on a cache miss.
+        """
+        log = getLogger('ocrd.task_sequence.OcrdToolJsonCache')
+        executable_path = which(executable)
+        if not executable_path:
+            raise Exception("Executable not found in PATH: %s" % executable)
+        cache_file = self._cache_file(realpath(executable_path))
+        if cache_file.exists():
+            try:
+                return json.loads(cache_file.read_text(encoding='utf-8'))
+            except ValueError as e:
+                log.warning("Ignoring corrupt cache entry '%s' for %s: %s", cache_file, executable, e)
+        log.debug("Cache miss for %s, running --dump-json", executable)
+        result = run([executable, '--dump-json'], stdout=PIPE, check=True, universal_newlines=True)
+        ocrd_tool_json = json.loads(result.stdout)
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_write(str(cache_file), overwrite=True) as f:
+            f.write(result.stdout)
+        return ocrd_tool_json
+
+    def fill(self, tasks, jobs=None):
+        """
+        Resolve the ``ocrd-tool.json`` of all ``tasks`` concurrently.
+
+        Arguments:
+            tasks (list of ProcessorTask): Tasks to resolve
+            jobs (integer, None): Number of threads. Default: Number of distinct executables
+        """
+        executables = list(set(task.executable for task in tasks if task._ocrd_tool_json is None)) # pylint: disable=protected-access
+        if not executables:
+            return
+        with ThreadPoolExecutor(max_workers=jobs or len(executables)) as executor:
+            ocrd_tool_jsons = dict(zip(executables, executor.map(self.get, executables)))
+        for task in tasks:
+            if task._ocrd_tool_json is None: # pylint: disable=protected-access
+                task._ocrd_tool_json = ocrd_tool_jsons[task.executable] # pylint: disable=protected-access
+
 class ProcessorTask():
+    """
+    A single step in a workflow, i.e. a processor executable with file groups and parameters.
+    """
+
+    # Shared by all tasks, set to None to always call --dump-json
+    ocrd_tool_json_cache = OcrdToolJsonCache()
+
+    # Compiled ParameterValidator per executable and ocrd-tool.json
+    _parameter_validators = {}
+    _parameter_validators_lock = Lock()
 
     @classmethod
     def parse(cls, argstr):
@@ -45,10 +157,25 @@ class ProcessorTask():
     def ocrd_tool_json(self):
         if self._ocrd_tool_json:
             return self._ocrd_tool_json
-        result = run([self.executable, '--dump-json'], stdout=PIPE, check=True, universal_newlines=True)
-        self._ocrd_tool_json = json.loads(result.stdout)
+        if self.ocrd_tool_json_cache:
+            self._ocrd_tool_json = self.ocrd_tool_json_cache.get(self.executable)
+        else:
+            result = run([self.executable, '--dump-json'], stdout=PIPE, check=True, universal_newlines=True)
+            self._ocrd_tool_json = json.loads(result.stdout)
         return self._ocrd_tool_json
 
+    @property
+    def parameter_validator(self):
+        """
+        ParameterValidator for the ``ocrd-tool.json`` of this task's executable,
+        shared among all tasks with the same executable.
+        """
+        key = (self.executable, json.dumps(self.ocrd_tool_json, sort_keys=True))
+        with self._parameter_validators_lock:
+            if key not in self._parameter_validators:
+                self._parameter_validators[key] = ParameterValidator(self.ocrd_tool_json)
+            return self._parameter_validators[key]
+
     def validate(self):
         if not which(self.executable):
             raise Exception("Executable not found in PATH: %s" % self.executable)
@@ -57,8 +184,7 @@ class ProcessorTask():
         parameters = {}
         if self.parameter_path:
             parameters = parse_json_string_or_file(self.parameter_path)
-        param_validator = ParameterValidator(self.ocrd_tool_json)
-        report = param_validator.validate(parameters)
+        report = self.parameter_validator.validate(parameters)
         if not report.is_valid:
             raise Exception(report.errors)
         if 'output_file_grp' in self.ocrd_tool_json and not self.output_file_grps:
@@ -74,17 +200,89 @@ class ProcessorTask():
             ret += ' -p %s' % self.parameter_path
         return ret
 
-def validate_tasks(tasks, workspace):
+def fill_ocrd_tool_json(tasks):
+    """
+    Resolve the ``ocrd-tool.json`` of all ``tasks`` up front and in parallel.
+    """
+    if ProcessorTask.ocrd_tool_json_cache:
+        # only executables in PATH, let validate() report the others
+        ProcessorTask.ocrd_tool_json_cache.fill([task for task in tasks if which(task.executable)])
+
+def validate_each_task(tasks, jobs=None):
+    """
+    Validate executable, ``ocrd-tool.json`` and parameters of each of the ``tasks`` concurrently.
+
+    Raises the exception of the first invalid task (in workflow order).
+
+    Arguments:
+        tasks (list of ProcessorTask): Tasks to validate
+        jobs (integer, None): Number of threads. Default: see ``concurrent.futures.ThreadPoolExecutor``
+
+    Returns:
+        List of :class:`ValidationReport`, one per task
+    """
+    fill_ocrd_tool_json(tasks)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(ProcessorTask.validate, tasks))
+
+class CheckpointLedger():
+    """
+    Ledger of the (task, page) pairs of a workflow that have finished,
+    stored in the workspace so an interrupted ``ocrd process`` can resume.
+
+    Tasks are identified by their string representation, i.e. executable,
+    file groups and parameter path.
+    """
+
+    def __init__(self, workspace, filename=CHECKPOINT_FILENAME):
+        self.path = Path(workspace.directory, filename)
+        self.finished = set()
+        if self.path.exists():
+            with open(str(self.path), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # incomplete last line after a crash
+                        continue
+                    self.finished.add((entry['task'], entry['page_id']))
+
+    def unfinished_pages(self, task, page_ids):
+        """
+        Return those of ``page_ids`` that ``task`` has not finished yet, in order.
+        """
+        return [page_id for page_id in page_ids if (str(task), page_id) not in self.finished]
+
+    def add(self, task, page_ids):
+        """
+        Record that ``task`` has finished all of ``page_ids``.
+        """
+        with open(str(self.path), 'a', encoding='utf-8') as f:
+            for page_id in page_ids:
+                f.write(json.dumps({'task': str(task), 'page_id': page_id}) + '\n')
+                self.finished.add((str(task), page_id))
+            f.flush()
+            fsync(f.fileno())
+
+    def remove(self):
+        """
+        Delete the ledger.
+        """
+        if self.path.exists():
+            self.path.unlink()
+        self.finished = set()
+
+def validate_tasks(tasks, workspace, page_id=None):
     report = ValidationReport()
     prev_output_file_grps = workspace.mets.file_groups
 
     # first task: check input/output file groups from METS
     # TODO disable output_file_grps checks once CLI parameter 'overwrite' is implemented
-    WorkspaceValidator.check_file_grp(workspace, tasks[0].input_file_grps, tasks[0].output_file_grps, report)
+    WorkspaceValidator.check_file_grp(workspace, tasks[0].input_file_grps, tasks[0].output_file_grps, report, page_id=page_id)
 
     prev_output_file_grps += tasks[0].output_file_grps
+    validate_each_task(tasks[1:])
     for task in tasks[1:]:
-        task.validate()
         # check either existing fileGrp or output-file group of previous task matches current input_file_group
         for input_file_grp in task.input_file_grps:
             if not input_file_grp in prev_output_file_grps:
@@ -100,38 +298,83 @@ def validate_tasks(tasks, workspace):
     return report
 
 
-def run_tasks(mets, log_level, page_id, task_strs):
+def run_tasks(mets, log_level, page_id, task_strs, checkpoint_pages=0, profile=None):
+    """
+    Run a sequence of tasks on a workspace.
+
+    If ``profile`` is set, processors write per-page profiles in that format
+    next to the METS, which are aggregated and logged per task. The
+    aggregates are returned as a list of ``(task, aggregate)`` tuples.
+
+    If ``checkpoint_pages`` is set, run each task on batches of that many pages
+    and record finished batches in a :class:`CheckpointLedger` in the
+    workspace. Running the same tasks again then skips all pages that have
+    already been finished. The ledger is removed when all tasks have finished.
+    """
     resolver = Resolver()
     workspace = resolver.workspace_from_url(mets)
     log = getLogger('ocrd.task_sequence.run_tasks')
     tasks = [ProcessorTask.parse(task_str) for task_str in task_strs]
 
-    validate_tasks(tasks, workspace)
+    ledger = None
+    if checkpoint_pages:
+        ledger = CheckpointLedger(workspace)
+        page_ids = page_id.split(',') if page_id else workspace.mets.physical_pages
+        validate_tasks(tasks, workspace, page_id=ledger.unfinished_pages(tasks[0], page_ids))
+    else:
+        validate_tasks(tasks, workspace, page_id=page_id)
+
+    profiles = []
 
     # Run the tasks
     for task in tasks:
 
+        if profile:
+            no_records_before = len(read_profile(profile_path(workspace, profile)))
+
+        if ledger:
+            task_page_ids = ledger.unfinished_pages(task, page_ids)
+            if len(task_page_ids) < len(page_ids):
+                log.info("Resuming task '%s' with %d of %d pages already finished", task, len(page_ids) - len(task_page_ids), len(page_ids))
+            batches = [task_page_ids[i:i + checkpoint_pages] for i in range(0, len(task_page_ids), checkpoint_pages)]
+        else:
+            batches = [page_id.split(',') if page_id else None]
+
         log.info("Start processing task '%s'", task)
 
-        # execute cli
-        returncode = run_cli(
-            task.executable,
-            mets,
-            resolver,
-            workspace,
-            log_level=log_level,
-            page_id=page_id,
-            input_file_grp=','.join(task.input_file_grps),
-            output_file_grp=','.join(task.output_file_grps),
-            parameter=task.parameter_path
-        )
-
-        # check return code
-        if returncode != 0:
-            raise Exception("%s exited with non-zero return value %s" % (task.executable, returncode))
+        for batch in batches:
+            # execute cli
+            returncode = run_cli(
+                task.executable,
+                mets,
+                resolver,
+                workspace,
+                log_level=log_level,
+                page_id=','.join(batch) if batch else None,
+                input_file_grp=','.join(task.input_file_grps),
+                output_file_grp=','.join(task.output_file_grps),
+                parameter=task.parameter_path,
+                profile=profile
+            )
+
+            # check return code
+            if returncode != 0:
+                raise Exception("%s exited with non-zero return value %s" % (task.executable, returncode))
+
+            if ledger:
+                ledger.add(task, batch)
 
         log.info("Finished processing task '%s'", task)
 
+        if profile:
+            aggregate = aggregate_profile(read_profile(profile_path(workspace, profile))[no_records_before:])
+            profiles.append((task, aggregate))
+            getLogger('ocrd.process.profile').info(
+                "Task '%s': %d pages, wall %.3fs, CPU %.3fs, peak RSS %d MiB, read %d bytes, written %d bytes, image decode %.3fs, METS save %.3fs%s",
+                task, aggregate['pages'], aggregate['wall_time'], aggregate['cpu_time'], aggregate['peak_rss'] // 2**20,
+                aggregate['bytes_read'], aggregate['bytes_written'], aggregate['image_decode_time'], aggregate['mets_save_time'],
+                ", slowest page %s (%.3fs)" % (aggregate['slowest_page']['page_id'], aggregate['slowest_page']['wall_time']) if aggregate['slowest_page'] else '')
+
         # reload mets
         workspace.reload_mets()
 
@@ -140,3 +383,7 @@ def run_tasks(mets, log_level, page_id, task_strs):
             if not output_file_grp in workspace.mets.file_groups:
                 raise Exception("Invalid state: expected output file group not in mets: %s" % output_file_grp)
 
+    if ledger:
+        ledger.remove()
+
+    return profiles
@@ -1,6 +1,8 @@
 import io
+import asyncio
 from os import makedirs, unlink, listdir
 from pathlib import Path
+from time import time
 
 import cv2
 from PIL import Image
@@ -25,10 +27,14 @@ from ocrd_utils import (
     polygon_from_points,
     xywh_from_bbox,
     pushd_popd,
+    is_local_filename,
+    get_local_filename,
     MIME_TO_EXT,
     MIME_TO_PIL,
 )
 
+from .constants import DOWNLOAD_RANGE_BLOCK_SIZE
+from .remote_file import RemoteFile
 from .workspace_backup import WorkspaceBackupManager
 
 log = getLogger('ocrd.workspace')
@@ -57,6 +63,12 @@ class Workspace():
         self.mets = mets
         self.automatic_backup = automatic_backup
         self.baseurl = baseurl
+        # Cumulative time in seconds spent opening and decoding images
+        self.image_decode_time = 0.0
+        # Whether to decode images eagerly, so image_decode_time includes decoding
+        self.profile_image_decoding = False
+        # AsyncResolver for download_file_async, created on demand
+        self.async_resolver = None
         #  print(mets.to_xml(xmllint=True).decode('utf-8'))
 
     def __str__(self):
@@ -91,31 +103,124 @@ class Workspace():
         return f.local_filename
 
 
-    def download_file(self, f, _recursion_count=0):
+    def _download_url(self, url, file_grp, basename, staging=None, if_exists='skip', _recursion_count=0):
+        """
+        Download ``url`` unless it is a file within the workspace and return
+        the location to use for it, relative to the workspace if local.
+
+        Does not depend on the working directory and does not modify the METS,
+        so it can be called from several threads.
+        """
+        try:
+            # If the url is already a file path, and is within self.directory, do nothing
+            url_path = Path(self.directory, url).resolve()
+            if url_path.exists() and url_path.relative_to(str(Path(self.directory).resolve())):
+                return url
+        except Exception: # pylint: disable=broad-except
+            pass
+        src_url = url
+        if is_local_filename(url) and not Path(get_local_filename(url)).is_absolute():
+            src_url = str(Path(self.directory, get_local_filename(url)))
+        try:
+            return self.resolver.download_to_directory(self.directory, src_url, subdir=file_grp, basename=basename, staging=staging, if_exists=if_exists)
+        except FileNotFoundError as e:
+            if not self.baseurl:
+                raise Exception("No baseurl defined by workspace. Cannot retrieve '%s'" % url)
+            if _recursion_count >= 1:
+                raise Exception("Already tried prepending baseurl '%s'. Cannot retrieve '%s'" % (self.baseurl, url))
+            log.debug("First run of resolver.download_to_directory(%s) failed, try prepending baseurl '%s': %s", url, self.baseurl, e)
+            return self._download_url('%s/%s' % (self.baseurl, url), file_grp, basename, staging, if_exists, _recursion_count + 1)
+
+    @staticmethod
+    def _download_basename(f):
+        return '%s%s' % (f.ID, MIME_TO_EXT.get(f.mimetype, '')) if f.ID else f.basename
+
+    def download_file(self, f):
         """
         Download a :py:mod:`ocrd.model.ocrd_file.OcrdFile` to the workspace.
         """
-        log.debug('download_file %s [_recursion_count=%s]' % (f, _recursion_count))
-        with pushd_popd(self.directory):
-            try:
-                # If the f.url is already a file path, and is within self.directory, do nothing
-                url_path = Path(f.url).resolve()
-                if not (url_path.exists() and url_path.relative_to(str(Path(self.directory).resolve()))):
-                    raise Exception("Not already downloaded, moving on")
-            except Exception as e:
-                basename = '%s%s' % (f.ID, MIME_TO_EXT.get(f.mimetype, '')) if f.ID else f.basename
-                try:
-                    f.url = self.resolver.download_to_directory(self.directory, f.url, subdir=f.fileGrp, basename=basename)
-                except FileNotFoundError as e:
-                    if not self.baseurl:
-                        raise Exception("No baseurl defined by workspace. Cannot retrieve '%s'" % f.url)
-                    if _recursion_count >= 1:
-                        raise Exception("Already tried prepending baseurl '%s'. Cannot retrieve '%s'" % (self.baseurl, f.url))
-                    log.debug("First run of resolver.download_to_directory(%s) failed, try prepending baseurl '%s': %s", f.url, self.baseurl, e)
-                    f.url = '%s/%s' % (self.baseurl, f.url)
-                    f.url = self.download_file(f, _recursion_count + 1).local_filename
-            f.local_filename = f.url
-            return f
+        log.debug('download_file %s' % f)
+        f.url = self._download_url(f.url, f.fileGrp, self._download_basename(f))
+        f.local_filename = f.url
+        return f
+
+    def download_files(self, files, progress=None, staging=None, if_exists='skip'):
+        """
+        Download several :py:mod:`ocrd.model.ocrd_file.OcrdFile` to the
+        workspace concurrently, see :py:meth:`ocrd.resolver.Resolver.map_concurrently`.
+
+        Args:
+            progress (callable): Called as ``progress(done, total, url)`` after each download
+            staging (string): How to stage local files, see :py:meth:`ocrd.resolver.Resolver.download_to_directory`
+            if_exists (string): What to do with files already downloaded, see :py:meth:`ocrd.resolver.Resolver.download_to_directory`
+
+        Returns:
+            The list of files
+        """
+        files = list(files)
+        # read the METS in this thread only, lxml trees must not be shared between threads
+        jobs = [(f.url, f.fileGrp, self._download_basename(f), staging, if_exists) for f in files]
+        urls = self.resolver.map_concurrently(
+            lambda job: self._download_url(*job),
+            jobs,
+            progress=(lambda done, total, job: progress(done, total, job[0])) if progress else None)
+        for f, url in zip(files, urls):
+            f.url = url
+            f.local_filename = url
+        return files
+
+    def _get_async_resolver(self):
+        if self.async_resolver is None:
+            from .async_resolver import AsyncResolver # pylint: disable=import-outside-toplevel
+            self.async_resolver = AsyncResolver(self.resolver)
+        return self.async_resolver
+
+    async def download_file_async(self, f, staging=None, if_exists='skip'):
+        """
+        Like :py:meth:`download_file`, but without blocking the event loop,
+        see :py:class:`ocrd.async_resolver.AsyncResolver`.
+        """
+        url = await self._get_async_resolver().run(self._download_url, f.url, f.fileGrp, self._download_basename(f), staging, if_exists)
+        f.url = url
+        f.local_filename = url
+        return f
+
+    async def download_files_async(self, files, progress=None, staging=None, if_exists='skip'):
+        """
+        Like :py:meth:`download_files`, but without blocking the event loop.
+        """
+        files = list(files)
+        done = [0]
+        async def download(f):
+            url = f.url
+            await self.download_file_async(f, staging=staging, if_exists=if_exists)
+            done[0] += 1
+            if progress:
+                progress(done[0], len(files), url)
+        await asyncio.gather(*[download(f) for f in files])
+        return files
+
+    def open_file(self, f, whole=False):
+        """
+        Open a :py:mod:`ocrd.model.ocrd_file.OcrdFile` for reading in binary
+        mode without downloading it to the workspace.
+
+        Local files are opened directly. Remote files are read lazily, see
+        :py:class:`ocrd.remote_file.RemoteFile`, so reading only the header of
+        an image or XML document transfers only the first few blocks. With
+        ``whole``, the file is to be read completely, so it is fetched with a
+        single request instead of one range request per block.
+
+        Returns:
+            A seekable binary file object
+        """
+        url = f.local_filename if f.local_filename else f.url
+        if is_local_filename(url):
+            path = Path(self.directory, get_local_filename(url))
+            if path.exists() or not self.baseurl:
+                return open(str(path), 'rb')
+            url = '%s/%s' % (self.baseurl, url)
+        return io.BufferedReader(RemoteFile(self.resolver, url, ranges=not whole), buffer_size=DOWNLOAD_RANGE_BLOCK_SIZE)
 
     def remove_file(self, ID, force=False, keep_file=False):
         """
@@ -221,9 +326,11 @@ class Workspace():
         """
         files = self.mets.find_files(url=image_url)
         f = files[0] if files else OcrdFile(None, url=image_url)
-        image_filename = self.download_file(f).local_filename
-        with Image.open(image_filename) as pil_img:
+        t0 = time()
+        # only the image header is read, so remote images are not downloaded
+        with self.open_file(f) as image_file, Image.open(image_file) as pil_img:
             ocrd_exif = OcrdExif(pil_img)
+        self.image_decode_time += time() - t0
         return ocrd_exif
 
     @deprecated(version='1.0.0', reason="Use workspace.image_from_page and workspace.image_from_segment")
@@ -245,8 +352,12 @@ class Workspace():
         f = files[0] if files else OcrdFile(None, url=image_url)
         image_filename = self.download_file(f).local_filename
 
+        t0 = time()
         with pushd_popd(self.directory):
             pil_image = Image.open(image_filename)
+            if self.profile_image_decoding:
+                pil_image.load()
+        self.image_decode_time += time() - t0
 
         if coords is None:
             return pil_image
@@ -1,8 +1,17 @@
 from datetime import datetime
-from os import makedirs, chdir, walk
-from os.path import join, isdir, basename, exists, relpath
+from io import BytesIO
+from os import makedirs, chdir, unlink, sep
+from os.path import join, isdir, isabs, basename, dirname, exists, normpath
+from pathlib import Path
+from queue import Queue, Full
 from shutil import make_archive, rmtree, copyfile, move
 from tempfile import mkdtemp
+from threading import Event, Lock, local
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+import hashlib
 import re
 import tempfile
 import sys
@@ -14,7 +23,7 @@ from ocrd_utils import (
     pushd_popd,
     getLogger,
     is_local_filename,
-    unzip_file_to_dir,
+    get_local_filename,
 
     MIMETYPE_PAGE,
     VERSION,
@@ -23,12 +32,18 @@ from ocrd_validators.constants import BAGIT_TXT, TMP_BAGIT_PREFIX, OCRD_BAGIT_PR
 from ocrd_modelfactory import page_from_file
 from ocrd_models.ocrd_page import to_xml
 
+from .constants import DOWNLOAD_CHUNK_SIZE
 from .workspace import Workspace
 
 tempfile.tempdir = '/tmp' # TODO hard-coded
 log = getLogger('ocrd.workspace_bagger')
 
 BACKUPDIR = join('/tmp', TMP_BAGIT_PREFIX + 'backup')
+ZIP_COMPRESSIONS = ['auto', 'deflated', 'stored']
+# Deflating these again costs time and hardly saves space
+ZIP_STORED_MIMETYPES = ['image/jpeg', 'image/jp2', 'image/png', 'image/gif']
+# Number of chunks per file read ahead of the ZIP writer
+ZIP_QUEUE_LENGTH = 4
 
 class WorkspaceBagger():
     """
@@ -59,33 +74,36 @@ class WorkspaceBagger():
         else:
             log.info(msg)
 
+    def _resolve_mets_files(self, workspace, ocrd_manifestation_depth):
+        """
+        Yield ``(ocrd_file, relpath)`` for all files to bag, with ``relpath``
+        relative to the ``data`` directory of the bag.
+        """
+        # TODO allow filtering by fileGrp@USE and such
+        for f in workspace.mets.find_files():
+            log.info("Resolving %s (%s)", f.url, ocrd_manifestation_depth)
+            if is_local_filename(f.url):
+                # nothing to do then
+                pass
+            elif ocrd_manifestation_depth != 'full':
+                self._log_or_raise("Not fetching non-local files, skipping %s" % f.url)
+                continue
+            elif not f.url.startswith('http'):
+                self._log_or_raise("Not an http URL: %s" % f.url)
+                continue
+            log.info("Resolved %s", f.url)
+            yield f, join(f.fileGrp, "%s%s" % (f.ID, f.extension))
+
     def _bag_mets_files(self, workspace, bagdir, ocrd_manifestation_depth, ocrd_mets, processes):
-        mets = workspace.mets
         changed_urls = {}
 
-        # TODO allow filtering by fileGrp@USE and such
         with pushd_popd(workspace.directory):
             # URLs of the files before changing
-            for f in mets.find_files():
-                log.info("Resolving %s (%s)", f.url, ocrd_manifestation_depth)
-                if is_local_filename(f.url):
-                    # nothing to do then
-                    pass
-                elif ocrd_manifestation_depth != 'full':
-                    self._log_or_raise("Not fetching non-local files, skipping %s" % f.url)
-                    continue
-                elif not f.url.startswith('http'):
-                    self._log_or_raise("Not an http URL: %s" % f.url)
-                    continue
-                log.info("Resolved %s", f.url)
-
+            for f, _relpath in list(self._resolve_mets_files(workspace, ocrd_manifestation_depth)):
                 file_grp_dir = join(bagdir, 'data', f.fileGrp)
                 if not isdir(file_grp_dir):
                     makedirs(file_grp_dir)
-
-                _basename = "%s%s" % (f.ID, f.extension)
-                _relpath = join(f.fileGrp, _basename)
-                self.resolver.download_to_directory(file_grp_dir, f.url, basename=_basename)
+                self.resolver.download_to_directory(file_grp_dir, f.url, basename=basename(_relpath))
                 changed_urls[f.url] = _relpath
                 f.url = _relpath
 
@@ -118,20 +136,201 @@ class WorkspaceBagger():
             log.info("New vs. old: %s" % changed_urls)
         return total_bytes, total_files
 
-    def _set_bag_info(self, bag, total_bytes, total_files, ocrd_identifier, ocrd_manifestation_depth, ocrd_base_version_checksum):
-        bag.info['BagIt-Profile-Identifier'] = OCRD_BAGIT_PROFILE_URL
-        bag.info['Bag-Software-Agent'] = 'ocrd/core %s (bagit.py %s, bagit_profile %s) [cmdline: "%s"]' % (
+    def _set_bag_info(self, bag_info, total_bytes, total_files, ocrd_identifier, ocrd_manifestation_depth, ocrd_base_version_checksum):
+        bag_info['BagIt-Profile-Identifier'] = OCRD_BAGIT_PROFILE_URL
+        bag_info['Bag-Software-Agent'] = 'ocrd/core %s (bagit.py %s, bagit_profile %s) [cmdline: "%s"]' % (
             VERSION, # TODO
             get_distribution('bagit').version,
             get_distribution('bagit_profile').version,
             ' '.join(sys.argv))
 
-        bag.info['Ocrd-Identifier'] = ocrd_identifier
-        bag.info['Ocrd-Manifestation-Depth'] = ocrd_manifestation_depth
+        bag_info['Ocrd-Identifier'] = ocrd_identifier
+        bag_info['Ocrd-Manifestation-Depth'] = ocrd_manifestation_depth
         if ocrd_base_version_checksum:
-            bag.info['Ocrd-Base-Version-Checksum'] = ocrd_base_version_checksum
-        bag.info['Bagging-Date'] = str(datetime.now())
-        bag.info['Payload-Oxum'] = '%s.%s' % (total_bytes, total_files)
+            bag_info['Ocrd-Base-Version-Checksum'] = ocrd_base_version_checksum
+        bag_info['Bagging-Date'] = str(datetime.now())
+        bag_info['Payload-Oxum'] = '%s.%s' % (total_bytes, total_files)
+
+    def _payload_sources(self, workspace, ocrd_manifestation_depth, ocrd_mets):
+        """
+        Resolve the files to bag without copying them.
+
+        Returns:
+            list of ``(arcname, mimetype, source)``, where source is either the
+            content as bytes, a URL or path to stream the content from, or a
+            callable returning the content of a rewritten PAGE-XML
+        """
+        changed_urls = {}
+        sources = []
+        for f, _relpath in list(self._resolve_mets_files(workspace, ocrd_manifestation_depth)):
+            if is_local_filename(f.url):
+                src = str(Path(workspace.directory, get_local_filename(f.url)))
+            else:
+                src = f.url
+            sources.append((f, _relpath, src))
+            changed_urls[f.url] = _relpath
+            f.url = _relpath
+        log.info("New vs. old: %s" % changed_urls)
+
+        payload = []
+        for f, _relpath, src in sources:
+            if f.mimetype == MIMETYPE_PAGE:
+                # rewritten only when hashed, so only a few PAGE are in memory at once
+                src = partial(self._rewrite_page, f, src, changed_urls)
+            payload.append(('data/' + _relpath, f.mimetype, src))
+        payload.append(('data/' + ocrd_mets, 'text/xml', workspace.mets.to_xml()))
+        return payload
+
+    def _rewrite_page(self, f, src, changed_urls):
+        """
+        Read the PAGE-XML of ``f`` from ``src`` and fix its Page/@imageFilename.
+
+        Returns:
+            the content as bytes
+        """
+        if is_local_filename(src):
+            with open(src, 'rb') as page_file:
+                src = page_file.read()
+        else:
+            with self.resolver.http_get(src) as response:
+                if response.status_code != 200:
+                    raise Exception("HTTP request failed: %s (HTTP %d)" % (src, response.status_code))
+                src = response.content
+        pcgts = page_from_file(f, fileobj=BytesIO(src))
+        # TODO replace AlternativeImage, recursively...
+        if pcgts.get_Page().imageFilename in changed_urls:
+            pcgts.get_Page().imageFilename = changed_urls[pcgts.get_Page().imageFilename]
+            src = to_xml(pcgts).encode('utf-8')
+        return src
+
+    def _read_chunks(self, src):
+        if callable(src):
+            src = src()
+        if isinstance(src, bytes):
+            yield src
+        elif is_local_filename(src):
+            with open(src, 'rb') as f:
+                for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                    yield chunk
+        else:
+            with self.resolver.http_get(src, stream=True) as response:
+                if response.status_code != 200:
+                    raise Exception("HTTP request failed: %s (HTTP %d)" % (src, response.status_code))
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    yield chunk
+
+    def _hash_to_queue(self, src, queue, aborted):
+        """
+        Hash the content of ``src`` and pass it on in chunks through ``queue``,
+        followed by ``None``. Run in the hashing pool.
+
+        Returns:
+            SHA-512 hexdigest and size of the content
+        """
+        hasher = hashlib.sha512()
+        size = 0
+        try:
+            for chunk in self._read_chunks(src):
+                hasher.update(chunk)
+                size += len(chunk)
+                if not self._put(queue, chunk, aborted):
+                    return None, size
+        finally:
+            # unblock the writer, it checks for errors after the last chunk
+            self._put(queue, None, aborted)
+        return hasher.hexdigest(), size
+
+    @staticmethod
+    def _put(queue, item, aborted):
+        """
+        Put ``item`` into ``queue`` unless ``aborted`` is set while waiting.
+        """
+        while not aborted.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _zip_payload(self, zf, payload, compression, processes):
+        """
+        Write payload to the open ZIP ``zf``, reading each file only once.
+
+        Reading and hashing runs in a pool of ``processes`` threads, ahead of
+        the compression and writing of the ZIP, which are inherently sequential.
+
+        Returns:
+            list of ``(sha512, arcname)`` and the total size of the payload
+        """
+        checksums = []
+        total_bytes = 0
+        aborted = Event()
+        with ThreadPoolExecutor(max_workers=processes) as pool:
+            # Jobs start in order, so the job of the entry being written is
+            # always running and the bounded queues limit memory usage to
+            # ZIP_QUEUE_LENGTH chunks per thread
+            jobs = []
+            for arcname, mimetype, src in payload:
+                queue = Queue(maxsize=ZIP_QUEUE_LENGTH)
+                jobs.append((arcname, mimetype, queue, pool.submit(self._hash_to_queue, src, queue, aborted)))
+            try:
+                for arcname, mimetype, queue, job in jobs:
+                    if compression == 'stored' or (compression == 'auto' and mimetype in ZIP_STORED_MIMETYPES):
+                        zf.compression = ZIP_STORED
+                    else:
+                        zf.compression = ZIP_DEFLATED
+                    log.debug("Adding %s (%s)", arcname, 'stored' if zf.compression == ZIP_STORED else 'deflated')
+                    with zf.open(arcname, 'w', force_zip64=True) as entry:
+                        for chunk in iter(queue.get, None):
+                            entry.write(chunk)
+                    sha512, size = job.result()
+                    checksums.append((sha512, arcname))
+                    total_bytes += size
+            except BaseException:
+                aborted.set()
+                for _, _, _, job in jobs:
+                    job.cancel()
+                raise
+        return checksums, total_bytes
+
+    def _bag_to_zip(self, workspace, dest, ocrd_identifier, ocrd_mets, ocrd_manifestation_depth,
+                    ocrd_base_version_checksum, processes, tag_files, compression, compression_level):
+        """
+        Bag the workspace straight into an OCRD-ZIP without a temporary bag directory.
+        """
+        with pushd_popd(workspace.directory):
+            payload = self._payload_sources(workspace, ocrd_manifestation_depth, ocrd_mets)
+        zip_kwargs = {'allowZip64': True}
+        if compression_level is not None:
+            zip_kwargs['compresslevel'] = compression_level
+        try:
+            with ZipFile(dest, 'w', ZIP_DEFLATED, **zip_kwargs) as zf:
+                checksums, total_bytes = self._zip_payload(zf, payload, compression, processes)
+                zf.compression = ZIP_DEFLATED
+                bag_info = {}
+                self._set_bag_info(bag_info, total_bytes, len(checksums), ocrd_identifier, ocrd_manifestation_depth, ocrd_base_version_checksum)
+                tags = [
+                    ('bagit.txt', BAGIT_TXT.encode('utf-8')),
+                    ('bag-info.txt', ''.join(
+                        '%s: %s\n' % (key, re.sub(r'\n|\r|(\r\n)', '', str(bag_info[key]))) for key in sorted(bag_info)
+                    ).encode('utf-8')),
+                    ('manifest-sha512.txt', ''.join(
+                        '%s  %s\n' % (sha512, arcname) for sha512, arcname in sorted(checksums, key=lambda c: c[1])
+                    ).encode('utf-8')),
+                ]
+                for tag_file in tag_files:
+                    with open(tag_file, 'rb') as f:
+                        tags.append((basename(tag_file), f.read()))
+                for name, content in tags:
+                    zf.writestr(name, content)
+                zf.writestr('tagmanifest-sha512.txt', ''.join(
+                    '%s %s\n' % (hashlib.sha512(content).hexdigest(), name) for name, content in tags
+                ).encode('utf-8'))
+        except BaseException:
+            if exists(dest):
+                unlink(dest)
+            raise
 
     def bag(self,
             workspace,
@@ -143,7 +342,9 @@ class WorkspaceBagger():
             processes=1,
             skip_zip=False,
             in_place=False,
-            tag_files=None
+            tag_files=None,
+            compression='auto',
+            compression_level=None,
            ):
         """
         Bag a workspace
@@ -161,6 +362,12 @@ class WorkspaceBagger():
             skip_zip (boolean): Whether to leave directory unzipped
             in_place (boolean): Whether to **replace** the workspace with its BagIt variant
             tag_files (list<string>): Path names of additional tag files to be bagged at the root of the bag
+            compression (string): How to compress files in the OCRD-ZIP, one of
+                ``deflated``, ``stored`` or ``auto`` (deflate all but already compressed images, see ``ZIP_STORED_MIMETYPES``)
+            compression_level (integer): Deflate level from 0 to 9, default 6 (Python >= 3.7)
+
+        Unless ``skip_zip`` is set, files are read only once, hashed and
+        written directly into the OCRD-ZIP, without a temporary bag directory.
         """
         if ocrd_manifestation_depth not in ('full', 'partial'):
             raise Exception("manifestation_depth must be 'full' or 'partial'")
@@ -169,12 +376,12 @@ class WorkspaceBagger():
         if in_place and not skip_zip:
             raise Exception("Setting 'skip_zip' and not 'in_place' is a contradiction")
 
+        if compression not in ZIP_COMPRESSIONS:
+            raise Exception("compression must be one of %s" % ', '.join(ZIP_COMPRESSIONS))
+
         if tag_files is None:
             tag_files = []
 
-        # create bagdir
-        bagdir = mkdtemp(prefix=TMP_BAGIT_PREFIX)
-
         if dest is None:
             if in_place:
                 dest = workspace.directory
@@ -183,6 +390,20 @@ class WorkspaceBagger():
             else:
                 dest = '%s.ocrd' % workspace.directory
 
+        if compression_level is not None and sys.version_info < (3, 7):
+            log.warning("Ignoring compression_level, not supported before Python 3.7")
+            compression_level = None
+
+        if not skip_zip and sys.version_info >= (3, 6):
+            log.info("Bagging %s to %s", workspace.directory, dest)
+            self._bag_to_zip(workspace, dest, ocrd_identifier, ocrd_mets, ocrd_manifestation_depth,
+                             ocrd_base_version_checksum, processes, tag_files, compression, compression_level)
+            log.info('Created bag at %s', dest)
+            return dest
+
+        # create bagdir
+        bagdir = mkdtemp(prefix=TMP_BAGIT_PREFIX)
+
         log.info("Bagging %s to %s (temp dir %s)", workspace.directory, '(in-place)' if in_place else dest, bagdir)
 
         # create data dir
@@ -197,7 +418,7 @@ class WorkspaceBagger():
 
         # create bag-info.txt
         bag = Bag(bagdir)
-        self._set_bag_info(bag, total_bytes, total_files, ocrd_identifier, ocrd_manifestation_depth, ocrd_base_version_checksum)
+        self._set_bag_info(bag.info, total_bytes, total_files, ocrd_identifier, ocrd_manifestation_depth, ocrd_base_version_checksum)
 
         for tag_file in tag_files:
             copyfile(tag_file, join(bagdir, basename(tag_file)))
@@ -211,15 +432,43 @@ class WorkspaceBagger():
         log.info('Created bag at %s', dest)
         return dest
 
-    def spill(self, src, dest):
+    def _spill_member(self, zip_handles, src, name, destfile, sha512):
+        """
+        Extract member ``name`` of the ZIP at ``src`` to ``destfile``,
+        verifying its SHA-512 checksum unless ``sha512`` is ``None``.
+
+        Run in the extraction pool, with one ZIP handle per thread.
+        """
+        if not hasattr(zip_handles.local, 'zf'):
+            zip_handles.local.zf = ZipFile(src)
+            with zip_handles.lock:
+                zip_handles.all.append(zip_handles.local.zf)
+        makedirs(dirname(destfile), exist_ok=True)
+        log.debug("Extract %s -> %s", name, destfile)
+        hasher = hashlib.sha512()
+        with zip_handles.local.zf.open(name) as fin, open(destfile, 'wb') as fout:
+            for chunk in iter(lambda: fin.read(DOWNLOAD_CHUNK_SIZE), b''):
+                if sha512 is not None:
+                    hasher.update(chunk)
+                fout.write(chunk)
+        if sha512 is not None and hasher.hexdigest() != sha512:
+            unlink(destfile)
+            raise Exception("Checksum mismatch for %s: sha512 %s != %s" % (name, hasher.hexdigest(), sha512))
+
+    def spill(self, src, dest, processes=1, verify=False):
         """
         Spill a workspace, i.e. unpack it and turn it into a workspace.
 
         See https://ocr-d.github.com/ocrd_zip#unpacking-ocrd-zip-to-a-workspace
 
+        The payload is extracted directly from the ZIP to ``dest``, without
+        unpacking the bag to a temporary directory first.
+
         Arguments:
             src (string): Path to OCRD-ZIP
             dest (string): Path to directory to unpack data folder to
+            processes (integer): Number of files to extract in parallel
+            verify (boolean): Whether to verify the checksums in ``manifest-sha512.txt`` while extracting
         """
         #  print(dest)
 
@@ -236,26 +485,38 @@ class WorkspaceBagger():
 
         log.info("Spilling %s to %s", src, dest)
 
-        bagdir = mkdtemp(prefix=TMP_BAGIT_PREFIX)
-        unzip_file_to_dir(src, bagdir)
-
-        datadir = join(bagdir, 'data')
-        for root, _, files in walk(datadir):
-            for f in files:
-                srcfile = join(root, f)
-                destdir = join(dest, relpath(root, datadir))
-                destfile = join(destdir, f)
-                if not exists(destdir):
-                    makedirs(destdir)
-                log.debug("Copy %s -> %s", srcfile, destfile)
-                copyfile(srcfile, destfile)
+        with ZipFile(src) as zf:
+            members = {}
+            for info in zf.infolist():
+                if not info.filename.startswith('data/') or info.filename.endswith('/'):
+                    continue
+                # do not write outside of dest
+                _relpath = normpath(info.filename[len('data/'):])
+                if isabs(_relpath) or _relpath.split(sep)[0] == '..':
+                    raise Exception("Invalid path in OCRD-ZIP: %s" % info.filename)
+                members[info.filename] = join(dest, _relpath)
+            checksums = {}
+            if verify:
+                for line in zf.read('manifest-sha512.txt').decode('utf-8').splitlines():
+                    if line.strip():
+                        sha512, name = line.split(None, 1)
+                        checksums[name.strip()] = sha512.lower()
+                if set(checksums) != set(members):
+                    raise Exception("Payload of %s does not match manifest-sha512.txt: missing %s, not in manifest %s" % (
+                        src, sorted(set(checksums) - set(members)), sorted(set(members) - set(checksums))))
 
         # TODO copy allowed tag files if present
 
-        # TODO validate bagit
-
-        # Drop tempdir
-        rmtree(bagdir)
+        makedirs(dest, exist_ok=True)
+        zip_handles = SimpleNamespace(local=local(), lock=Lock(), all=[])
+        try:
+            with ThreadPoolExecutor(max_workers=processes) as pool:
+                for job in [pool.submit(self._spill_member, zip_handles, src, name, destfile, checksums.get(name))
+                            for name, destfile in members.items()]:
+                    job.result()
+        finally:
+            for zf in zip_handles.all:
+                zf.close()
 
         # Create workspace
         workspace = Workspace(self.resolver, directory=dest)
@@ -25,7 +25,7 @@ def exif_from_filename(image_filename):
     by opening an image file with PIL and reading its metadata.
 
     Arguments:
-        * image_filename (string):
+        * image_filename (string|file object):
     """
     if image_filename is None:
         raise Exception("Must pass 'image_filename' to 'exif_from_filename'")
@@ -33,7 +33,13 @@ def exif_from_filename(image_filename):
         ocrd_exif = OcrdExif(pil_img)
     return ocrd_exif
 
-def page_from_image(input_file):
+def _check_local_filename(input_file):
+    if not input_file.local_filename:
+        raise ValueError("input_file must have 'local_filename' property")
+    if not Path(input_file.local_filename).exists():
+        raise FileNotFoundError("File not found: '%s' (%s)" % (input_file.local_filename, input_file))
+
+def page_from_image(input_file, fileobj=None):
     """
     Create `OcrdPage </../../ocrd_models/ocrd_models.ocrd_page.html>`_
     from an `OcrdFile </../../ocrd_models/ocrd_models.ocrd_file.html>`_
@@ -41,12 +47,11 @@ def page_from_image(input_file):
 
     Arguments:
         * input_file (OcrdFile):
+        * fileobj (file object): Binary file to read the image from instead of ``input_file.local_filename``
     """
-    if not input_file.local_filename:
-        raise ValueError("input_file must have 'local_filename' property")
-    if not Path(input_file.local_filename).exists():
-        raise FileNotFoundError("File not found: '%s' (%s)" % (input_file.local_filename, input_file))
-    exif = exif_from_filename(input_file.local_filename)
+    if fileobj is None:
+        _check_local_filename(input_file)
+    exif = exif_from_filename(fileobj if fileobj is not None else input_file.local_filename)
     now = datetime.now()
     return PcGtsType(
         Metadata=MetadataType(
@@ -62,19 +67,20 @@ def page_from_image(input_file):
         )
     )
 
-def page_from_file(input_file):
+def page_from_file(input_file, fileobj=None):
     """
     Create a new PAGE-XML from a METS file representing a PAGE-XML or an image.
 
     Arguments:
         * input_file (OcrdFile):
+        * fileobj (file object): Binary file to read from instead of
+          ``input_file.local_filename``, e.g. from ``Workspace.open_file``
+          to avoid downloading remote files
     """
-    if not input_file.local_filename:
-        raise ValueError("input_file must have 'local_filename' property")
-    if not Path(input_file.local_filename).exists():
-        raise FileNotFoundError("File not found: '%s' (%s)" % (input_file.local_filename, input_file))
+    if fileobj is None:
+        _check_local_filename(input_file)
     if input_file.mimetype.startswith('image'):
-        return page_from_image(input_file)
+        return page_from_image(input_file, fileobj=fileobj)
     if input_file.mimetype == MIMETYPE_PAGE:
-        return parse(input_file.local_filename, silence=True)
+        return parse(fileobj if fileobj is not None else input_file.local_filename, silence=True)
     raise ValueError("Unsupported mimetype '%s'" % input_file.mimetype)
@@ -7,12 +7,17 @@ __all__ = [
     'PageValidator',
     'OcrdToolValidator',
     'OcrdZipValidator',
-    'ValidationReport'
+    'ValidationReport',
+    'StreamingValidationReport',
+    'ValidationCache',
+    'PageXsdValidator',
 ]
 
-from .report import ValidationReport
+from .report import ValidationReport, StreamingValidationReport
 from .parameter_validator import ParameterValidator
 from .workspace_validator import WorkspaceValidator
 from .page_validator import PageValidator
+from .page_xsd_validator import PageXsdValidator
 from .ocrd_tool_validator import OcrdToolValidator
 from .ocrd_zip_validator import OcrdZipValidator
+from .validation_cache import ValidationCache
@@ -1,14 +1,20 @@
 """
 Constants for ocrd_validators.
 """
+from os import environ
+from os.path import join, expanduser
 import yaml
-from pkg_resources import resource_string
+from pkg_resources import resource_string, resource_filename
 
 OCRD_TOOL_SCHEMA = yaml.safe_load(resource_string(__name__, 'ocrd_tool.schema.yml'))
 OCRD_BAGIT_PROFILE = yaml.safe_load(resource_string(__name__, 'bagit-profile.yml'))
+# PAGE XML Schema, vendored like the JSON schemas (see the comment in page.xsd)
+PAGE_XSD = resource_filename(__name__, 'page.xsd')
 
 BAGIT_TXT = 'BagIt-Version: 1.0\nTag-File-Character-Encoding: UTF-8'
 FILE_GROUP_PREFIX = 'OCR-D-'
 FILE_GROUP_CATEGORIES = ['IMG', 'SEG', 'OCR', 'COR', 'GT']
 TMP_BAGIT_PREFIX = 'ocrd-bagit-'
 OCRD_BAGIT_PROFILE_URL = 'https://ocr-d.github.io/bagit-profile.json'
+# same base directory as ocrd.constants.CACHE_DIR, which cannot be imported here
+VALIDATION_CACHE_DIR = join(environ.get('XDG_CACHE_HOME', join(expanduser('~'), '.cache')), 'ocrd', 'validation')
@@ -2,6 +2,8 @@
 Validating JSON-Schema
 """
 import json
+from hashlib import sha256
+from threading import Lock
 
 from jsonschema import Draft4Validator, validators # pylint: disable=import-error
 
@@ -30,6 +32,25 @@ def extend_with_default(validator_class):
 
 DefaultValidatingDraft4Validator = extend_with_default(Draft4Validator)
 
+# Compiled validators of this process, by validator class and schema hash
+_VALIDATORS = {}
+_VALIDATORS_LOCK = Lock()
+
+def compiled_validator(schema, validator_class=Draft4Validator):
+    """
+    Get a ``validator_class`` instance for ``schema``, compiled only once per
+    process for all equal schemas.
+
+    The validator works on a private copy of ``schema``, so changing
+    ``schema`` afterwards does not affect it.
+    """
+    serialized = json.dumps(schema, sort_keys=True)
+    key = (validator_class, sha256(serialized.encode('utf-8')).hexdigest())
+    with _VALIDATORS_LOCK:
+        if key not in _VALIDATORS:
+            _VALIDATORS[key] = validator_class(json.loads(serialized))
+        return _VALIDATORS[key]
+
 #
 # -------------------------------------------------
 #
@@ -60,7 +81,7 @@ class JsonValidator():
             schema (dict):
             validator_class (Draft4Validator|DefaultValidatingDraft4Validator):
         """
-        self.validator = validator_class(schema)
+        self.validator = compiled_validator(schema, validator_class)
 
     def _validate(self, obj):
         """
@@ -72,8 +93,6 @@ class JsonValidator():
         Returns: ValidationReport
         """
         report = ValidationReport()
-        if not self.validator.is_valid(obj):
-            for v in self.validator.iter_errors(obj):
-                #  print(">>>>>>>>> v='%s', obj='%s'" % (v, obj))
-                report.add_error("[%s] %s" % ('.'.join(str(vv) for vv in v.path), v.message))
+        for v in self.validator.iter_errors(obj):
+            report.add_error("[%s] %s" % ('.'.join(str(vv) for vv in v.path), v.message))
         return report
@@ -3,12 +3,16 @@ Validating OCRD-ZIP.
 
 See `spec <https://ocr-d.github.io/ocrd_zip>`_.
 """
+import hashlib
+from multiprocessing import Pool
+from os.path import join
 from tempfile import mkdtemp
 from shutil import rmtree
+from zipfile import ZipFile
 
 from ocrd_utils import getLogger, unzip_file_to_dir
 
-from bagit import Bag, BagValidationError # pylint: disable=no-name-in-module
+from bagit import Bag, BagValidationError, ChecksumMismatch, FileMissing, UnexpectedFile # pylint: disable=no-name-in-module
 from bagit_profile import Profile, ProfileValidationError # pylint: disable=no-name-in-module
 
 from .constants import OCRD_BAGIT_PROFILE, OCRD_BAGIT_PROFILE_URL, TMP_BAGIT_PREFIX
@@ -16,6 +20,27 @@ from .report import ValidationReport
 
 log = getLogger('ocrd.ocrd_zip_validator')
 
+HASH_BLOCK_SIZE = 2 ** 20
+
+# ZIP file opened once per process checksumming members, see _hash_zip_member
+_member_zip = None
+
+def _open_member_zip(path_to_zip):
+    global _member_zip # pylint: disable=global-statement
+    _member_zip = ZipFile(path_to_zip)
+
+def _hash_zip_member(args):
+    """
+    Stream a member of the ZIP opened by :py:func:`_open_member_zip` and return its digests.
+    """
+    name, algorithms = args
+    hashers = dict((alg, hashlib.new(alg)) for alg in algorithms)
+    with _member_zip.open(name) as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            for hasher in hashers.values():
+                hasher.update(block)
+    return name, dict((alg, hasher.hexdigest()) for alg, hasher in hashers.items())
+
 #
 # -------------------------------------------------
 #
@@ -65,7 +90,61 @@ class OcrdZipValidator():
         if failed:
             raise BagValidationError("%s" % failed)
 
-    def validate(self, skip_checksums=False, skip_bag=False, skip_unzip=False, skip_delete=False, processes=2):
+    def _validate_bag_in_zip(self, bag, skip_checksums, processes):
+        """
+        Validate BagIt (checksums, payload.oxum etc) of the payload in the ZIP
+        without unzipping it. Tag files are expected to be extracted to the
+        directory of ``bag``.
+        """
+        with ZipFile(self.path_to_zip) as zf:
+            members = dict((info.filename, info.file_size) for info in zf.infolist()
+                           if info.filename.startswith('data/') and not info.filename.endswith('/'))
+        oxum = bag.info.get('Payload-Oxum')
+        if oxum:
+            oxum_byte_count, oxum_file_count = [int(n) for n in oxum.split('.', 1)]
+            if oxum_file_count != len(members) or oxum_byte_count != sum(members.values()):
+                raise BagValidationError(
+                    "Payload-Oxum validation failed."
+                    " Expected %d files and %d bytes but found %d files and %d bytes" % (
+                        oxum_file_count, oxum_byte_count, len(members), sum(members.values())))
+        # manifest paths use os.sep, ZIP member names '/'
+        entries = dict((path.replace('\\', '/'), hashes) for path, hashes in bag.payload_entries().items())
+        errors = [FileMissing(path) for path in sorted(set(entries) - set(members))]
+        errors += [UnexpectedFile(path) for path in sorted(set(members) - set(entries))]
+        if not skip_checksums:
+            jobs = [(name, sorted(entries[name])) for name in sorted(set(members) & set(entries))]
+            if processes > 1:
+                pool = Pool(processes, _open_member_zip, (self.path_to_zip,))
+                try:
+                    digests = list(pool.imap_unordered(_hash_zip_member, jobs))
+                finally:
+                    pool.terminate()
+            else:
+                _open_member_zip(self.path_to_zip)
+                try:
+                    digests = [_hash_zip_member(job) for job in jobs]
+                finally:
+                    _member_zip.close()
+            for tag_path in bag.tagfile_entries():
+                digests.append(self._hash_tag_file(bag, tag_path))
+            entries.update(bag.tagfile_entries())
+            for name, found in sorted(digests):
+                for alg, digest in sorted(found.items()):
+                    if entries[name][alg].lower() != digest:
+                        errors.append(ChecksumMismatch(name, alg, entries[name][alg].lower(), digest))
+        if errors:
+            raise BagValidationError("Bag validation failed", errors)
+
+    @staticmethod
+    def _hash_tag_file(bag, tag_path):
+        hashers = dict((alg, hashlib.new(alg)) for alg in bag.entries[tag_path])
+        with open(join(bag.path, tag_path), 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                for hasher in hashers.values():
+                    hasher.update(block)
+        return tag_path, dict((alg, hasher.hexdigest()) for alg, hasher in hashers.items())
+
+    def validate(self, skip_checksums=False, skip_bag=False, skip_unzip=False, skip_delete=False, processes=2, stream=False):
         """
         Validate an OCRD-ZIP file for profile, bag and workspace conformance
 
@@ -75,8 +154,26 @@ class OcrdZipValidator():
             skip_unzip (boolean): Whether the OCRD-ZIP is unzipped, i.e. a directory
             skip_delete (boolean): Whether to skip deleting the unpacked OCRD-ZIP dir after valdiation
             processes (integer): Number of processes used for checksum validation
+            stream (boolean): Whether to read the payload straight from the
+                ZIP instead of unzipping it, so no scratch space for the payload is needed
 
         """
+        if stream and not skip_unzip:
+            self.profile_validator.validate_serialization(self.path_to_zip)
+            bagdir = mkdtemp(prefix=TMP_BAGIT_PREFIX)
+            try:
+                with ZipFile(self.path_to_zip) as zf:
+                    for info in zf.infolist():
+                        if not info.filename.startswith('data/'):
+                            zf.extract(info, bagdir)
+                bag = Bag(bagdir)
+                self._validate_profile(bag)
+                if not skip_bag:
+                    self._validate_bag_in_zip(bag, skip_checksums, processes)
+            finally:
+                rmtree(bagdir)
+            return self.report
+
         if skip_unzip:
             bagdir = self.path_to_zip
             skip_delete = True
@@ -2,7 +2,9 @@
 API for validating `OcrdPage <../ocrd_models/ocrd_models.ocrd_page.html>`_.
 """
 import re
+from pathlib import Path
 from shapely.geometry import Polygon, LineString
+from shapely.prepared import prep
 from shapely.validation import explain_validity
 
 from ocrd_utils import getLogger, polygon_from_points, deprecated_alias
@@ -30,6 +32,7 @@ from ocrd_models.ocrd_page_generateds import (
     UnorderedGroupIndexedType,
 )
 from .report import ValidationReport
+from .page_xsd_validator import PageXsdValidator
 
 log = getLogger('ocrd.page_validator')
 
@@ -118,6 +121,10 @@ class ConsistencyError(Exception):
             "INCONSISTENCY in %s ID '%s' of file '%s': text results '%s' != concatenated '%s'" % (
                 tag, ID, file_id, actual, expected))
 
+    def __reduce__(self):
+        # pickle with the constructor arguments, e.g. for reports from a process pool
+        return (self.__class__, (self.tag, self.ID, self.file_id, self.actual, self.expected))
+
 class CoordinateConsistencyError(Exception):
     """
     Exception representing a consistency error in coordinate confinement across levels of a PAGE-XML.
@@ -144,6 +151,9 @@ class CoordinateConsistencyError(Exception):
             "INCONSISTENCY in %s ID '%s' of '%s': coords '%s' not within parent coords '%s'" % (
                 tag, ID, file_id, inner, outer))
 
+    def __reduce__(self):
+        return (self.__class__, (self.tag, self.ID, self.file_id, self.outer, self.inner))
+
 class CoordinateValidityError(Exception):
     """
     Exception representing a validity error of an element's coordinates in PAGE-XML.
@@ -165,10 +175,14 @@ class CoordinateValidityError(Exception):
         self.ID = ID
         self.file_id = file_id
         self.points = points
+        self.reason = reason
         super(CoordinateValidityError, self).__init__(
             "INVALIDITY in %s ID '%s' of '%s': coords '%s' - %s" % (
                 tag, ID, file_id, points, reason))
 
+    def __reduce__(self):
+        return (self.__class__, (self.tag, self.ID, self.file_id, self.points, self.reason))
+
 def compare_without_whitespace(a, b):
     """
     Compare two strings, ignoring all whitespace.
@@ -223,16 +237,55 @@ def make_line(line_points):
         return 'is negative'
     return line
 
+class ParentArea():
+    """
+    Area that the coordinates of an element's children must be within, i.e.
+    the element's polygon plus ``PARENT_SLACK``, prepared for testing many
+    children against it.
+
+    Children whose bounding box is outside the bounding box of the area fail
+    without an exact test. If the polygon is an axis-aligned rectangle,
+    children whose bounding box is within it pass without an exact test.
+    """
+
+    def __init__(self, poly):
+        area = poly.buffer(PARENT_SLACK)
+        self.bounds = area.bounds
+        # a rectangle equals its own bounding box
+        self.inner_bounds = poly.bounds if poly.area >= poly.envelope.area else None
+        self._prepared = prep(area)
+
+    def contains(self, geom):
+        """Whether ``geom`` is within the area"""
+        minx, miny, maxx, maxy = geom.bounds
+        if minx < self.bounds[0] or miny < self.bounds[1] or maxx > self.bounds[2] or maxy > self.bounds[3]:
+            return False
+        if self.inner_bounds and (self.inner_bounds[0] <= minx and self.inner_bounds[1] <= miny and
+                                  maxx <= self.inner_bounds[2] and maxy <= self.inner_bounds[3]):
+            return True
+        return self._prepared.contains(geom)
+
 @deprecated_alias(strictness='page_textequiv_consistency')
 @deprecated_alias(strategy='page_textequiv_strategy')
 def validate_consistency(node, page_textequiv_consistency, page_textequiv_strategy,
                          check_baseline, check_coords, report, file_id,
                          joinRelations=None, readingOrder=None,
-                         textLineOrder=None, readingDirection=None):
+                         textLineOrder=None, readingDirection=None,
+                         max_errors=None, texts=None, node_poly=None):
     """
     Check whether the text results on an element is consistent with its child element text results,
     and whether the coordinates of an element are fully within its parent element coordinates.
+
+    If ``max_errors`` is set, stop traversing the hierarchy as soon as
+    ``report`` has that many errors.
+
+    The text of each element is determined only once per traversal and
+    kept in ``texts`` for the comparison with its parent's text. Likewise,
+    the polygon of each element is made only once, and passed down as
+    ``node_poly`` by its parent.
     """
+    if texts is None:
+        texts = dict()
     if isinstance(node, PcGtsType):
         # top-level (start recursion)
         node_id = node.get_pcGtsId()
@@ -242,8 +295,7 @@ def validate_consistency(node, page_textequiv_consistency, page_textequiv_strate
         ro = node.get_ReadingOrder()
         if ro:
             page_get_reading_order(readingOrder, ro.get_OrderedGroup() or ro.get_UnorderedGroup())
-        if not joinRelations:
-            joinRelations = list()
+        joinRelations = set(joinRelations) if joinRelations else set()
         relations = node.get_Relations() # get RelationsType
         if relations:
             relations = relations.get_Relation() # get list of RelationType
@@ -251,7 +303,7 @@ def validate_consistency(node, page_textequiv_consistency, page_textequiv_strate
             relations = []
         for relation in relations:
             if relation.get_type() == 'join': # ignore 'link' type here
-                joinRelations.append((relation.get_SourceRegionRef().get_regionRef(),
+                joinRelations.add((relation.get_SourceRegionRef().get_regionRef(),
                                       relation.get_TargetRegionRef().get_regionRef()))
     elif isinstance(node, GlyphType):
         # terminal level (end recursion)
@@ -268,7 +320,8 @@ def validate_consistency(node, page_textequiv_consistency, page_textequiv_strate
             parent = node
         if parent:
             parent_points = parent.get_Coords().points
-            node_poly = make_poly(polygon_from_points(parent_points))
+            if node_poly is None:
+                node_poly = make_poly(polygon_from_points(parent_points))
             if not isinstance(node_poly, Polygon):
                 report.add_error(CoordinateValidityError(tag, node_id, file_id,
                                                          parent_points, node_poly))
@@ -277,6 +330,8 @@ def validate_consistency(node, page_textequiv_consistency, page_textequiv_strate
                 node_poly = None # don't use in further comparisons
         else:
             node_poly = None
+        # buffered once for all children
+        parent_area = ParentArea(node_poly) if node_poly else None
     for class_, getterLO, getterRD in _ORDER[1:]:
         if isinstance(node, class_):
             if getterLO:
@@ -297,22 +352,28 @@ def validate_consistency(node, page_textequiv_consistency, page_textequiv_strate
               (getter in ['get_Word', 'get_Glyph'] and readingDirection == _ORDER[0][2])):
             children = list(reversed(children))
         for child in children:
+            if max_errors and report.count('error') >= max_errors:
+                return False
+            if check_coords or check_baseline:
+                child_points = child.get_Coords().points
+                child_poly = make_poly(polygon_from_points(child_points))
+            else:
+                child_poly = None
             consistent = (validate_consistency(child, page_textequiv_consistency, page_textequiv_strategy,
                                                check_baseline, check_coords,
                                                report, file_id,
                                                joinRelations, readingOrder,
-                                               textLineOrder, readingDirection)
+                                               textLineOrder, readingDirection,
+                                               max_errors, texts, child_poly)
                           and consistent)
             if check_coords and node_poly:
                 child_tag = child.original_tagname_
-                child_points = child.get_Coords().points
-                child_poly = make_poly(polygon_from_points(child_points))
                 if not isinstance(child_poly, Polygon):
                     # report.add_error(CoordinateValidityError(child_tag, child.id, file_id, child_points))
                     # log.debug("Invalid coords of %s %s", child_tag, child.id)
                     # consistent = False
                     pass # already reported in recursive call above
-                elif not child_poly.within(node_poly.buffer(PARENT_SLACK)):
+                elif not parent_area.contains(child_poly):
                     # TODO: automatic repair?
                     report.add_error(CoordinateConsistencyError(child_tag, child.id, file_id,
                                                                 parent_points, child_points))
@@ -326,21 +387,24 @@ def validate_consistency(node, page_textequiv_consistency, page_textequiv_strate
                                                          baseline_points, baseline_line))
                 log.debug("Invalid coords of baseline in %s", node_id)
                 consistent = False
-            elif not baseline_line.within(node_poly.buffer(PARENT_SLACK)):
+            elif parent_area and not parent_area.contains(baseline_line):
                 report.add_error(CoordinateConsistencyError("Baseline", node_id, file_id,
                                                             parent_points, baseline_points))
                 log.debug("Inconsistent coords of baseline in %s %s", tag, node_id)
                 consistent = False
+        if max_errors and report.count('error') >= max_errors:
+            return False
         if concatenate_with is not None and page_textequiv_consistency != 'off':
             # validate textual consistency of node with children
             concatenated = concatenate(children, concatenate_with, page_textequiv_strategy,
-                                       joinRelations)
-            text_results = get_text(node, page_textequiv_strategy)
+                                       joinRelations, texts)
+            text_results = get_memoized_text(node, page_textequiv_strategy, texts)
             if concatenated and text_results and concatenated != text_results:
                 consistent = False
                 if page_textequiv_consistency == 'fix':
                     log.debug("Repaired text of %s %s", tag, node_id)
                     set_text(node, concatenated, page_textequiv_strategy)
+                    texts[id(node)] = concatenated
                 elif (page_textequiv_consistency == 'strict' # or 'lax' but...
                       or not compare_without_whitespace(concatenated, text_results)):
                     log.debug("Inconsistent text of %s %s", tag, node_id)
@@ -348,21 +412,35 @@ def validate_consistency(node, page_textequiv_consistency, page_textequiv_strate
                                                       text_results, concatenated))
     return consistent
 
-def concatenate(nodes, concatenate_with, page_textequiv_strategy, joins=None):
+def concatenate(nodes, concatenate_with, page_textequiv_strategy, joins=None, texts=None):
     """
     Concatenate nodes textually according to https://ocr-d.github.io/page#consistency-of-text-results-on-different-levels
+
+    Texts already determined in ``texts`` (see :py:func:`get_memoized_text`) are reused.
     """
     if not nodes:
         return ''
     if not joins:
-        joins = list()
-    result = get_text(nodes[0], page_textequiv_strategy)
+        joins = set()
+    if texts is None:
+        texts = dict()
+    result = [get_memoized_text(nodes[0], page_textequiv_strategy, texts)]
     for node, next_node in zip(nodes, nodes[1:]):
         if (node.id, next_node.id) not in joins:
             # TODO: also cover 2-level joins like word-word
-            result += concatenate_with
-        result += get_text(next_node, page_textequiv_strategy)
-    return result.strip()
+            result.append(concatenate_with)
+        result.append(get_memoized_text(next_node, page_textequiv_strategy, texts))
+    return ''.join(result).strip()
+
+def get_memoized_text(node, page_textequiv_strategy, texts):
+    """
+    Like :py:func:`get_text`, but keep the result in dict ``texts`` and
+    reuse it for the same node.
+    """
+    key = id(node)
+    if key not in texts:
+        texts[key] = get_text(node, page_textequiv_strategy)
+    return texts[key]
 
 def get_text(node, page_textequiv_strategy='first'):
     """
@@ -438,26 +516,58 @@ class PageValidator():
     @deprecated_alias(strategy='page_textequiv_strategy')
     def validate(filename=None, ocrd_page=None, ocrd_file=None,
                  page_textequiv_consistency='strict', page_textequiv_strategy='first',
-                 check_baseline=True, check_coords=True):
+                 check_baseline=True, check_coords=True, max_errors=None, cache=None, xsd=None):
         """
         Validates a PAGE file for consistency by filename, OcrdFile or passing OcrdPage directly.
 
         Arguments:
             filename (string): Path to PAGE
             ocrd_page (OcrdPage): OcrdPage instance
-            ocrd_file (OcrdFile): OcrdFile instance wrapping OcrdPage
+            ocrd_file (OcrdFile): OcrdFile instance wrapping OcrdPage. Only
+                                  used for the file ID if ocrd_page is passed as well
             page_textequiv_consistency (string): 'strict', 'lax', 'fix' or 'off'
             page_textequiv_strategy (string): Currently only 'first'
             check_baseline (bool): whether Baseline must be fully within TextLine/Coords
             check_coords (bool): whether *Region/TextLine/Word/Glyph must each be fully
                                  contained within Border/*Region/TextLine/Word, resp.
+            max_errors (integer): Stop validating after this many errors. Default: ``None`` (all errors)
+            cache (:class:`ValidationCache`): Reuse the report of an earlier validation of the same
+                                              local file with the same options. Not used with 'fix'
+                                              or ``ocrd_page``, which may differ from the file.
+                                              All errors are cached and ``max_errors`` applied afterwards.
+            xsd (string): Path to an XML Schema, e.g. :py:data:`ocrd_validators.constants.PAGE_XSD`,
+                          to validate the local file against first with :class:`PageXsdValidator`.
+                          If that fails, only its errors are reported.
 
         Returns:
             report (:class:`ValidationReport`) Report on the validity
         """
+        if cache and page_textequiv_consistency != 'fix' and not ocrd_page:
+            local_filename = ocrd_file.local_filename if ocrd_file else filename
+            if local_filename and Path(local_filename).exists():
+                options = dict(file_id=ocrd_file.ID if ocrd_file else filename,
+                               page_textequiv_consistency=page_textequiv_consistency,
+                               page_textequiv_strategy=page_textequiv_strategy,
+                               check_baseline=check_baseline, check_coords=check_coords,
+                               xsd=str(xsd) if xsd else None)
+                # cache all errors, so the report does not depend on max_errors
+                report = cache.validate('PageValidator', local_filename, options, lambda: PageValidator.validate(
+                    filename=filename, ocrd_page=ocrd_page, ocrd_file=ocrd_file,
+                    page_textequiv_consistency=page_textequiv_consistency, page_textequiv_strategy=page_textequiv_strategy,
+                    check_baseline=check_baseline, check_coords=check_coords, xsd=xsd))
+                if max_errors:
+                    del report.errors[max_errors:]
+                return report
+        if xsd:
+            local_filename = ocrd_file.local_filename if ocrd_file else filename
+            if local_filename:
+                report = PageXsdValidator.validate(local_filename, xsd=xsd, iterparse=True, max_errors=max_errors)
+                if not report.is_valid:
+                    log.info("Skipping consistency checks of '%s', which is not valid against %s", local_filename, xsd)
+                    return report
         if ocrd_page:
             page = ocrd_page
-            file_id = ocrd_page.get_pcGtsId()
+            file_id = ocrd_file.ID if ocrd_file else ocrd_page.get_pcGtsId()
         elif ocrd_file:
             page = page_from_file(ocrd_file)
             file_id = ocrd_file.ID
@@ -472,5 +582,8 @@ class PageValidator():
             raise Exception("page_textequiv_consistency level %s not implemented" % page_textequiv_consistency)
         report = ValidationReport()
         log.info("Validating input file '%s'", file_id)
-        validate_consistency(page, page_textequiv_consistency, page_textequiv_strategy, check_baseline, check_coords, report, file_id)
+        validate_consistency(page, page_textequiv_consistency, page_textequiv_strategy, check_baseline, check_coords, report, file_id,
+                             max_errors=max_errors)
+        if max_errors:
+            del report.errors[max_errors:]
         return report
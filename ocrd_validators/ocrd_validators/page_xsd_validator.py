@@ -0,0 +1,92 @@
+"""
+Validating PAGE-XML against the PAGE XML Schema, without building the
+object tree of `OcrdPage <../ocrd_models/ocrd_models.ocrd_page.html>`_.
+"""
+from os.path import abspath, exists
+from threading import local
+
+from lxml import etree
+
+from ocrd_utils import getLogger
+
+from .constants import PAGE_XSD
+from .report import ValidationReport
+
+__all__ = ['PageXsdValidator']
+
+# Compiled schemas by path, per thread because lxml keeps the error log of
+# the last validation in the XMLSchema object
+_SCHEMAS = local()
+
+def compiled_schema(xsd=PAGE_XSD):
+    """
+    Get an ``lxml.etree.XMLSchema`` for the XSD at path ``xsd``, compiled only once.
+    """
+    xsd = abspath(str(xsd))
+    schemas = _SCHEMAS.__dict__.setdefault('schemas', {})
+    if xsd not in schemas:
+        if not exists(xsd):
+            raise Exception("XML Schema %s does not exist" % xsd)
+        getLogger('ocrd.page_xsd_validator').debug("Compiling XML Schema %s", xsd)
+        schemas[xsd] = etree.XMLSchema(etree.parse(xsd))
+    return schemas[xsd]
+
+def _format_error(filename, entry):
+    if entry.line:
+        return "PAGE-XML %s line %d: %s" % (filename, entry.line, entry.message)
+    return "PAGE-XML %s: %s" % (filename, entry.message)
+
+class PageXsdValidator():
+    """
+    Validator for the structure of PAGE-XML files against the PAGE XML Schema.
+
+    Much cheaper than :py:class:`PageValidator`, so it can serve as a first
+    gate before the consistency checks.
+    """
+
+    @staticmethod
+    def validate(filename, xsd=PAGE_XSD, iterparse=False, max_errors=None):
+        """
+        Validate a PAGE-XML file against an XML Schema.
+
+        Arguments:
+            filename (string): Path to PAGE, or file object
+            xsd (string): Path to the XML Schema. Default: PAGE 2019
+            iterparse (boolean): Validate while parsing incrementally,
+                discarding each element when done, so memory use does not grow
+                with the size of the file. Messages have no line numbers then.
+            max_errors (integer): Stop validating after this many errors. Default: ``None`` (all errors)
+
+        Returns:
+            report (:class:`ValidationReport`) Report on the validity
+        """
+        schema = compiled_schema(xsd)
+        name = getattr(filename, 'name', filename)
+        report = ValidationReport()
+        if iterparse:
+            context = etree.iterparse(filename, events=('end',), schema=schema)
+            try:
+                for _, elem in context:
+                    if max_errors and len(context.error_log.filter_from_errors()) >= max_errors:
+                        break
+                    elem.clear()
+                    # also drop the references from the parent
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+            except etree.XMLSyntaxError as e:
+                if not context.error_log.filter_from_errors():
+                    report.add_error("PAGE-XML %s: %s" % (name, e))
+            errors = context.error_log.filter_from_errors()
+        else:
+            try:
+                doc = etree.parse(filename)
+            except etree.XMLSyntaxError as e:
+                report.add_error("PAGE-XML %s: %s" % (name, e))
+                return report
+            schema.validate(doc)
+            errors = schema.error_log.filter_from_errors()
+        for entry in errors:
+            if max_errors and len(report.errors) >= max_errors:
+                break
+            report.add_error(_format_error(name, entry))
+        return report
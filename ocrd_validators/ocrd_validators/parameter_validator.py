@@ -27,19 +27,15 @@ class ParameterValidator(JsonValidator):
         Construct a ParameterValidator.
 
         Arguments:
-            ocrd_tool (dict): Parsed ``ocrd-tool.json``.
+            ocrd_tool (dict): Parsed ``ocrd-tool.json``. Not modified.
         """
         required = []
-        if ocrd_tool is None:
-            ocrd_tool = {}
-        if 'parameters' not in ocrd_tool:
-            ocrd_tool['parameters'] = {}
-        p = ocrd_tool['parameters']
-        for n in p:
-            if 'required' in p[n]:
-                if p[n]['required']:
-                    required.append(n)
-                del(p[n]['required'])
+        p = {}
+        for n, param in (ocrd_tool or {}).get('parameters', {}).items():
+            if param.get('required'):
+                required.append(n)
+            # JSON schema draft 4 has no boolean 'required' in the property itself
+            p[n] = dict((k, v) for k, v in param.items() if k != 'required')
         super(ParameterValidator, self).__init__({
             "type": "object",
             "required": required,
@@ -1,7 +1,13 @@
 """
 Validation report with messages of different levels of severity.
 """
-__all__ = ['ValidationReport']
+import json
+from xml.sax.saxutils import escape
+
+__all__ = ['ValidationReport', 'StreamingValidationReport']
+
+# Levels of severity, in the order they are serialized
+LEVELS = ['warning', 'error', 'notice']
 
 #
 # -------------------------------------------------
@@ -25,14 +31,14 @@ class ValidationReport(object):
         Serialize to string.
         """
         ret = 'OK' if self.is_valid else 'INVALID'
-        if not self.is_valid or self.notices:
+        if not self.is_valid or self.count('notice'):
             ret += '['
-            if self.warnings:
-                ret += ' %s warnings' % len(self.warnings)
-            if self.errors:
-                ret += ' %s errors' % len(self.errors)
-            if self.notices:
-                ret += ' %s notices' % len(self.notices)
+            if self.count('warning'):
+                ret += ' %s warnings' % self.count('warning')
+            if self.count('error'):
+                ret += ' %s errors' % self.count('error')
+            if self.count('notice'):
+                ret += ' %s notices' % self.count('notice')
             ret += ' ]'
         return ret
 
@@ -41,17 +47,24 @@ class ValidationReport(object):
         """
         Whether the report contains neither errors nor warnings.
         """
-        return not self.warnings and not self.errors
+        return not self.count('warning') and not self.count('error')
+
+    def count(self, level):
+        """
+        Number of messages of ``level`` (``'notice'``, ``'warning'`` or ``'error'``).
+        """
+        return len(self.__dict__[level + 's'])
 
     def to_xml(self):
         """
         Serialize to XML.
         """
-        body = ''
-        for k in ['warning', 'error', 'notice']:
+        lines = ['<report valid="%s">' % ("true" if self.is_valid else "false")]
+        for k in LEVELS:
             for msg in self.__dict__[k + 's']:
-                body += '\n  <%s>%s</%s>' % (k, msg, k)
-        return '<report valid="%s">%s\n</report>' % ("true" if self.is_valid else "false", body)
+                lines.append('  <%s>%s</%s>' % (k, msg, k))
+        lines.append('</report>')
+        return '\n'.join(lines)
 
     def add_warning(self, msg):
         """
@@ -78,3 +91,98 @@ class ValidationReport(object):
         self.notices += otherself.notices
         self.warnings += otherself.warnings
         self.errors += otherself.errors
+
+class StreamingValidationReport(ValidationReport):
+    """
+    Report that writes every message to a stream as soon as it is added,
+    only keeping the number of messages per level in memory.
+
+    With format ``jsonl``, every message is a JSON object with ``level`` and
+    ``message`` (and ``file_id`` for messages about a PAGE-XML file) on a
+    line of its own. With format ``xml``, every message is an element of
+    ``<report>`` like in :py:meth:`ValidationReport.to_xml`.
+
+    :py:meth:`close` writes a summary of the counts, as a last JSON line
+    or as ``<summary>`` element at the end of ``<report>``.
+
+    Errors beyond ``max_errors`` are neither written nor counted.
+    """
+
+    def __init__(self, stream, format='jsonl', max_errors=None): # pylint: disable=redefined-builtin
+        """
+        Create a new StreamingValidationReport.
+
+        Args:
+            stream (file-like): Text stream to write messages to
+            format ("jsonl"|"xml"): Serialization of the messages
+            max_errors (integer): Drop errors after this many
+        """
+        super().__init__()
+        if format not in ('jsonl', 'xml'):
+            raise ValueError("Unknown report format '%s'" % format)
+        self.stream = stream
+        self.format = format
+        self.max_errors = max_errors
+        self.counts = dict((level, 0) for level in LEVELS)
+        if format == 'xml':
+            self.stream.write('<report>\n')
+
+    def count(self, level):
+        return self.counts[level]
+
+    def to_xml(self):
+        """
+        Serialize the counts to XML. The messages themselves are only in the stream.
+        """
+        return '<report valid="%s">\n  <summary warnings="%d" errors="%d" notices="%d"/>\n</report>' % (
+            "true" if self.is_valid else "false", self.counts['warning'], self.counts['error'], self.counts['notice'])
+
+    def _write(self, level, msg):
+        if level == 'error' and self.max_errors is not None and self.counts['error'] >= self.max_errors:
+            return
+        self.counts[level] += 1
+        if self.format == 'jsonl':
+            obj = {'level': level, 'message': str(msg)}
+            if getattr(msg, 'file_id', None):
+                obj['file_id'] = msg.file_id
+            self.stream.write(json.dumps(obj) + '\n')
+        else:
+            self.stream.write('  <%s>%s</%s>\n' % (level, escape(str(msg)), level))
+
+    def add_warning(self, msg):
+        self._write('warning', msg)
+
+    def add_error(self, msg):
+        self._write('error', msg)
+
+    def add_notice(self, msg):
+        self._write('notice', msg)
+
+    def merge_report(self, otherself):
+        """
+        Write the messages of another report, in the order of :py:meth:`ValidationReport.to_xml`.
+
+        Another :py:class:`StreamingValidationReport` has already written its
+        messages to its own stream, so only its counts are added.
+        """
+        if not isinstance(otherself, StreamingValidationReport):
+            for level in LEVELS:
+                for msg in otherself.__dict__[level + 's']:
+                    self._write(level, msg)
+        else:
+            for level in LEVELS:
+                count = otherself.counts[level]
+                if level == 'error' and self.max_errors is not None:
+                    count = min(count, max(0, self.max_errors - self.counts['error']))
+                self.counts[level] += count
+
+    def close(self):
+        """
+        Write the summary.
+        """
+        if self.format == 'jsonl':
+            self.stream.write(json.dumps(dict(valid=self.is_valid, **self.counts)) + '\n')
+        else:
+            self.stream.write('  <summary valid="%s" warnings="%d" errors="%d" notices="%d"/>\n</report>\n' % (
+                "true" if self.is_valid else "false", self.counts['warning'], self.counts['error'], self.counts['notice']))
+        self.stream.flush()
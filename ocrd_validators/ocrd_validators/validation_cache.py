@@ -0,0 +1,115 @@
+"""
+On-disk cache of validation results for unchanged files.
+"""
+import os
+import json
+from hashlib import sha256
+from pathlib import Path
+from uuid import uuid4
+
+from ocrd_utils import getLogger, VERSION
+
+from .constants import VALIDATION_CACHE_DIR
+from .report import ValidationReport, LEVELS
+from .page_validator import ConsistencyError, CoordinateConsistencyError, CoordinateValidityError
+
+__all__ = ['ValidationCache']
+
+# Bytes read at once for hashing file content
+HASH_BLOCK_SIZE = 2 ** 20
+
+# Messages restored as exceptions with their constructor arguments, by class name
+MESSAGE_CLASSES = dict((cls.__name__, cls) for cls in [ConsistencyError, CoordinateConsistencyError, CoordinateValidityError])
+
+def _dump_message(msg):
+    if type(msg) in MESSAGE_CLASSES.values(): # pylint: disable=unidiomatic-typecheck
+        return {'type': type(msg).__name__, 'args': list(msg.__reduce__()[1])}
+    return str(msg)
+
+def _load_message(obj):
+    if isinstance(obj, dict):
+        return MESSAGE_CLASSES[obj['type']](*obj['args'])
+    return obj
+
+class ValidationCache():
+    """
+    Cache of :py:class:`ValidationReport` per file content.
+
+    Reports are keyed by the SHA-256 of the file's content, the name of the
+    check, the OCR-D/core version and the options of the check,
+    so changing any of them validates the file again. Only options that the
+    check's result depends on (including IDs that appear in the messages)
+    must be passed.
+
+    Reports are stored as JSON, so reading a cache shared with others cannot
+    execute code. Messages are stored as strings, except for the consistency
+    errors of :py:class:`PageValidator`, which are restored with their
+    constructor arguments.
+
+    The cache only holds the directory, so it can be passed to worker
+    processes.
+
+    Args:
+        directory (string): Directory of the cache
+    """
+
+    def __init__(self, directory=VALIDATION_CACHE_DIR):
+        self.directory = str(directory)
+
+    def __repr__(self):
+        return '<ValidationCache %s>' % self.directory
+
+    def key(self, check, filename, options):
+        """
+        Cache key for validating the current content of ``filename`` with ``check`` and ``options``.
+        """
+        content_hash = sha256()
+        with open(str(filename), 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                content_hash.update(block)
+        return sha256(json.dumps([check, VERSION, content_hash.hexdigest(), options],
+                                 sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return Path(self.directory, key[:2], '%s.json' % key)
+
+    def get(self, key):
+        """
+        Get the report for ``key``, or ``None`` if not cached.
+        """
+        try:
+            with open(str(self._path(key)), 'r', encoding='utf-8') as f:
+                obj = json.load(f)
+            report = ValidationReport()
+            for level in LEVELS:
+                report.__dict__[level + 's'] = [_load_message(msg) for msg in obj[level + 's']]
+            return report
+        except Exception: # pylint: disable=broad-except
+            return None
+
+    def put(self, key, report):
+        """
+        Store ``report`` for ``key``.
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name('%s.%s' % (path.name, uuid4().hex))
+        with open(str(tmp_path), 'w', encoding='utf-8') as f:
+            json.dump(dict((level + 's', [_dump_message(msg) for msg in report.__dict__[level + 's']])
+                           for level in LEVELS), f, default=str)
+        os.replace(str(tmp_path), str(path))
+
+    def validate(self, check, filename, options, fn):
+        """
+        Return the report of ``check`` with ``options`` on ``filename`` from
+        the cache, or compute it with ``fn()`` and store it, if the content
+        of ``filename`` has not been validated with them before.
+        """
+        key = self.key(check, filename, options)
+        report = self.get(key)
+        if report is not None:
+            getLogger('ocrd.validation_cache').debug("Cached %s of %s", check, filename)
+            return report
+        report = fn()
+        self.put(key, report)
+        return report
@@ -2,19 +2,34 @@
 Validating a workspace.
 """
 import re
+from collections import OrderedDict
 from traceback import format_exc
 from pathlib import Path
 from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 
 from ocrd_utils import getLogger, MIMETYPE_PAGE, pushd_popd, is_local_filename
+from ocrd_models import OcrdFile
 from ocrd_modelfactory import page_from_file
 
 from .constants import FILE_GROUP_CATEGORIES, FILE_GROUP_PREFIX
-from .report import ValidationReport
+from .report import ValidationReport, StreamingValidationReport
 from .page_validator import PageValidator
 
 log = getLogger('ocrd.workspace_validator')
 
+# Checks of each mets:file, in the order they are reported
+FILE_CHECKS = ['mets_files', 'pixel_density', 'multipage', 'dimension', 'imagefilename', 'page']
+
+def _validate_page_file(args):
+    """
+    Validate a single PAGE-XML file in a worker process of :py:meth:`WorkspaceValidator._validate_page`.
+    """
+    file_id, filename, kwargs = args
+    ocrd_file = OcrdFile(None, local_filename=filename, mimetype=MIMETYPE_PAGE)
+    ocrd_file.ID = file_id
+    return PageValidator.validate(ocrd_file=ocrd_file, **kwargs)
+
 #
 # -------------------------------------------------
 #
@@ -25,10 +40,13 @@ class WorkspaceValidator():
     """
 
     @staticmethod
-    def check_file_grp(workspace, input_file_grp=None, output_file_grp=None, report=None):
+    def check_file_grp(workspace, input_file_grp=None, output_file_grp=None, report=None, page_id=None):
         """
         Return a report on whether input_file_grp is/are in workspace.mets and output_file_grp is/are not.
         To be run before processing
+
+        If page_id is given, output_file_grp may already exist as long as it
+        has no files for any of those pages.
         """
         if not report:
             report = ValidationReport()
@@ -36,20 +54,27 @@ class WorkspaceValidator():
             input_file_grp = input_file_grp.split(',')
         if isinstance(output_file_grp, str):
             output_file_grp = output_file_grp.split(',')
+        if isinstance(page_id, str):
+            page_id = page_id.split(',')
 
-        log.info("input_file_grp=%s output_file_grp=%s" % (input_file_grp, output_file_grp))
+        log.info("input_file_grp=%s output_file_grp=%s page_id=%s" % (input_file_grp, output_file_grp, page_id))
         if input_file_grp:
             for grp in input_file_grp:
                 if grp not in workspace.mets.file_groups:
                     report.add_error("Input fileGrp[@USE='%s'] not in METS!" % grp)
         if output_file_grp:
             for grp in output_file_grp:
-                if grp in workspace.mets.file_groups:
+                if grp not in workspace.mets.file_groups:
+                    continue
+                if page_id is None:
                     report.add_error("Output fileGrp[@USE='%s'] already in METS!" % grp)
+                elif page_id and workspace.mets.find_files(fileGrp=grp, pageId=','.join(page_id)):
+                    report.add_error("Output fileGrp[@USE='%s'] already has files for page(s) %s in METS!" % (grp, ','.join(page_id)))
         return report
 
     def __init__(self, resolver, mets_url, src_dir=None, skip=None, download=False,
-                 page_strictness='strict', page_coordinate_consistency='poly'):
+                 page_strictness='strict', page_coordinate_consistency='poly', jobs=1,
+                 max_errors=None, report=None, cache=None, page_xsd=None):
         """
         Construct a new WorkspaceValidator.
 
@@ -61,8 +86,16 @@ class WorkspaceValidator():
             download (boolean):
             page_strictness ("strict"|"lax"|"fix"|"off"):
             page_coordinate_consistency ("poly"|"baseline"|"both"|"off"):
+            jobs (integer): Number of processes validating PAGE-XML files in parallel
+            max_errors (integer): Stop validating after this many errors
+            report (ValidationReport): Report to add to, e.g. a
+                :py:class:`StreamingValidationReport`. Default: A new one
+            cache (ValidationCache): Reuse results of the image and PAGE-XML
+                checks for files whose content has been validated before
+            page_xsd (string): Path to an XML Schema to validate PAGE-XML
+                files against before checking their consistency
         """
-        self.report = ValidationReport()
+        self.report = report if report else ValidationReport()
         self.skip = skip if skip else []
         log.debug('resolver=%s mets_url=%s src_dir=%s', resolver, mets_url, src_dir)
         self.resolver = resolver
@@ -72,10 +105,19 @@ class WorkspaceValidator():
         self.download = download
         self.page_strictness = page_strictness
         self.page_coordinate_consistency = page_coordinate_consistency
+        self.jobs = jobs
+        self.max_errors = max_errors
+        if max_errors and isinstance(self.report, StreamingValidationReport) and self.report.max_errors is None:
+            # errors are written as they are found, so only the report can drop the excess
+            self.report.max_errors = max_errors
+        self.cache = cache
+        self.page_xsd = page_xsd
 
         self.src_dir = src_dir
         self.workspace = None
         self.mets = None
+        self._exifs = {}
+        self._pcgts = None
 
     @staticmethod
     def validate(*args, **kwargs):
@@ -88,6 +130,14 @@ class WorkspaceValidator():
             src_dir (string, None): Directory containing mets file
             skip (list): Tests to skip. One or more of 'mets_unique_identifier', 'mets_file_group_names', 'mets_files', 'pixel_density', 'dimension', 'url'
             download (boolean): Whether to download files
+            jobs (integer): Number of processes validating PAGE-XML files in parallel
+            max_errors (integer): Stop validating after this many errors. Default: ``None`` (all errors)
+            report (:class:`ValidationReport`): Report to add to, e.g. a
+                :class:`StreamingValidationReport`. Default: A new one
+            cache (:class:`ValidationCache`): Reuse results of the image and PAGE-XML checks
+                for files whose content has been validated before
+            page_xsd (string): Path to an XML Schema, e.g. ``PAGE_XSD``, to validate PAGE-XML
+                files against before checking their consistency
 
         Returns:
             report (:class:`ValidationReport`) Report on the validity
@@ -111,22 +161,127 @@ class WorkspaceValidator():
                     self._validate_mets_unique_identifier()
                 if 'mets_file_group_names' not in self.skip:
                     self._validate_mets_file_group_names()
-                if 'mets_files' not in self.skip:
-                    self._validate_mets_files()
-                if 'pixel_density' not in self.skip:
-                    self._validate_pixel_density()
-                if 'multipage' not in self.skip:
-                    self._validate_multipage()
-                if 'dimension' not in self.skip:
-                    self._validate_dimension()
-                if 'imagefilename' not in self.skip:
-                    self._validate_imagefilename()
-                if 'page' not in self.skip:
-                    self._validate_page()
+                self._validate_files()
             except Exception:
                 self.report.add_error("Validation aborted with exception: %s" % format_exc())
+        if self.max_errors:
+            del self.report.errors[self.max_errors:]
         return self.report
 
+    def _remaining_errors(self, reports=()):
+        """
+        Number of errors that may still be reported before reaching
+        ``max_errors``, counting the errors in ``reports`` that are not merged
+        yet, or ``None`` without limit.
+        """
+        if not self.max_errors:
+            return None
+        return max(0, self.max_errors - sum(report.count('error') for report in set(reports) | {self.report}))
+
+    def _validate_files(self):
+        """
+        Run all checks of ``mets:file`` that are not skipped in a single pass over the METS.
+
+        Each image is probed and each PAGE-XML parsed at most once for all
+        checks. The messages are reported check by check, in the order of
+        ``FILE_CHECKS``. A :py:class:`StreamingValidationReport` gets the
+        messages as they occur instead, in the order of the files.
+
+        With ``max_errors``, stops checking files as soon as the error budget
+        is used up.
+        """
+        streaming = isinstance(self.report, StreamingValidationReport)
+        reports = OrderedDict((check, self.report if streaming else ValidationReport())
+                              for check in FILE_CHECKS if check not in self.skip)
+        self._exifs = {}
+        page_jobs = []
+        try:
+            files = self.mets.find_files()
+            if 'mets_files' in reports and not files:
+                reports['mets_files'].add_error("No files")
+            for f in files:
+                if self._remaining_errors(reports.values()) == 0:
+                    log.info("Reached %d errors, skipping remaining files", self.max_errors)
+                    break
+                self._pcgts = None
+                if 'mets_files' in reports:
+                    self._validate_mets_file(f, reports['mets_files'])
+                if f.mimetype.startswith('image/'):
+                    if 'pixel_density' in reports:
+                        self._validate_cached('pixel_density', f, reports['pixel_density'])
+                    if 'multipage' in reports:
+                        self._validate_cached('multipage', f, reports['multipage'])
+                elif f.mimetype == MIMETYPE_PAGE:
+                    if 'dimension' in reports:
+                        self._validate_dimension(f, reports['dimension'])
+                    if 'imagefilename' in reports:
+                        self._validate_imagefilename(f, reports['imagefilename'])
+                    if 'page' in reports and is_local_filename(f.url):
+                        if self.jobs > 1 or self.cache or self.page_xsd:
+                            # workers, the cache and the XSD read the local file
+                            self.workspace.download_file(f)
+                        if self.jobs > 1:
+                            page_jobs.append((f.ID, str(Path(self.workspace.directory, f.local_filename)), self._page_validator_kwargs()))
+                        else:
+                            self._validate_page(f, reports['page'])
+            if page_jobs:
+                with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+                    if self.max_errors:
+                        # submit one by one to cancel the rest once the budget is used up
+                        futures = [pool.submit(_validate_page_file, job) for job in page_jobs]
+                        for future in futures:
+                            if self._remaining_errors(reports.values()) == 0:
+                                future.cancel()
+                            else:
+                                reports['page'].merge_report(future.result())
+                    else:
+                        for page_report in pool.map(_validate_page_file, page_jobs, chunksize=max(1, len(page_jobs) // (self.jobs * 4))):
+                            reports['page'].merge_report(page_report)
+        finally:
+            for report in reports.values():
+                if report is not self.report:
+                    self.report.merge_report(report)
+
+    def _resolve_image_exif(self, image_url):
+        """
+        Probe image ``image_url``, only once for all checks.
+        """
+        if image_url not in self._exifs:
+            self._exifs[image_url] = self.workspace.resolve_image_exif(image_url)
+        return self._exifs[image_url]
+
+    def _parse_page(self, f):
+        """
+        Parse PAGE-XML file ``f``, only once for all checks.
+        """
+        if self._pcgts is None:
+            with self.workspace.open_file(f, whole=True) as page_file:
+                self._pcgts = page_from_file(f, fileobj=page_file)
+        return self._pcgts
+
+    def _page_validator_kwargs(self):
+        return dict(page_textequiv_consistency=self.page_strictness,
+                    check_coords=self.page_coordinate_consistency in ['poly', 'both'],
+                    check_baseline=self.page_coordinate_consistency in ['baseline', 'both'],
+                    max_errors=self.max_errors,
+                    cache=self.cache,
+                    xsd=self.page_xsd)
+
+    def _validate_cached(self, check, f, report):
+        """
+        Run file check ``check`` on ``f``, reusing the result for unchanged
+        local files from ``cache``.
+        """
+        validate_fn = getattr(self, '_validate_%s' % check)
+        if not self.cache or not f.local_filename or not Path(f.local_filename).exists():
+            validate_fn(f, report)
+            return
+        def validate_file():
+            file_report = ValidationReport()
+            validate_fn(f, file_report)
+            return file_report
+        report.merge_report(self.cache.validate('WorkspaceValidator.%s' % check, f.local_filename, {'file_id': f.ID}, validate_file))
+
     def _resolve_workspace(self):
         """
         Clone workspace from mets_url unless workspace was provided.
@@ -144,66 +299,60 @@ class WorkspaceValidator():
         if self.mets.unique_identifier is None:
             self.report.add_error("METS has no unique identifier")
 
-    def _validate_imagefilename(self):
+    def _validate_imagefilename(self, f, report):
         """
         Validate that the imageFilename is correctly set to a filename relative to the workspace
         """
-        for f in self.mets.find_files(mimetype=MIMETYPE_PAGE):
-            if not f.local_filename and not self.download:
-                self.report.add_notice("Won't download remote PAGE XML <%s>" % f.url)
-                continue
-            self.workspace.download_file(f)
-            page = page_from_file(f).get_Page()
-            imageFilename = page.imageFilename
-            if not self.mets.find_files(url=imageFilename):
-                self.report.add_error("PAGE-XML %s : imageFilename '%s' not found in METS" % (f.url, imageFilename))
-            if is_local_filename(imageFilename) and not Path(imageFilename).exists():
-                self.report.add_warning("PAGE-XML %s : imageFilename '%s' points to non-existent local file")
+        if not f.local_filename and not self.download:
+            report.add_notice("Won't download remote PAGE XML <%s>" % f.url)
+            return
+        imageFilename = self._parse_page(f).get_Page().imageFilename
+        if not self.mets.find_files(url=imageFilename):
+            report.add_error("PAGE-XML %s : imageFilename '%s' not found in METS" % (f.url, imageFilename))
+        if is_local_filename(imageFilename) and not Path(imageFilename).exists():
+            report.add_warning("PAGE-XML %s : imageFilename '%s' points to non-existent local file")
 
-    def _validate_dimension(self):
+    def _validate_dimension(self, f, report):
         """
         Validate image height and PAGE imageHeight match
         """
-        for f in self.mets.find_files(mimetype=MIMETYPE_PAGE):
-            if not self.download:
-                self.report.add_notice("_validate_dimension: Not executed because --download wasn't set and PAGE might reference remote (Alternatve)Images <%s>" % f.url)
-                continue
-            page = page_from_file(f).get_Page()
-            _, _, exif = self.workspace.image_from_page(page, f.pageId)
-            if page.imageHeight != exif.height:
-                self.report.add_error("PAGE '%s': @imageHeight != image's actual height (%s != %s)" % (f.ID, page.imageHeight, exif.height))
-            if page.imageWidth != exif.width:
-                self.report.add_error("PAGE '%s': @imageWidth != image's actual width (%s != %s)" % (f.ID, page.imageWidth, exif.width))
+        if not self.download:
+            report.add_notice("_validate_dimension: Not executed because --download wasn't set and PAGE might reference remote (Alternatve)Images <%s>" % f.url)
+            return
+        page = self._parse_page(f).get_Page()
+        exif = self._resolve_image_exif(page.imageFilename)
+        if page.imageHeight != exif.height:
+            report.add_error("PAGE '%s': @imageHeight != image's actual height (%s != %s)" % (f.ID, page.imageHeight, exif.height))
+        if page.imageWidth != exif.width:
+            report.add_error("PAGE '%s': @imageWidth != image's actual width (%s != %s)" % (f.ID, page.imageWidth, exif.width))
 
-    def _validate_multipage(self):
+    def _validate_multipage(self, f, report):
         """
         Validate the number of images per file is 1 (TIFF allows multi-page images)
 
         See `spec <https://ocr-d.github.io/mets#no-multi-page-images>`_.
         """
-        for f in [f for f in self.mets.find_files() if f.mimetype.startswith('image/')]:
-            if not is_local_filename(f.url) and not self.download:
-                self.report.add_notice("Won't download remote image <%s>" % f.url)
-                continue
-            exif = self.workspace.resolve_image_exif(f.url)
-            if exif.n_frames > 1:
-                self.report.add_error("Image %s: More than 1 frame: %s" % (f.ID, exif.n_frames))
+        if not is_local_filename(f.url) and not self.download:
+            report.add_notice("Won't download remote image <%s>" % f.url)
+            return
+        exif = self._resolve_image_exif(f.url)
+        if exif.n_frames > 1:
+            report.add_error("Image %s: More than 1 frame: %s" % (f.ID, exif.n_frames))
 
-    def _validate_pixel_density(self):
+    def _validate_pixel_density(self, f, report):
         """
         Validate image pixel density
 
         See `spec <https://ocr-d.github.io/mets#pixel-density-of-images-must-be-explicit-and-high-enough>`_.
         """
-        for f in [f for f in self.mets.find_files() if f.mimetype.startswith('image/')]:
-            if not is_local_filename(f.url) and not self.download:
-                self.report.add_notice("Won't download remote image <%s>" % f.url)
-                continue
-            exif = self.workspace.resolve_image_exif(f.url)
-            for k in ['xResolution', 'yResolution']:
-                v = exif.__dict__.get(k)
-                if v is None or v <= 72:
-                    self.report.add_notice("Image %s: %s (%s pixels per %s) is suspiciously low" % (f.ID, k, v, exif.resolutionUnit))
+        if not is_local_filename(f.url) and not self.download:
+            report.add_notice("Won't download remote image <%s>" % f.url)
+            return
+        exif = self._resolve_image_exif(f.url)
+        for k in ['xResolution', 'yResolution']:
+            v = exif.__dict__.get(k)
+            if v is None or v <= 72:
+                report.add_notice("Image %s: %s (%s pixels per %s) is suspiciously low" % (f.ID, k, v, exif.resolutionUnit))
 
     def _validate_mets_file_group_names(self):
         """
@@ -229,35 +378,35 @@ class WorkspaceValidator():
                 if name is not None and not re.match(r'^[A-Z0-9-]{3,}$', name):
                     self.report.add_warning("Invalid USE name '%s' in fileGrp '%s'" % (name, fileGrp))
 
-    def _validate_mets_files(self):
+    def _validate_mets_file(self, f, report):
         """
         Validate ``mets:file`` URLs are sane.
         """
-        if not self.mets.find_files():
-            self.report.add_error("No files")
-        for f in self.mets.find_files():
-            if f._el.get('GROUPID'): # pylint: disable=protected-access
-                self.report.add_notice("File '%s' has GROUPID attribute - document might need an update" % f.ID)
-            if not f.pageId:
-                self.report.add_error("File '%s' does not manifest any physical page." % f.ID)
-            if not f.url:
-                self.report.add_error("File '%s' has no mets:Flocat/@xlink:href" % f.ID)
-                continue
-            if 'url' not in self.skip and ':/' in f.url:
-                if re.match(r'^file:/[^/]', f.url):
-                    self.report.add_error("File '%s' has an invalid (Java-specific) file URL '%s'" % (f.ID, f.url))
-                scheme = f.url[0:f.url.index(':')]
-                if scheme not in ('http', 'https', 'file'):
-                    self.report.add_warning("File '%s' has non-HTTP, non-file URL '%s'" % (f.ID, f.url))
-
-    def _validate_page(self):
-        """
-        Run PageValidator on the PAGE-XML documents referenced in the METS.
-        """
-        for ocrd_file in self.mets.find_files(mimetype=MIMETYPE_PAGE, local_only=True):
-            self.workspace.download_file(ocrd_file)
-            page_report = PageValidator.validate(ocrd_file=ocrd_file,
-                                                 page_textequiv_consistency=self.page_strictness,
-                                                 check_coords=self.page_coordinate_consistency in ['poly', 'both'],
-                                                 check_baseline=self.page_coordinate_consistency in ['baseline', 'both'])
-            self.report.merge_report(page_report)
+        if f._el.get('GROUPID'): # pylint: disable=protected-access
+            report.add_notice("File '%s' has GROUPID attribute - document might need an update" % f.ID)
+        if not f.pageId:
+            report.add_error("File '%s' does not manifest any physical page." % f.ID)
+        if not f.url:
+            report.add_error("File '%s' has no mets:Flocat/@xlink:href" % f.ID)
+            return
+        if 'url' not in self.skip and ':/' in f.url:
+            if re.match(r'^file:/[^/]', f.url):
+                report.add_error("File '%s' has an invalid (Java-specific) file URL '%s'" % (f.ID, f.url))
+            scheme = f.url[0:f.url.index(':')]
+            if scheme not in ('http', 'https', 'file'):
+                report.add_warning("File '%s' has non-HTTP, non-file URL '%s'" % (f.ID, f.url))
+
+    def _validate_page(self, f, report):
+        """
+        Run PageValidator on a PAGE-XML document referenced in the METS.
+
+        With more than one job, the documents are validated in a process pool
+        instead, see :py:meth:`_validate_files`.
+        """
+        kwargs = self._page_validator_kwargs()
+        if self.max_errors:
+            kwargs['max_errors'] = self._remaining_errors([report])
+        # with a cache or XSD, unchanged or invalid files need not be parsed at all
+        # (and the cache only applies to the file itself)
+        ocrd_page = None if self.cache else self._pcgts if self.page_xsd else self._parse_page(f)
+        report.merge_report(PageValidator.validate(ocrd_page=ocrd_page, ocrd_file=f, **kwargs))
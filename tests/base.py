@@ -6,6 +6,12 @@ import sys
 import logging
 import io
 import collections
+from contextlib import contextmanager
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from threading import Thread
+from posixpath import normpath
+from urllib.parse import unquote, urlsplit
 from unittest import TestCase as VanillaTestCase, skip, main
 from ocrd_utils import initLogging
 
@@ -20,6 +26,34 @@ class TestCase(VanillaTestCase):
     def tearDown(self):
         initLogging()
 
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    # set by serve_directory
+    serve_root = None
+
+    def translate_path(self, path):
+        return dirname(self.serve_root + '/') + normpath('/' + unquote(urlsplit(path).path))
+
+    def log_message(self, *args): # pylint: disable=arguments-differ
+        pass
+
+@contextmanager
+def serve_directory(directory, handler_class=QuietHTTPRequestHandler):
+    """
+    Serve directory over HTTP on localhost in a background thread, yield the base URL.
+    """
+    handler = type(handler_class.__name__, (handler_class,), {'serve_root': str(directory)})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:%d' % server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
 #  import traceback
 #  import warnings
 #  def warn_with_traceback(message, category, filename, lineno, file=None, line=None):
@@ -11,6 +11,7 @@ from ocrd_utils import pushd_popd
 from ocrd.resolver import Resolver
 
 from ocrd.cli.validate import validate_cli
+from tests.validator.test_workspace_validator import PAGE_TEMPLATE
 from tests.test_task_sequence import TestTaskSequence
 
 OCRD_TOOL = '''
@@ -86,6 +87,35 @@ class TestCli(TestTaskSequence):
         self.assertEqual(result.exit_code, 1)
         self.assertIn('<report valid="false">', result.stdout)
 
+    def test_validate_batch(self):
+        with TemporaryDirectory() as tempdir:
+            for n in range(5):
+                Path(tempdir, 'page', 'sub' if n > 2 else '').mkdir(parents=True, exist_ok=True)
+                Path(tempdir, 'page', 'sub' if n > 2 else '', 'PAGE_%d.xml' % n).write_text(
+                    PAGE_TEMPLATE % {'id': 'PAGE_%d' % n, 'text': 'foo' if n % 2 else 'bar'})
+            Resolver().workspace_from_nothing(directory=str(Path(tempdir, 'ws')))
+            with pushd_popd(tempdir):
+                result = self.runner.invoke(validate_cli, ['batch', 'page/**/*.xml', 'ws', 'missing.xml'])
+                self.assertEqual(result.exit_code, 1)
+                results = [loads(line) for line in result.stdout.splitlines()]
+                self.assertEqual([(r['path'], r['valid']) for r in results], [
+                    ('page/PAGE_0.xml', False),
+                    ('page/PAGE_1.xml', True),
+                    ('page/PAGE_2.xml', False),
+                    ('page/sub/PAGE_3.xml', True),
+                    ('page/sub/PAGE_4.xml', False),
+                    ('ws', False),
+                    ('missing.xml', False),
+                ])
+                self.assertEqual(results[0]['type'], 'page')
+                self.assertIn("text results 'foo' != concatenated 'bar'", results[0]['errors'][0])
+                self.assertEqual(results[5]['type'], 'workspace')
+                self.assertIn('No such file or directory', results[6]['errors'][0])
+                # paths from STDIN, in a pool
+                result = self.runner.invoke(validate_cli, ['batch', '-j', '2', '-'], input='page/PAGE_1.xml\npage/sub/PAGE_3.xml\n')
+                self.assertEqual(result.exit_code, 0)
+                self.assertEqual([loads(line)['path'] for line in result.stdout.splitlines()], ['page/PAGE_1.xml', 'page/sub/PAGE_3.xml'])
+
     def test_validate_tasks(self):
         # simple
         result = self.runner.invoke(validate_cli, ['tasks',
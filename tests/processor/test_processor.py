@@ -1,11 +1,15 @@
 import json
+import os
 
 from tempfile import TemporaryDirectory
 from os.path import join
 from tests.base import TestCase, assets, main # pylint: disable=import-error, no-name-in-module
 
 from ocrd.resolver import Resolver
-from ocrd.processor.base import Processor, run_processor, run_cli
+from ocrd.decorators import ocrd_cli_wrap_processor
+from ocrd.processor import base as processor_base
+from ocrd.processor.base import Processor, run_processor, run_cli, find_stale_pages, profile_path, read_profile, aggregate_profile
+from ocrd.cli.dummy_processor import DummyProcessor as CopyingProcessor
 
 DUMMY_TOOL = {
     'executable': 'ocrd-test',
@@ -121,5 +125,108 @@ class TestProcessor(TestCase):
                 resolver=Resolver(),
             )
 
+class TestIncremental(TestCase):
+
+    def test_find_stale_pages(self):
+        with TemporaryDirectory() as tempdir:
+            workspace = Resolver().workspace_from_nothing(directory=tempdir)
+            for n in range(1, 4):
+                workspace.add_file('OCR-D-IMG', ID='IMG_%d' % n, pageId='PHYS_%d' % n, mimetype='image/tiff',
+                                   local_filename='OCR-D-IMG/IMG_%d.tif' % n, content='img%d' % n)
+            self.assertEqual(find_stale_pages(workspace, 'OCR-D-IMG', 'OUT'), ['PHYS_1', 'PHYS_2', 'PHYS_3'])
+            self.assertEqual(find_stale_pages(workspace, 'OCR-D-IMG', 'OUT', page_id='PHYS_2,PHYS_3'), ['PHYS_2', 'PHYS_3'])
+
+            processor = run_processor(CopyingProcessor, workspace=workspace, page_id='PHYS_1,PHYS_2',
+                                      input_file_grp='OCR-D-IMG', output_file_grp='OUT')
+            self.assertEqual(processor.page_id, 'PHYS_1,PHYS_2')
+            self.assertEqual(find_stale_pages(workspace, 'OCR-D-IMG', 'OUT'), ['PHYS_3'])
+            self.assertEqual(find_stale_pages(workspace, 'OCR-D-IMG', 'OUT,OUT2'), ['PHYS_1', 'PHYS_2', 'PHYS_3'])
+
+            # an input file newer than the output makes the page stale only when comparing mtimes
+            os.utime(join(tempdir, 'OUT', 'IMG_1.tif'), (0, 0))
+            self.assertEqual(find_stale_pages(workspace, 'OCR-D-IMG', 'OUT'), ['PHYS_3'])
+            self.assertEqual(find_stale_pages(workspace, 'OCR-D-IMG', 'OUT', compare='mtime'), ['PHYS_1', 'PHYS_3'])
+
+    def test_run_processor_incremental(self):
+        with TemporaryDirectory() as tempdir:
+            workspace = Resolver().workspace_from_nothing(directory=tempdir)
+            for n in range(1, 4):
+                workspace.add_file('OCR-D-IMG', ID='IMG_%d' % n, pageId='PHYS_%d' % n, mimetype='image/tiff',
+                                   local_filename='OCR-D-IMG/IMG_%d.tif' % n, content='img%d' % n)
+            run_processor(CopyingProcessor, workspace=workspace, page_id='PHYS_2', input_file_grp='OCR-D-IMG', output_file_grp='OUT')
+            processor = run_processor(CopyingProcessor, workspace=workspace, incremental='exists',
+                                      input_file_grp='OCR-D-IMG', output_file_grp='OUT')
+            self.assertEqual(processor.page_id, 'PHYS_1,PHYS_3')
+            self.assertEqual(len(workspace.mets.find_files(fileGrp='OUT')), 3)
+            self.assertIsNone(run_processor(CopyingProcessor, workspace=workspace, incremental='exists',
+                                            input_file_grp='OCR-D-IMG', output_file_grp='OUT'))
+
+            # an input newer than its output is processed again, replacing the output
+            os.utime(join(tempdir, 'OUT', 'IMG_1.tif'), (0, 0))
+            processor = run_processor(CopyingProcessor, workspace=workspace, incremental='mtime',
+                                      input_file_grp='OCR-D-IMG', output_file_grp='OUT')
+            self.assertEqual(processor.page_id, 'PHYS_1')
+            self.assertEqual(len(workspace.mets.find_files(fileGrp='OUT')), 3)
+            self.assertGreater(os.stat(join(tempdir, 'OUT', 'IMG_1.tif')).st_mtime, 0)
+
+    def test_cli_wrap_processor_incremental_mtime(self):
+        with TemporaryDirectory() as tempdir:
+            workspace = Resolver().workspace_from_nothing(directory=tempdir)
+            for n in range(1, 3):
+                workspace.add_file('OCR-D-IMG', ID='IMG_%d' % n, pageId='PHYS_%d' % n, mimetype='image/tiff',
+                                   local_filename='OCR-D-IMG/IMG_%d.tif' % n, content='img%d' % n)
+            run_processor(CopyingProcessor, workspace=workspace, input_file_grp='OCR-D-IMG', output_file_grp='OUT')
+            os.utime(join(tempdir, 'OUT', 'IMG_2.tif'), (0, 0))
+            ocrd_cli_wrap_processor(CopyingProcessor, mets=join(tempdir, 'mets.xml'), incremental='mtime',
+                                    input_file_grp='OCR-D-IMG', output_file_grp='OUT', page_id=None, parameter={})
+            self.assertGreater(os.stat(join(tempdir, 'OUT', 'IMG_2.tif')).st_mtime, 0)
+            workspace = Resolver().workspace_from_url(join(tempdir, 'mets.xml'))
+            self.assertEqual(len(workspace.mets.find_files(fileGrp='OUT')), 2)
+
+class TestProfile(TestCase):
+
+    def test_run_processor_profile(self):
+        for fmt in ['jsonl', 'csv']:
+            with TemporaryDirectory() as tempdir:
+                workspace = Resolver().workspace_from_nothing(directory=tempdir)
+                for n in range(1, 4):
+                    workspace.add_file('OCR-D-IMG', ID='IMG_%d' % n, pageId='PHYS_%d' % n, mimetype='image/tiff',
+                                       local_filename='OCR-D-IMG/IMG_%d.tif' % n, content='img%d' % n)
+                run_processor(CopyingProcessor, workspace=workspace, profile=fmt, page_id='PHYS_1,PHYS_3',
+                              input_file_grp='OCR-D-IMG', output_file_grp='OUT')
+                run_processor(CopyingProcessor, workspace=workspace, profile=fmt, page_id='PHYS_2',
+                              input_file_grp='OCR-D-IMG', output_file_grp='OUT')
+                self.assertEqual(len(workspace.mets.find_files(fileGrp='OUT')), 3)
+                path = profile_path(workspace, fmt)
+                self.assertEqual(path.name, 'ocrd-profile.%s' % fmt)
+                records = read_profile(path)
+                self.assertEqual([r['page_id'] for r in records], ['PHYS_1', 'PHYS_3', None, 'PHYS_2', None])
+                self.assertEqual(records[0]['executable'], 'ocrd-dummy')
+                self.assertEqual(records[0]['output_file_grp'], 'OUT')
+                self.assertGreater(records[2]['mets_save_time'], 0)
+                aggregate = aggregate_profile(records)
+                self.assertEqual(aggregate['pages'], 3)
+                self.assertEqual(aggregate['runs'], 2)
+                self.assertEqual(aggregate['wall_time'], records[2]['wall_time'] + records[4]['wall_time'])
+                self.assertGreater(aggregate['peak_rss'], 0)
+                self.assertIn(aggregate['slowest_page']['page_id'], ['PHYS_1', 'PHYS_2', 'PHYS_3'])
+
+    def test_run_processor_profile_without_resource(self):
+        # like on Windows
+        getrusage, processor_base.getrusage = processor_base.getrusage, None
+        try:
+            with TemporaryDirectory() as tempdir:
+                workspace = Resolver().workspace_from_nothing(directory=tempdir)
+                workspace.add_file('OCR-D-IMG', ID='IMG_1', pageId='PHYS_1', mimetype='image/tiff',
+                                   local_filename='OCR-D-IMG/IMG_1.tif', content='img1')
+                run_processor(CopyingProcessor, workspace=workspace, profile='jsonl',
+                              input_file_grp='OCR-D-IMG', output_file_grp='OUT')
+                records = read_profile(profile_path(workspace, 'jsonl'))
+                self.assertEqual([r['peak_rss'] for r in records], [None, None])
+                self.assertGreaterEqual(records[1]['cpu_time'], 0)
+                self.assertEqual(aggregate_profile(records)['peak_rss'], 0)
+        finally:
+            processor_base.getrusage = getrusage
+
 if __name__ == "__main__":
     main()
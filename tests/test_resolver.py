@@ -1,10 +1,24 @@
+import io
+import os
+import re
+import asyncio
+import hashlib
 from os.path import join as pjoin
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from threading import Lock
+from time import sleep, time
 
-from tests.base import TestCase, assets, main, copy_of_directory
+import requests
+from PIL import Image
+
+from tests.base import TestCase, assets, main, copy_of_directory, serve_directory, QuietHTTPRequestHandler
 
 from ocrd.resolver import Resolver
+from ocrd.download_cache import DownloadCache
+from ocrd.async_resolver import AsyncResolver
+from ocrd.remote_file import RemoteFile
+from ocrd_modelfactory import page_from_file
 from ocrd_utils import pushd_popd
 
 METS_HEROLD = assets.url_of('SBB0000F29300010000/data/mets.xml')
@@ -15,7 +29,8 @@ FOLDER_KANT = assets.path_to('kant_aufklaerung_1784')
 class TestResolver(TestCase):
 
     def setUp(self):
-        self.resolver = Resolver()
+        # don't retry requests to unreachable hosts
+        self.resolver = Resolver(retries=0)
 
     def test_workspace_from_url_bad(self):
         with self.assertRaisesRegex(Exception, "Must pass 'mets_url'"):
@@ -147,5 +162,373 @@ class TestResolver(TestCase):
                 self.assertEqual(fn, pjoin('baz', 'mets.xml'))
                 self.assertTrue(Path(dst, fn).exists())
 
+class FlakyHandler(QuietHTTPRequestHandler):
+    """
+    Fails every request with 503 until ``failures`` is exhausted, tracks concurrency.
+    """
+    failures = 0
+    concurrent = 0
+    max_concurrent = 0
+    lock = Lock()
+
+    def do_GET(self):
+        cls = FlakyHandler
+        with cls.lock:
+            cls.concurrent += 1
+            cls.max_concurrent = max(cls.max_concurrent, cls.concurrent)
+            fail = cls.failures > 0
+            cls.failures -= 1
+        try:
+            if fail:
+                self.send_error(503)
+            else:
+                sleep(0.02)
+                super().do_GET()
+        finally:
+            with cls.lock:
+                cls.concurrent -= 1
+
+class ShortBodyHandler(QuietHTTPRequestHandler):
+    """
+    Announces more bytes than it sends.
+    """
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '10')
+        self.end_headers()
+        self.wfile.write(b'short')
+
+class CountingHandler(QuietHTTPRequestHandler):
+    """
+    Records the status code of every response.
+    """
+    status_codes = []
+
+    def send_response(self, code, message=None):
+        CountingHandler.status_codes.append(code)
+        super().send_response(code, message)
+
+class SlowHandler(QuietHTTPRequestHandler):
+    """
+    Takes half a second to respond.
+    """
+    def do_GET(self):
+        sleep(0.5)
+        super().do_GET()
+
+class TestResolverDownloads(TestCase):
+
+    def setUp(self):
+        FlakyHandler.failures = 0
+        FlakyHandler.max_concurrent = 0
+
+    def test_http_get_retry(self):
+        with TemporaryDirectory() as src:
+            Path(src, 'foo.txt').write_text('foo')
+            with serve_directory(src, FlakyHandler) as baseurl:
+                FlakyHandler.failures = 2
+                self.assertEqual(Resolver(backoff=0).http_get(baseurl + '/foo.txt').text, 'foo')
+                FlakyHandler.failures = 2
+                self.assertEqual(Resolver(retries=1, backoff=0).http_get(baseurl + '/foo.txt').status_code, 503)
+
+    def test_http_get_timeout(self):
+        with TemporaryDirectory() as src:
+            Path(src, 'foo.txt').write_text('foo')
+            with serve_directory(src, SlowHandler) as baseurl:
+                with self.assertRaises(requests.Timeout):
+                    Resolver(retries=0, timeout=0.1).http_get(baseurl + '/foo.txt')
+                self.assertEqual(Resolver(retries=0, timeout=0.1).http_get(baseurl + '/foo.txt', timeout=5).text, 'foo')
+
+    def test_http_get_holds_host_slot_while_streaming(self):
+        with TemporaryDirectory() as src:
+            Path(src, 'foo.txt').write_text('foo')
+            with serve_directory(src) as baseurl:
+                resolver = Resolver(max_per_host=1)
+                semaphore = resolver._host_semaphore(baseurl) # pylint: disable=protected-access
+                with resolver.http_get(baseurl + '/foo.txt', stream=True) as response:
+                    self.assertFalse(semaphore.acquire(blocking=False))
+                    self.assertEqual(response.text, 'foo')
+                self.assertTrue(semaphore.acquire(blocking=False))
+                semaphore.release()
+                self.assertEqual(resolver.http_get(baseurl + '/foo.txt').text, 'foo')
+                self.assertTrue(semaphore.acquire(blocking=False))
+
+    def test_download_to_directory_streamed(self):
+        with TemporaryDirectory() as src, TemporaryDirectory() as dst:
+            Path(src, 'foo.txt').write_bytes(b'foo' * 2 ** 20)
+            with serve_directory(src) as baseurl:
+                resolver = Resolver()
+                sha256 = 'sha256:%s' % hashlib.sha256(b'foo' * 2 ** 20).hexdigest()
+                fn = resolver.download_to_directory(dst, baseurl + '/foo.txt', checksum=sha256)
+                self.assertEqual(Path(dst, fn).read_bytes(), b'foo' * 2 ** 20)
+                with self.assertRaisesRegex(Exception, 'Checksum mismatch'):
+                    resolver.download_to_directory(dst, baseurl + '/foo.txt', basename='bar.txt', checksum='md5:1234')
+                self.assertEqual(sorted(p.name for p in Path(dst).iterdir() if p.is_file()), ['foo.txt'])
+            with serve_directory(src, ShortBodyHandler) as baseurl:
+                with self.assertRaises(Exception):
+                    Resolver(retries=0).download_to_directory(dst, baseurl + '/foo.txt', basename='bar.txt')
+                self.assertEqual(sorted(p.name for p in Path(dst).iterdir() if p.is_file()), ['foo.txt'])
+
+    def test_download_to_directory_staging(self):
+        with TemporaryDirectory() as src, TemporaryDirectory() as dst:
+            src_file = Path(src, 'foo.txt')
+            src_file.write_text('foo')
+            resolver = Resolver()
+            fn = resolver.download_to_directory(dst, str(src_file), basename='copy.txt')
+            self.assertNotEqual(Path(dst, fn).stat().st_ino, src_file.stat().st_ino)
+            fn = resolver.download_to_directory(dst, str(src_file), basename='hardlink.txt', staging='hardlink')
+            self.assertEqual(Path(dst, fn).stat().st_ino, src_file.stat().st_ino)
+            fn = resolver.download_to_directory(dst, str(src_file), basename='symlink.txt', staging='symlink')
+            self.assertEqual(Path(dst, fn).resolve(), src_file.resolve())
+            for staging in ['reflink', 'auto']:
+                fn = resolver.download_to_directory(dst, str(src_file), basename='%s.txt' % staging, staging=staging)
+                self.assertEqual(Path(dst, fn).read_text(), 'foo')
+            # replaces existing files
+            src_file.write_text('bar')
+            fn = resolver.download_to_directory(dst, str(src_file), basename='copy.txt', staging='hardlink', if_exists='overwrite')
+            self.assertEqual(Path(dst, fn).stat().st_ino, src_file.stat().st_ino)
+            self.assertEqual(len(list(Path(dst).iterdir())), 5)
+            with self.assertRaisesRegex(ValueError, 'Unknown staging strategy'):
+                resolver.download_to_directory(dst, str(src_file), basename='x.txt', staging='teleport')
+
+    def test_download_cache(self):
+        with TemporaryDirectory() as src, TemporaryDirectory() as dst, TemporaryDirectory() as cache_dir:
+            Path(src, 'foo.txt').write_text('foo')
+            Path(src, 'foo2.txt').write_text('foo')
+            CountingHandler.status_codes = []
+            with serve_directory(src, CountingHandler) as baseurl:
+                resolver = Resolver(download_cache=DownloadCache(cache_dir))
+                fn1 = resolver.download_to_directory(Path(dst, 'ws1'), baseurl + '/foo.txt')
+                fn2 = resolver.download_to_directory(Path(dst, 'ws2'), baseurl + '/foo.txt')
+                self.assertEqual(CountingHandler.status_codes, [200, 304])
+                self.assertEqual(Path(dst, 'ws1', fn1).stat().st_ino, Path(dst, 'ws2', fn2).stat().st_ino)
+                self.assertEqual(Path(dst, 'ws2', fn2).read_text(), 'foo')
+                # same content under another URL is stored once
+                resolver.download_to_directory(Path(dst, 'ws1'), baseurl + '/foo2.txt')
+                self.assertEqual(len(list(Path(cache_dir, 'objects').glob('*/*'))), 1)
+                # no revalidation within max_age
+                CountingHandler.status_codes = []
+                resolver = Resolver(download_cache=DownloadCache(cache_dir, max_age=60))
+                resolver.download_to_directory(Path(dst, 'ws3'), baseurl + '/foo.txt')
+                self.assertEqual(CountingHandler.status_codes, [])
+                # changed files are downloaded again, the old object is evicted
+                Path(src, 'foo.txt').write_text('bar')
+                os.utime(str(Path(src, 'foo.txt')), (time() + 10, time() + 10))
+                resolver = Resolver(download_cache=DownloadCache(cache_dir, max_size=3))
+                fn4 = resolver.download_to_directory(Path(dst, 'ws4'), baseurl + '/foo.txt')
+                self.assertEqual(CountingHandler.status_codes, [200])
+                self.assertEqual(Path(dst, 'ws4', fn4).read_text(), 'bar')
+                self.assertEqual([p.read_text() for p in Path(cache_dir, 'objects').glob('*/*')], ['bar'])
+
+    def test_download_cache_object_larger_than_max_size(self):
+        with TemporaryDirectory() as src, TemporaryDirectory() as dst, TemporaryDirectory() as cache_dir:
+            Path(src, 'foo.txt').write_text('foo')
+            with serve_directory(src) as baseurl:
+                resolver = Resolver(download_cache=DownloadCache(cache_dir, max_size=2))
+                fn = resolver.download_to_directory(dst, baseurl + '/foo.txt')
+                self.assertEqual(Path(dst, fn).read_text(), 'foo')
+                self.assertEqual(list(Path(cache_dir, 'objects').glob('*/*')), [])
+
+    def test_download_cache_keeps_mtime(self):
+        with TemporaryDirectory() as src, TemporaryDirectory() as dst, TemporaryDirectory() as cache_dir:
+            Path(src, 'foo.txt').write_text('foo')
+            CountingHandler.status_codes = []
+            with serve_directory(src, CountingHandler) as baseurl:
+                resolver = Resolver(download_cache=DownloadCache(cache_dir))
+                fn1 = resolver.download_to_directory(Path(dst, 'ws1'), baseurl + '/foo.txt')
+                os.utime(str(Path(dst, 'ws1', fn1)), (0, 0))
+                resolver.download_to_directory(Path(dst, 'ws2'), baseurl + '/foo.txt')
+                self.assertEqual(Path(dst, 'ws1', fn1).stat().st_mtime, 0)
+                # objects evicted by another process are downloaded again
+                for obj in Path(cache_dir, 'objects').glob('*/*'):
+                    obj.unlink()
+                fn3 = resolver.download_to_directory(Path(dst, 'ws3'), baseurl + '/foo.txt')
+                self.assertEqual(Path(dst, 'ws3', fn3).read_text(), 'foo')
+                resolver = Resolver(download_cache=DownloadCache(cache_dir, max_age=60))
+                for obj in Path(cache_dir, 'objects').glob('*/*'):
+                    obj.unlink()
+                fn4 = resolver.download_to_directory(Path(dst, 'ws4'), baseurl + '/foo.txt')
+                self.assertEqual(Path(dst, 'ws4', fn4).read_text(), 'foo')
+                self.assertEqual(CountingHandler.status_codes, [200, 304, 200, 200])
+
+    def test_download_to_directory_revalidate(self):
+        with TemporaryDirectory() as src, TemporaryDirectory() as dst:
+            Path(src, 'foo.txt').write_text('foo')
+            CountingHandler.status_codes = []
+            with serve_directory(src, CountingHandler) as baseurl:
+                resolver = Resolver()
+                fn = resolver.download_to_directory(dst, baseurl + '/foo.txt', if_exists='revalidate')
+                resolver.download_to_directory(dst, baseurl + '/foo.txt', if_exists='revalidate')
+                self.assertEqual(CountingHandler.status_codes, [200, 304])
+                self.assertEqual(Path(dst, fn).read_text(), 'foo')
+                Path(src, 'foo.txt').write_text('bar')
+                os.utime(str(Path(src, 'foo.txt')), (time() + 10, time() + 10))
+                resolver.download_to_directory(dst, baseurl + '/foo.txt', if_exists='revalidate')
+                self.assertEqual(CountingHandler.status_codes, [200, 304, 200])
+                self.assertEqual(Path(dst, fn).read_text(), 'bar')
+            # local files are compared by size and mtime
+            os.utime(str(Path(src, 'foo.txt')), (0, 0))
+            fn = resolver.download_to_directory(dst, str(Path(src, 'foo.txt')), basename='local.txt')
+            Path(dst, fn).write_text('baz')
+            resolver.download_to_directory(dst, str(Path(src, 'foo.txt')), basename='local.txt', if_exists='revalidate')
+            self.assertEqual(Path(dst, fn).read_text(), 'baz')
+            Path(src, 'foo.txt').write_text('quux')
+            os.utime(str(Path(src, 'foo.txt')), (time() + 20, time() + 20))
+            resolver.download_to_directory(dst, str(Path(src, 'foo.txt')), basename='local.txt', if_exists='revalidate')
+            self.assertEqual(Path(dst, fn).read_text(), 'quux')
+
+    def test_workspace_from_url_download_concurrently(self):
+        with TemporaryDirectory() as src, TemporaryDirectory() as dst:
+            with serve_directory(src, FlakyHandler) as baseurl:
+                workspace = Resolver().workspace_from_nothing(directory=src)
+                for n in range(10):
+                    Path(src, 'IMG_%d.tif' % n).write_text('img%d' % n)
+                    workspace.mets.add_file('OCR-D-IMG', ID='IMG_%d' % n, pageId='PHYS_%d' % n, mimetype='image/tiff',
+                                            url='%s/IMG_%d.tif' % (baseurl, n))
+                workspace.save_mets()
+                progress = []
+                workspace = Resolver(jobs=8, max_per_host=3).workspace_from_url(
+                    baseurl + '/mets.xml', dst_dir=dst, download=True,
+                    progress=lambda done, total, url: progress.append((done, total)))
+                self.assertEqual(progress, [(n, 10) for n in range(1, 11)])
+                self.assertLessEqual(FlakyHandler.max_concurrent, 3)
+                for n, f in enumerate(workspace.mets.find_files()):
+                    self.assertEqual(f.local_filename, 'OCR-D-IMG/IMG_%d.tif' % n)
+                    self.assertEqual(Path(dst, f.local_filename).read_text(), 'img%d' % n)
+
+class TestAsyncResolver(TestCase):
+
+    def setUp(self):
+        FlakyHandler.failures = 0
+        FlakyHandler.max_concurrent = 0
+
+    def test_workspace_from_url_download(self):
+        with TemporaryDirectory() as src, TemporaryDirectory() as dst:
+            with serve_directory(src, FlakyHandler) as baseurl:
+                workspace = Resolver().workspace_from_nothing(directory=src)
+                for n in range(10):
+                    Path(src, 'IMG_%d.tif' % n).write_text('img%d' % n)
+                    workspace.mets.add_file('OCR-D-IMG', ID='IMG_%d' % n, pageId='PHYS_%d' % n, mimetype='image/tiff',
+                                            url='%s/IMG_%d.tif' % (baseurl, n))
+                workspace.save_mets()
+
+                resolver = AsyncResolver(concurrency=3)
+                ticks = []
+                async def tick():
+                    for _ in range(10):
+                        ticks.append(1)
+                        await asyncio.sleep(0.01)
+                async def clone(n):
+                    return await resolver.workspace_from_url(baseurl + '/mets.xml', dst_dir=str(Path(dst, str(n))), download=True)
+                async def main():
+                    return await asyncio.gather(clone(1), clone(2), tick())
+                loop = asyncio.new_event_loop()
+                try:
+                    workspaces = loop.run_until_complete(main())[:2]
+                    loop.close()
+                    # usable from another event loop
+                    loop = asyncio.new_event_loop()
+                    workspaces.append(loop.run_until_complete(clone(3)))
+                finally:
+                    loop.close()
+                    resolver.shutdown()
+                self.assertEqual(len(ticks), 10)
+                self.assertLessEqual(FlakyHandler.max_concurrent, 3)
+                for ws in workspaces:
+                    for n, f in enumerate(ws.mets.find_files()):
+                        self.assertEqual(Path(ws.directory, f.local_filename).read_text(), 'img%d' % n)
+
+class RangeHandler(QuietHTTPRequestHandler):
+    """Serve single byte ranges, like most static file servers"""
+    ranges = []
+
+    def send_head(self):
+        if 'Range' not in self.headers:
+            return super().send_head()
+        RangeHandler.ranges.append(self.headers['Range'])
+        try:
+            f = open(self.translate_path(self.path), 'rb')
+        except OSError:
+            self.send_error(404)
+            return None
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            start, end = [int(n) for n in re.match(r'bytes=(\d+)-(\d+)', self.headers['Range']).groups()]
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */%d' % size)
+                self.end_headers()
+                return None
+            end = min(end, size - 1)
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, size))
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        return io.BytesIO(data)
+
+class TestRemoteFile(TestCase):
+
+    def setUp(self):
+        RangeHandler.ranges = []
+
+    def test_read_seek(self):
+        with TemporaryDirectory() as src:
+            data = os.urandom(300000)
+            Path(src, 'blob').write_bytes(data)
+            with serve_directory(src, RangeHandler) as baseurl:
+                with RemoteFile(Resolver(), baseurl + '/blob', block_size=1000) as f:
+                    self.assertEqual(f.read(10), data[:10])
+                    self.assertEqual(f.seek(-5, io.SEEK_END), 299995)
+                    self.assertEqual(f.read(), data[-5:])
+                    self.assertEqual(f.read(), b'')
+                    f.seek(500)
+                    self.assertEqual(f.read(2000), data[500:2500])
+                    self.assertTrue(f.range_support)
+                    self.assertEqual(f.size, 300000)
+                    self.assertEqual(f.bytes_transferred, 4000)
+                self.assertEqual(RangeHandler.ranges, ['bytes=0-999', 'bytes=299000-299999', 'bytes=1000-2999'])
+
+    def test_no_range_support(self):
+        with TemporaryDirectory() as src:
+            data = os.urandom(300000)
+            Path(src, 'blob').write_bytes(data)
+            with serve_directory(src) as baseurl:
+                with RemoteFile(Resolver(), baseurl + '/blob', block_size=1000) as f:
+                    f.seek(1000)
+                    self.assertEqual(f.read(10), data[1000:1010])
+                    self.assertFalse(f.range_support)
+                    self.assertEqual(f.read(), data[1010:])
+                    self.assertEqual(f.bytes_transferred, 300000)
+
+    def test_read_whole(self):
+        with TemporaryDirectory() as src:
+            data = os.urandom(300000)
+            Path(src, 'blob').write_bytes(data)
+            with serve_directory(src, RangeHandler) as baseurl:
+                with RemoteFile(Resolver(), baseurl + '/blob', block_size=1000) as f:
+                    self.assertEqual(f.readinto(bytearray()), 0)
+                    self.assertEqual(f.bytes_transferred, 0)
+                with RemoteFile(Resolver(), baseurl + '/blob', block_size=1000, ranges=False) as f:
+                    self.assertEqual(f.read(), data)
+                    self.assertEqual(f.bytes_transferred, 300000)
+                self.assertEqual(RangeHandler.ranges, [])
+
+    def test_resolve_image_exif_lazily(self):
+        with TemporaryDirectory() as src, TemporaryDirectory() as dst:
+            Image.frombytes('L', (1000, 1000), os.urandom(1000000)).save(str(Path(src, 'img.tif')), dpi=(300, 300))
+            with serve_directory(src, RangeHandler) as baseurl:
+                workspace = Resolver().workspace_from_nothing(directory=dst)
+                f = workspace.mets.add_file('OCR-D-IMG', ID='IMG', pageId='PHYS_1', mimetype='image/tiff', url=baseurl + '/img.tif')
+                exif = workspace.resolve_image_exif(f.url)
+                self.assertEqual((exif.width, exif.height, exif.xResolution), (1000, 1000, 300))
+                self.assertEqual(f.url, baseurl + '/img.tif')
+                self.assertFalse(Path(dst, 'OCR-D-IMG').exists())
+                with workspace.open_file(f) as image_file:
+                    pcgts = page_from_file(f, fileobj=image_file)
+                    self.assertLess(image_file.raw.bytes_transferred, 1000000)
+                self.assertEqual(pcgts.get_Page().imageWidth, 1000)
+
 if __name__ == '__main__':
     main()
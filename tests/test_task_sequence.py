@@ -8,7 +8,8 @@ from pathlib import Path
 from tests.base import TestCase, main, assets
 
 from ocrd.resolver import Resolver
-from ocrd.task_sequence import ProcessorTask, validate_tasks
+from ocrd.constants import CHECKPOINT_FILENAME
+from ocrd.task_sequence import ProcessorTask, OcrdToolJsonCache, validate_tasks, validate_each_task, run_tasks
 
 SAMPLE_NAME = 'ocrd-sample-processor'
 SAMPLE_OCRD_TOOL_JSON = '''{
@@ -40,10 +41,13 @@ SAMPLE_OCRD_TOOL_JSON_REQUIRED_PARAM = json.dumps(SAMPLE_OCRD_TOOL_JSON_REQUIRED
 class TestTaskSequence(TestCase):
 
     def tearDown(self):
+        ProcessorTask.ocrd_tool_json_cache = self.orig_ocrd_tool_json_cache
         rmtree(self.tempdir)
 
     def setUp(self):
         self.tempdir = mkdtemp(prefix='ocrd-task-sequence-')
+        self.orig_ocrd_tool_json_cache = ProcessorTask.ocrd_tool_json_cache
+        ProcessorTask.ocrd_tool_json_cache = OcrdToolJsonCache(Path(self.tempdir, 'cache'))
 
         p = Path(self.tempdir, SAMPLE_NAME)
         p.write_text("""\
@@ -117,6 +121,60 @@ print('''%s''')
         with self.assertRaisesRegex(Exception, "'param1' is a required property"):
             task.validate()
 
+    def test_ocrd_tool_json_cache(self):
+        counter = Path(self.tempdir, 'counter')
+        p = Path(self.tempdir, 'ocrd-counting-processor')
+        p.write_text("""\
+#!/usr/bin/env python
+with open('%s', 'a') as f:
+    f.write('x')
+print('''%s''')
+        """ % (counter, SAMPLE_OCRD_TOOL_JSON))
+        p.chmod(0o777)
+        tasks = [ProcessorTask.parse(x) for x in [
+            'counting-processor -I IN -O OUT1',
+            'counting-processor -I OUT1 -O OUT2',
+            'sample-processor -I OUT2 -O OUT3',
+        ]]
+        ProcessorTask.ocrd_tool_json_cache.fill(tasks)
+        self.assertEqual(counter.read_text(), 'x')
+        self.assertEqual(tasks[1].ocrd_tool_json['executable'], 'ocrd-sample-processor')
+        self.assertEqual(len(list(Path(self.tempdir, 'cache').iterdir())), 2)
+        # new task, served from disk
+        self.assertTrue(ProcessorTask.parse('counting-processor -I IN -O OUT').validate())
+        self.assertEqual(counter.read_text(), 'x')
+        # changing the executable invalidates the entry
+        p.write_text(p.read_text() + '\n')
+        self.assertTrue(ProcessorTask.parse('counting-processor -I IN -O OUT').validate())
+        self.assertEqual(counter.read_text(), 'xx')
+        ProcessorTask.ocrd_tool_json_cache.clear()
+        self.assertEqual(list(Path(self.tempdir, 'cache').iterdir()), [])
+        self.assertTrue(ProcessorTask.parse('counting-processor -I IN -O OUT').validate())
+        self.assertEqual(counter.read_text(), 'xxx')
+
+    def test_validate_each_task(self):
+        reports = validate_each_task([ProcessorTask.parse(x) for x in [
+            'sample-processor -I IN -O OUT1',
+            'sample-processor-without-file-grp -I OUT1',
+            'sample-processor -I OUT1 -O OUT2',
+        ]])
+        self.assertEqual(len(reports), 3)
+        self.assertTrue(all(report.is_valid for report in reports))
+        with self.assertRaisesRegex(Exception, 'Executable not found in PATH: ocrd-no-such-processor'):
+            validate_each_task([ProcessorTask.parse(x) for x in [
+                'sample-processor -I IN -O OUT1',
+                'no-such-processor -I OUT1 -O OUT2',
+                'sample-processor -I OUT2',
+            ]])
+
+    def test_validate_each_task_shared_validator(self):
+        tasks = [ProcessorTask.parse('sample-processor-required-param -I IN -O OUT%d' % i) for i in range(3)]
+        self.assertIs(tasks[0].parameter_validator, tasks[2].parameter_validator)
+        # required parameters must still be enforced for every task
+        for task in tasks:
+            with self.assertRaisesRegex(Exception, "'param1' is a required property"):
+                task.validate()
+
     def test_validate_sequence(self):
         resolver = Resolver()
         with TemporaryDirectory() as tempdir:
@@ -149,5 +207,52 @@ print('''%s''')
                 "sample-processor -I OCR-D-SEG-WORD  -O OCR-D-OCR-TESS",
             ]], workspace)
 
+    def test_run_tasks_checkpoint(self):
+        log = Path(self.tempdir, 'processed')
+        p = Path(self.tempdir, 'ocrd-page-processor')
+        p.write_text("""\
+#!/usr/bin/env python
+import os, sys
+from ocrd.resolver import Resolver
+if '--dump-json' in sys.argv:
+    print('''%s''')
+    sys.exit(0)
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+workspace = Resolver().workspace_from_url(args['--mets'])
+for page_id in args['--page-id'].split(','):
+    if page_id == os.environ.get('FAIL_PAGE'):
+        sys.exit(1)
+    workspace.add_file(args['--output-file-grp'], ID='%%s_%%s' %% (args['--output-file-grp'], page_id), pageId=page_id, mimetype='text/plain')
+    with open('%s', 'a') as f:
+        f.write('%%s %%s\\n' %% (args['--output-file-grp'], page_id))
+workspace.save_mets()
+        """ % (SAMPLE_OCRD_TOOL_JSON, log))
+        p.chmod(0o777)
+        page_ids = ['PHYS_%04d' % i for i in range(1, 6)]
+        workspace = Resolver().workspace_from_nothing(directory=str(Path(self.tempdir, 'ws')))
+        for page_id in page_ids:
+            workspace.mets.add_file('OCR-D-IMG', ID='IMG_%s' % page_id, pageId=page_id, mimetype='image/tiff', url='%s.tif' % page_id)
+        workspace.save_mets()
+        mets = str(Path(workspace.directory, 'mets.xml'))
+        tasks = ['page-processor -I OCR-D-IMG -O OUT1', 'page-processor -I OUT1 -O OUT2']
+        ledger = Path(workspace.directory, CHECKPOINT_FILENAME)
+
+        os.environ['FAIL_PAGE'] = 'PHYS_0004'
+        try:
+            with self.assertRaisesRegex(Exception, 'exited with non-zero return value 1'):
+                run_tasks(mets, None, None, tasks, checkpoint_pages=2)
+        finally:
+            del os.environ['FAIL_PAGE']
+        self.assertEqual(log.read_text().split('\n')[:-1], ['OUT1 %s' % page_id for page_id in page_ids[:3]])
+        self.assertTrue(ledger.exists())
+
+        # resume: the failed batch is processed again, finished batches are skipped
+        log.unlink()
+        run_tasks(mets, None, None, tasks, checkpoint_pages=2)
+        self.assertEqual(log.read_text().split('\n')[:-1],
+                         ['OUT1 %s' % page_id for page_id in page_ids[2:]] +
+                         ['OUT2 %s' % page_id for page_id in page_ids])
+        self.assertFalse(ledger.exists())
+
 if __name__ == '__main__':
     main()
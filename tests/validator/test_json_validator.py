@@ -1,5 +1,5 @@
 from tests.base import TestCase, main
-from ocrd_validators.json_validator import JsonValidator, DefaultValidatingDraft4Validator
+from ocrd_validators.json_validator import JsonValidator, DefaultValidatingDraft4Validator, compiled_validator
 
 class TestParameterValidator(TestCase):
 
@@ -33,6 +33,18 @@ class TestParameterValidator(TestCase):
         self.assertFalse(report.is_valid)
         self.assertEqual(len(report.errors), 1)
 
+    def test_compiled_validator(self):
+        validator = compiled_validator(self.schema, DefaultValidatingDraft4Validator)
+        self.assertIs(self.defaults_validator.validator, validator)
+        self.assertIsNot(compiled_validator(self.schema), validator)
+        # changes to the schema do not leak into the cached validator
+        self.schema['properties']['foo']['default'] = 42
+        self.assertIsNot(compiled_validator(self.schema, DefaultValidatingDraft4Validator), validator)
+        obj = {'bar': 2000}
+        self.defaults_validator._validate(obj)
+        self.assertEqual(obj['foo'], 3000)
+
+
 
 if __name__ == '__main__':
     main()
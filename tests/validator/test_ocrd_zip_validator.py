@@ -1,6 +1,9 @@
 from os.path import join
 from shutil import copytree, rmtree
 from tempfile import mkdtemp
+from zipfile import ZipFile
+
+from bagit import BagValidationError # pylint: disable=no-name-in-module
 
 from tests.base import TestCase, main, assets # pylint: disable=import-error,no-name-in-module
 
@@ -68,5 +71,44 @@ class TestOcrdZipValidator(TestCase):
         with self.assertRaisesRegex(Exception, "Existing tag file 'NOT-ALLOWED' is not listed in Tag-Files-Allowed."):
             validator.validate(skip_unzip=True)
 
+class TestOcrdZipValidatorStream(TestCase):
+
+    def setUp(self):
+        self.resolver = Resolver()
+        self.tempdir = mkdtemp()
+        workspace = self.resolver.workspace_from_nothing(directory=join(self.tempdir, 'ws'))
+        for n in range(5):
+            workspace.add_file('OCR-D-TXT', ID='TXT_%d' % n, pageId='PHYS_%d' % n, mimetype='text/plain',
+                               local_filename=join('txt', 'page%d.txt' % n), content='page %d' % n * 1000)
+        workspace.save_mets()
+        self.ocrdzip = WorkspaceBagger(self.resolver).bag(workspace, 'foo', dest=join(self.tempdir, 'ws.ocrd.zip'))
+
+    def tearDown(self):
+        rmtree(self.tempdir)
+
+    def _rewrite_zip(self, replace):
+        with ZipFile(self.ocrdzip) as zf_in, ZipFile(join(self.tempdir, 'bad.ocrd.zip'), 'w') as zf_out:
+            for info in zf_in.infolist():
+                content = replace.get(info.filename, zf_in.read(info))
+                if content is not None:
+                    zf_out.writestr(info, content)
+        return join(self.tempdir, 'bad.ocrd.zip')
+
+    def test_validation_stream(self):
+        for processes in [1, 2]:
+            report = OcrdZipValidator(self.resolver, self.ocrdzip).validate(stream=True, processes=processes)
+            self.assertTrue(report.is_valid)
+
+    def test_validation_stream_checksum_mismatch(self):
+        bad = self._rewrite_zip({'data/OCR-D-TXT/TXT_1.txt': b'page X' * 1000})
+        with self.assertRaisesRegex(BagValidationError, 'data/OCR-D-TXT/TXT_1.txt sha512 validation failed'):
+            OcrdZipValidator(self.resolver, bad).validate(stream=True, processes=2)
+        OcrdZipValidator(self.resolver, bad).validate(stream=True, skip_checksums=True)
+
+    def test_validation_stream_oxum(self):
+        bad = self._rewrite_zip({'data/OCR-D-TXT/TXT_1.txt': None})
+        with self.assertRaisesRegex(BagValidationError, "Payload-Oxum validation failed. Expected 6 files"):
+            OcrdZipValidator(self.resolver, bad).validate(stream=True)
+
 if __name__ == '__main__':
     main()
@@ -1,12 +1,65 @@
 from tests.base import TestCase, assets, main # pylint: disable=import-error,no-name-in-module
 from ocrd.resolver import Resolver
 from ocrd_validators import PageValidator
-from ocrd_validators.page_validator import get_text, set_text, ConsistencyError
-from ocrd_models.ocrd_page import parse, TextEquivType
+from ocrd_validators.page_validator import get_text, set_text, ConsistencyError, CoordinateConsistencyError, ParentArea, make_poly
+from ocrd_models.ocrd_page import (
+    parse,
+    parseString,
+    to_xml,
+    PcGtsType,
+    PageType,
+    TextRegionType,
+    TextLineType,
+    WordType,
+    GlyphType,
+    CoordsType,
+    BaselineType,
+    TextEquivType
+)
 from ocrd_utils import pushd_popd
 
 FAULTY_GLYPH_PAGE_FILENAME = assets.path_to('glyph-consistency/data/OCR-D-GT-PAGE/FAULTY_GLYPHS.xml')
 
+def points_of_box(x0, y0, x1, y1):
+    return '%d,%d %d,%d %d,%d %d,%d' % (x0, y0, x1, y0, x1, y1, x0, y1)
+
+def make_glyph_page(n_lines=40, n_words=12, n_glyphs=8, text=False):
+    """
+    Generate a PAGE with ``n_lines`` lines of ``n_words`` words of
+    ``n_glyphs`` glyphs each, all with consistent coordinates. Every region
+    is a non-rectangular polygon, so children cannot pass the bounding box
+    shortcut of the coordinate checks.
+
+    With ``text``, all elements get consistent text results, too.
+    """
+    def text_equiv(unicode):
+        return [TextEquivType(Unicode=unicode)] if text else None
+    glyph_w, word_w, line_h = 10, 10 * n_glyphs + 10, 40
+    width, height = n_words * word_w + 20, n_lines * line_h + 40
+    lines = []
+    for l in range(n_lines):
+        y0 = 20 + l * line_h
+        words = []
+        for w in range(n_words):
+            x0 = 10 + w * word_w
+            glyphs = [GlyphType(id='g_%d_%d_%d' % (l, w, g), TextEquiv=text_equiv('abcdefghij'[g % 10]),
+                                Coords=CoordsType(points=points_of_box(x0 + g * glyph_w, y0 + 5, x0 + (g + 1) * glyph_w - 1, y0 + 30)))
+                      for g in range(n_glyphs)]
+            words.append(WordType(id='w_%d_%d' % (l, w), Glyph=glyphs,
+                                  TextEquiv=text_equiv(''.join(glyph.get_TextEquiv()[0].Unicode for glyph in glyphs) if text else None),
+                                  Coords=CoordsType(points=points_of_box(x0, y0 + 2, x0 + word_w - 5, y0 + 33))))
+        lines.append(TextLineType(id='l_%d' % l, Word=words,
+                                  TextEquiv=text_equiv(' '.join(word.get_TextEquiv()[0].Unicode for word in words) if text else None),
+                                  Coords=CoordsType(points=points_of_box(5, y0, width - 5, y0 + 35)),
+                                  Baseline=BaselineType(points='10,%d %d,%d' % (y0 + 30, width - 10, y0 + 30))))
+    # a notch at the top right corner makes the region non-rectangular
+    region = TextRegionType(id='r_0', TextLine=lines,
+                            TextEquiv=text_equiv('\n'.join(line.get_TextEquiv()[0].Unicode for line in lines) if text else None),
+                            Coords=CoordsType(
+        points='0,15 %d,15 %d,5 %d,5 %d,%d 0,%d' % (width - 50, width - 50, width, width, height, height)))
+    return PcGtsType(pcGtsId='glyphs', Page=PageType(imageFilename='glyphs.png', imageWidth=width + 10,
+                                                     imageHeight=height + 10, TextRegion=[region]))
+
 class TestPageValidator(TestCase):
 
     def setUp(self):
@@ -96,5 +149,60 @@ class TestPageValidator(TestCase):
         report = PageValidator.validate(ocrd_page=ocrd_page)
         self.assertEqual(len([e for e in report.errors if isinstance(e, ConsistencyError)]), 0, 'no more textequiv consistency errors')
 
+    def test_parent_area(self):
+        rectangle = ParentArea(make_poly([[10, 10], [100, 10], [100, 50], [10, 50]]))
+        self.assertEqual(rectangle.inner_bounds, (10, 10, 100, 50))
+        self.assertTrue(rectangle.contains(make_poly([[20, 20], [30, 20], [30, 30], [20, 30]])))
+        # within the slack
+        self.assertTrue(rectangle.contains(make_poly([[9, 20], [30, 20], [30, 30], [9, 30]])))
+        self.assertFalse(rectangle.contains(make_poly([[5, 20], [30, 20], [30, 30], [5, 30]])))
+        # L-shaped
+        ell = ParentArea(make_poly([[10, 10], [50, 10], [50, 30], [100, 30], [100, 50], [10, 50]]))
+        self.assertIsNone(ell.inner_bounds)
+        self.assertTrue(ell.contains(make_poly([[20, 20], [40, 20], [40, 40], [20, 40]])))
+        self.assertFalse(ell.contains(make_poly([[60, 15], [90, 15], [90, 40], [60, 40]])))
+
+    def test_validate_coords_glyph_page(self):
+        ocrd_page = make_glyph_page()
+        # glyph sticking out of its word, word sticking into the notch of the region
+        ocrd_page.get_Page().get_TextRegion()[0].get_TextLine()[3].get_Word()[2].get_Glyph()[1].get_Coords().set_points(points_of_box(200, 100, 240, 200))
+        ocrd_page.get_Page().get_TextRegion()[0].get_TextLine()[0].get_Word()[-1].get_Coords().set_points(points_of_box(1000, 6, 1085, 53))
+        report = PageValidator.validate(ocrd_page=ocrd_page, page_textequiv_consistency='off')
+        self.assertEqual([e.ID for e in report.errors if isinstance(e, CoordinateConsistencyError)], ['w_0_11', 'g_3_2_1'])
+
+    def test_validate_text_glyph_page(self):
+        ocrd_page = make_glyph_page(n_lines=5, n_words=4, n_glyphs=3, text=True)
+        self.assertTrue(PageValidator.validate(ocrd_page=ocrd_page).is_valid)
+        line = ocrd_page.get_Page().get_TextRegion()[0].get_TextLine()[2]
+        line.get_Word()[1].get_Glyph()[0].get_TextEquiv()[0].set_Unicode('X')
+        report = PageValidator.validate(ocrd_page=ocrd_page)
+        self.assertEqual([(e.ID, e.expected) for e in report.errors], [('w_2_1', 'Xbc')])
+        # repaired bottom-up in one traversal
+        PageValidator.validate(ocrd_page=ocrd_page, page_textequiv_consistency='fix')
+        self.assertEqual(line.get_TextEquiv()[0].Unicode, 'abc Xbc abc abc')
+        self.assertIn('\nabc Xbc abc abc\n', ocrd_page.get_Page().get_TextRegion()[0].get_TextEquiv()[0].Unicode)
+        self.assertTrue(PageValidator.validate(ocrd_page=ocrd_page).is_valid)
+
+    def test_validate_max_errors(self):
+        ocrd_page = make_glyph_page()
+        for line in ocrd_page.get_Page().get_TextRegion()[0].get_TextLine()[:4]:
+            line.get_Word()[0].get_Glyph()[0].get_Coords().set_points(points_of_box(0, 0, 5, 5))
+        report = PageValidator.validate(ocrd_page=ocrd_page, page_textequiv_consistency='off')
+        self.assertEqual(len(report.errors), 4)
+        report = PageValidator.validate(ocrd_page=ocrd_page, page_textequiv_consistency='off', max_errors=2)
+        self.assertEqual([e.ID for e in report.errors], ['g_0_0_0', 'g_1_0_0'])
+        report = PageValidator.validate(ocrd_page=ocrd_page, page_textequiv_consistency='off', max_errors=1)
+        self.assertEqual([e.ID for e in report.errors], ['g_0_0_0'])
+
+    def test_validate_coords_glyph_page_large(self):
+        ocrd_page = parseString(to_xml(make_glyph_page(n_lines=100, n_words=15)).encode('utf-8'), silence=True)
+        report = PageValidator.validate(ocrd_page=ocrd_page, page_textequiv_consistency='off')
+        self.assertTrue(report.is_valid, report.errors)
+        # a single glyph outside its word is found among all the others
+        line = ocrd_page.get_Page().get_TextRegion()[0].get_TextLine()[-1]
+        line.get_Word()[-1].get_Glyph()[-1].get_Coords().set_points(points_of_box(0, 0, 5, 5))
+        report = PageValidator.validate(ocrd_page=ocrd_page, page_textequiv_consistency='off')
+        self.assertEqual([e.ID for e in report.errors], [line.get_Word()[-1].get_Glyph()[-1].id])
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,107 @@
+from os.path import join
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from ocrd_validators import PageValidator, PageXsdValidator
+from ocrd_validators.page_xsd_validator import compiled_schema
+
+from tests.base import TestCase, main # pylint: disable=import-error,no-name-in-module
+from tests.validator.test_workspace_validator import PAGE_TEMPLATE
+
+# Just enough of the PAGE schema for PAGE_TEMPLATE
+MINIMAL_XSD = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
+           xmlns:pc="http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15"
+           targetNamespace="http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15"
+           elementFormDefault="qualified">
+  <xs:element name="PcGts">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="Metadata">
+          <xs:complexType>
+            <xs:sequence>
+              <xs:any processContents="skip" minOccurs="0" maxOccurs="unbounded"/>
+            </xs:sequence>
+          </xs:complexType>
+        </xs:element>
+        <xs:element name="Page">
+          <xs:complexType>
+            <xs:sequence>
+              <xs:any processContents="skip" minOccurs="0" maxOccurs="unbounded"/>
+            </xs:sequence>
+            <xs:attribute name="imageFilename" type="xs:string" use="required"/>
+            <xs:attribute name="imageWidth" type="xs:int" use="required"/>
+            <xs:attribute name="imageHeight" type="xs:int" use="required"/>
+          </xs:complexType>
+        </xs:element>
+      </xs:sequence>
+      <xs:attribute name="pcGtsId" type="xs:ID"/>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+class TestPageXsdValidator(TestCase):
+
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.xsd = join(self.tempdir.name, 'page.xsd')
+        Path(self.xsd).write_text(MINIMAL_XSD)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def write_page(self, name, content):
+        path = join(self.tempdir.name, name)
+        Path(path).write_text(content)
+        return path
+
+    def test_compiled_schema(self):
+        self.assertIs(compiled_schema(self.xsd), compiled_schema(self.xsd))
+        with self.assertRaisesRegex(Exception, "does not exist"):
+            compiled_schema(join(self.tempdir.name, 'missing.xsd'))
+
+    def test_validate(self):
+        valid = self.write_page('valid.xml', PAGE_TEMPLATE % {'id': 'valid', 'text': 'foo'})
+        invalid = self.write_page('invalid.xml', PAGE_TEMPLATE.replace(
+            'imageWidth="100" imageHeight="100"', 'imageWidth="wide"') % {'id': 'invalid', 'text': 'foo'})
+        for iterparse in [False, True]:
+            self.assertTrue(PageXsdValidator.validate(valid, xsd=self.xsd, iterparse=iterparse).is_valid)
+            report = PageXsdValidator.validate(invalid, xsd=self.xsd, iterparse=iterparse)
+            self.assertEqual(len(report.errors), 2)
+            self.assertIn("'wide' is not a valid value", report.errors[0])
+            self.assertIn("'imageHeight' is required", report.errors[1])
+            report = PageXsdValidator.validate(invalid, xsd=self.xsd, iterparse=iterparse, max_errors=1)
+            self.assertEqual(len(report.errors), 1)
+        self.assertIn('invalid.xml line 4:', PageXsdValidator.validate(invalid, xsd=self.xsd).errors[0])
+
+    def test_validate_page_xsd(self):
+        valid = self.write_page('valid.xml', PAGE_TEMPLATE % {'id': 'valid', 'text': 'foo'})
+        self.assertTrue(PageXsdValidator.validate(valid).is_valid)
+        invalid = self.write_page('invalid.xml', PAGE_TEMPLATE.replace(
+            'points="', 'points="-1,-1 ') % {'id': 'invalid', 'text': 'foo'})
+        report = PageXsdValidator.validate(invalid, iterparse=True)
+        self.assertFalse(report.is_valid)
+        self.assertIn("'points'", report.errors[0])
+
+    def test_validate_malformed(self):
+        malformed = self.write_page('malformed.xml', PAGE_TEMPLATE.replace('</pc:Page>', '') % {'id': 'malformed', 'text': 'foo'})
+        for iterparse in [False, True]:
+            report = PageXsdValidator.validate(malformed, xsd=self.xsd, iterparse=iterparse)
+            self.assertFalse(report.is_valid)
+
+    def test_page_validator_gate(self):
+        # inconsistent text, but valid against the XSD
+        inconsistent = self.write_page('inconsistent.xml', PAGE_TEMPLATE % {'id': 'inconsistent', 'text': 'bar'})
+        report = PageValidator.validate(filename=inconsistent, xsd=self.xsd)
+        self.assertEqual(len(report.errors), 1)
+        self.assertIn('INCONSISTENCY', str(report.errors[0]))
+        # consistency not checked
+        invalid = self.write_page('invalid.xml', PAGE_TEMPLATE.replace(
+            'imageHeight="100"', 'imageHeight="high"') % {'id': 'invalid', 'text': 'bar'})
+        report = PageValidator.validate(filename=invalid, xsd=self.xsd)
+        self.assertEqual(len(report.errors), 1)
+        self.assertIn("'high' is not a valid value", report.errors[0])
+
+if __name__ == '__main__':
+    main()
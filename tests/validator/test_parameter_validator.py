@@ -45,6 +45,23 @@ class TestParameterValidator(TestCase):
         self.assertTrue(report.is_valid)
         self.assertEqual(obj, {'baz': '23', "num-param": 1})
 
+    def test_ocrd_tool_unchanged(self):
+        ocrd_tool = {
+            "parameters": {
+                "baz": {
+                    "type": "string",
+                    "required": True,
+                },
+            }
+        }
+        validator = ParameterValidator(ocrd_tool)
+        self.assertEqual(ocrd_tool, {"parameters": {"baz": {"type": "string", "required": True}}})
+        # still required for another validator of the same ocrd-tool.json
+        self.assertIn('is a required property', ParameterValidator(ocrd_tool).validate({}).errors[0])
+        self.assertIs(ParameterValidator(ocrd_tool).validator, validator.validator)
+        self.assertEqual(ParameterValidator({}).validate({}).errors, [])
+
+
 
 if __name__ == '__main__':
     main()
@@ -1,5 +1,9 @@
+import json
+from io import StringIO
+
 from tests.base import TestCase, main # pylint: disable=import-error,no-name-in-module
-from ocrd_validators import ValidationReport
+from ocrd_validators import ValidationReport, StreamingValidationReport
+from ocrd_validators.page_validator import ConsistencyError
 
 class TestValidationReport(TestCase):
 
@@ -34,5 +38,63 @@ class TestValidationReport(TestCase):
         self.assertEqual(report.errors, ['foo', 'bar'])
         self.assertEqual(report.warnings, ['foo'])
 
+    def test_streaming_jsonl(self):
+        stream = StringIO()
+        report = StreamingValidationReport(stream)
+        report.add_notice('This is noticeable')
+        self.assertEqual(str(report), 'OK[ 1 notices ]')
+        other_report = ValidationReport()
+        other_report.add_error(ConsistencyError('TextRegion', 'r0', 'PAGE_1', 'foo', 'bar'))
+        other_report.add_warning('This is not good')
+        report.merge_report(other_report)
+        self.assertEqual(str(report), 'INVALID[ 1 warnings 1 errors 1 notices ]')
+        self.assertEqual(report.errors, [])
+        report.close()
+        self.assertEqual([json.loads(line) for line in stream.getvalue().splitlines()], [
+            {'level': 'notice', 'message': 'This is noticeable'},
+            {'level': 'warning', 'message': 'This is not good'},
+            {'level': 'error', 'file_id': 'PAGE_1',
+             'message': "INCONSISTENCY in TextRegion ID 'r0' of file 'PAGE_1': text results 'foo' != concatenated 'bar'"},
+            {'valid': False, 'warning': 1, 'error': 1, 'notice': 1},
+        ])
+
+    def test_streaming_merge_streaming(self):
+        other_stream = StringIO()
+        other_report = StreamingValidationReport(other_stream, format='xml')
+        other_report.add_error('This is <bad>')
+        other_report.add_notice('This is noticeable')
+        stream = StringIO()
+        report = StreamingValidationReport(stream, max_errors=2)
+        report.add_error('This is bad')
+        report.merge_report(other_report)
+        report.merge_report(other_report)
+        self.assertEqual(str(report), 'INVALID[ 2 errors 2 notices ]')
+        # the messages stay in the stream they were written to
+        self.assertEqual(stream.getvalue(), json.dumps({'level': 'error', 'message': 'This is bad'}) + '\n')
+        self.assertIn('<error>This is &lt;bad&gt;</error>', other_stream.getvalue())
+
+    def test_streaming_to_xml(self):
+        report = StreamingValidationReport(StringIO(), format='xml')
+        report.add_error('This is <bad>')
+        report.add_warning('This is not good')
+        self.assertEqual(report.to_xml(), '''\
+<report valid="false">
+  <summary warnings="1" errors="1" notices="0"/>
+</report>''')
+
+    def test_streaming_xml(self):
+        stream = StringIO()
+        report = StreamingValidationReport(stream, format='xml')
+        report.add_error('This is <bad>')
+        report.close()
+        self.assertEqual(stream.getvalue(), '''\
+<report>
+  <error>This is &lt;bad&gt;</error>
+  <summary valid="false" warnings="0" errors="1" notices="0"/>
+</report>
+''')
+        with self.assertRaisesRegex(ValueError, "Unknown report format 'csv'"):
+            StreamingValidationReport(stream, format='csv')
+
 if __name__ == '__main__':
     main()
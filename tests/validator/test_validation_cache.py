@@ -0,0 +1,102 @@
+from os.path import join
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from PIL import Image
+
+from ocrd_utils import MIMETYPE_PAGE
+from ocrd.resolver import Resolver
+from ocrd_validators import PageValidator, WorkspaceValidator, ValidationCache, ValidationReport
+from ocrd_validators.page_validator import ConsistencyError, set_text
+from ocrd_modelfactory import page_from_file
+
+from tests.base import TestCase, main # pylint: disable=import-error,no-name-in-module
+from tests.validator.test_workspace_validator import PAGE_TEMPLATE
+
+class TestValidationCache(TestCase):
+
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.cache = ValidationCache(join(self.tempdir.name, 'cache'))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_key(self):
+        path = Path(self.tempdir.name, 'foo.txt')
+        path.write_text('foo')
+        key = self.cache.key('check', path, {'a': 1, 'b': 2})
+        self.assertEqual(key, self.cache.key('check', path, {'b': 2, 'a': 1}))
+        self.assertNotEqual(key, self.cache.key('other_check', path, {'a': 1, 'b': 2}))
+        self.assertNotEqual(key, self.cache.key('check', path, {'a': 1, 'b': 3}))
+        path.write_text('bar')
+        self.assertNotEqual(key, self.cache.key('check', path, {'a': 1, 'b': 2}))
+        self.assertIsNone(self.cache.get(key))
+
+    def test_page_validator(self):
+        path = Path(self.tempdir.name, 'PAGE.xml')
+        path.write_text(PAGE_TEMPLATE % {'id': 'PAGE', 'text': 'bar'})
+        report = PageValidator.validate(filename=str(path), cache=self.cache)
+        self.assertEqual(len(report.errors), 1)
+        self.assertEqual(len(list(Path(self.cache.directory).glob('*/*.json'))), 1)
+        # served from the cache
+        key = self.cache.key('PageValidator', str(path), dict(
+            file_id=str(path), page_textequiv_consistency='strict', page_textequiv_strategy='first',
+            check_baseline=True, check_coords=True, xsd=None))
+        sentinel = ValidationReport()
+        sentinel.add_notice('from cache')
+        self.cache.put(key, sentinel)
+        self.assertEqual(PageValidator.validate(filename=str(path), cache=self.cache).notices, ['from cache'])
+        # other options and changed content are validated again
+        self.assertTrue(PageValidator.validate(filename=str(path), cache=self.cache, page_textequiv_consistency='off').is_valid)
+        path.write_text(PAGE_TEMPLATE % {'id': 'PAGE', 'text': 'foo'})
+        self.assertTrue(PageValidator.validate(filename=str(path), cache=self.cache).is_valid)
+
+    def test_page_validator_max_errors(self):
+        path = Path(self.tempdir.name, 'PAGE.xml')
+        path.write_text(PAGE_TEMPLATE % {'id': 'PAGE', 'text': 'bar'})
+        report = PageValidator.validate(filename=str(path), cache=self.cache, page_textequiv_consistency='off', max_errors=1)
+        self.assertTrue(report.is_valid)
+        # same entry regardless of max_errors, errors restored with their attributes
+        for max_errors in [None, 1, 2]:
+            report = PageValidator.validate(filename=str(path), cache=self.cache, max_errors=max_errors)
+            self.assertEqual([(type(e), e.ID) for e in report.errors], [(ConsistencyError, 'r0')])
+        self.assertEqual(len(list(Path(self.cache.directory).glob('*/*.json'))), 2)
+
+    def test_page_validator_ocrd_page(self):
+        path = Path(self.tempdir.name, 'PAGE.xml')
+        path.write_text(PAGE_TEMPLATE % {'id': 'PAGE', 'text': 'bar'})
+        ocrd_file = Resolver().workspace_from_nothing(directory=self.tempdir.name).mets.add_file(
+            'OCR-D-GT', ID='PAGE', mimetype=MIMETYPE_PAGE, url=str(path), local_filename=str(path))
+        self.assertFalse(PageValidator.validate(ocrd_file=ocrd_file, cache=self.cache).is_valid)
+        # an in-memory PAGE may differ from the file, so it is always validated
+        ocrd_page = page_from_file(ocrd_file)
+        set_text(ocrd_page.get_Page().get_TextRegion()[0], 'bar', 'first')
+        self.assertTrue(PageValidator.validate(ocrd_page=ocrd_page, ocrd_file=ocrd_file, cache=self.cache).is_valid)
+
+    def test_workspace_validator(self):
+        directory = join(self.tempdir.name, 'ws')
+        resolver = Resolver()
+        workspace = resolver.workspace_from_nothing(directory=directory)
+        workspace.mets.unique_identifier = 'foobar'
+        Image.new('L', (100, 100), 255).save(join(directory, 'img.png'), dpi=(72, 72))
+        workspace.mets.add_file('OCR-D-IMG', ID='IMG', pageId='PHYS_1', mimetype='image/png', url='img.png')
+        workspace.add_file('OCR-D-GT', ID='GT', pageId='PHYS_1', mimetype=MIMETYPE_PAGE,
+                           local_filename=join('OCR-D-GT', 'GT.xml'),
+                           content=PAGE_TEMPLATE % {'id': 'GT', 'text': 'bar'})
+        workspace.save_mets()
+        for jobs in [1, 2, 1]:
+            report = WorkspaceValidator.validate(resolver, join(directory, 'mets.xml'), skip=['imagefilename', 'dimension'],
+                                                 cache=self.cache, jobs=jobs)
+            self.assertEqual([str(e) for e in report.errors], [
+                "INCONSISTENCY in TextRegion ID 'r0' of file 'GT': text results 'foo' != concatenated 'bar'"])
+            self.assertEqual(len(report.notices), 2)
+        # pixel_density, multipage and page
+        self.assertEqual(len(list(Path(self.cache.directory).glob('*/*.json'))), 3)
+        Path(directory, 'OCR-D-GT', 'GT.xml').write_text(PAGE_TEMPLATE % {'id': 'GT', 'text': 'foo'})
+        report = WorkspaceValidator.validate(resolver, join(directory, 'mets.xml'), skip=['imagefilename', 'dimension'],
+                                             cache=self.cache)
+        self.assertEqual(report.errors, [])
+
+if __name__ == '__main__':
+    main()
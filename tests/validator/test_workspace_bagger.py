@@ -1,13 +1,22 @@
-from os import makedirs
+from os import makedirs, unlink
 from os.path import join, abspath, exists
 from shutil import copytree, rmtree
 from tempfile import mkdtemp
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+from bagit import Bag
+from PIL import Image
 
 from tests.base import TestCase, main, assets # pylint: disable=import-error,no-name-in-module
 
 from ocrd.workspace import Workspace
 from ocrd.workspace_bagger import WorkspaceBagger, BACKUPDIR
 from ocrd.resolver import Resolver
+from ocrd_models import OcrdFile
+from ocrd_models.ocrd_page import to_xml
+from ocrd_modelfactory import page_from_image
+from ocrd_utils import MIMETYPE_PAGE
+from ocrd_validators import OcrdZipValidator
 
 README_FILE = abspath('README.md')
 
@@ -16,7 +25,8 @@ class TestWorkspaceBagger(TestCase):
     def setUp(self):
         if exists(BACKUPDIR):
             rmtree(BACKUPDIR)
-        self.resolver = Resolver()
+        # don't retry requests to unreachable hosts
+        self.resolver = Resolver(retries=0)
         self.bagger = WorkspaceBagger(self.resolver)
         self.tempdir = mkdtemp()
         self.bagdir = join(self.tempdir, 'bag')
@@ -108,5 +118,81 @@ class TestWorkspaceBagger(TestCase):
         self.bagger.spill(bag_dest, self.bagdir)
         self.assertTrue(exists(spill_dest))
 
+class TestWorkspaceBaggerZip(TestCase):
+
+    def setUp(self):
+        self.tempdir = mkdtemp()
+        self.resolver = Resolver()
+        self.workspace = self.resolver.workspace_from_nothing(directory=join(self.tempdir, 'ws'))
+        makedirs(join(self.workspace.directory, 'img'))
+        for n, (ext, mimetype) in enumerate([('.png', 'image/png'), ('.tif', 'image/tiff')]):
+            url = 'img/page%d%s' % (n, ext)
+            Image.new('L', (200, 100), 255).save(join(self.workspace.directory, url))
+            self.workspace.mets.add_file('OCR-D-IMG', ID='IMG_%d' % n, pageId='PHYS_%d' % n, mimetype=mimetype, url=url)
+            pcgts = page_from_image(OcrdFile(None, local_filename=join(self.workspace.directory, url), url=url))
+            self.workspace.add_file('OCR-D-GT', ID='GT_%d' % n, pageId='PHYS_%d' % n, mimetype=MIMETYPE_PAGE,
+                                    local_filename=join('gt', 'page%d.xml' % n), content=to_xml(pcgts))
+        self.workspace.save_mets()
+
+    def tearDown(self):
+        rmtree(self.tempdir)
+
+    def test_bag_zip(self):
+        dest = join(self.tempdir, 'out.ocrd.zip')
+        WorkspaceBagger(self.resolver).bag(self.workspace, 'foo', dest=dest, ocrd_manifestation_depth='full', processes=2)
+        with ZipFile(dest) as zf:
+            compress_types = {info.filename: info.compress_type for info in zf.infolist()}
+            self.assertEqual(compress_types['data/OCR-D-IMG/IMG_0.png'], ZIP_STORED)
+            self.assertEqual(compress_types['data/OCR-D-IMG/IMG_1.tif'], ZIP_DEFLATED)
+            self.assertIn(b'imageFilename="OCR-D-IMG/IMG_0.png"', zf.read('data/OCR-D-GT/GT_0.xml'))
+            self.assertIn(b'Payload-Oxum: ', zf.read('bag-info.txt'))
+            zf.extractall(join(self.tempdir, 'bag'))
+        Bag(join(self.tempdir, 'bag')).validate()
+        self.assertTrue(OcrdZipValidator(self.resolver, dest).validate().is_valid)
+
+    def test_bag_zip_stored(self):
+        dest = join(self.tempdir, 'out.ocrd.zip')
+        WorkspaceBagger(self.resolver).bag(self.workspace, 'foo', dest=dest, compression='stored')
+        with ZipFile(dest) as zf:
+            self.assertEqual({info.compress_type for info in zf.infolist()} - {ZIP_DEFLATED}, {ZIP_STORED})
+            self.assertEqual(zf.getinfo('data/OCR-D-IMG/IMG_1.tif').compress_type, ZIP_STORED)
+
+    def test_bag_zip_error(self):
+        dest = join(self.tempdir, 'out.ocrd.zip')
+        unlink(join(self.workspace.directory, 'img', 'page1.tif'))
+        with self.assertRaises(FileNotFoundError):
+            WorkspaceBagger(self.resolver).bag(self.workspace, 'foo', dest=dest)
+        self.assertFalse(exists(dest))
+
+    def test_spill_verify(self):
+        dest = join(self.tempdir, 'out.ocrd.zip')
+        WorkspaceBagger(self.resolver).bag(self.workspace, 'foo', dest=dest)
+        workspace = WorkspaceBagger(self.resolver).spill(dest, join(self.tempdir, 'spilled'), processes=3, verify=True)
+        self.assertEqual(len(workspace.mets.find_files()), 4)
+        for f in workspace.mets.find_files():
+            self.assertTrue(exists(join(workspace.directory, f.url)))
+        with open(join(workspace.directory, 'OCR-D-IMG', 'IMG_1.tif'), 'rb') as spilled, \
+                open(join(self.workspace.directory, 'img', 'page1.tif'), 'rb') as orig:
+            self.assertEqual(spilled.read(), orig.read())
+
+    def test_spill_verify_mismatch(self):
+        dest = join(self.tempdir, 'out.ocrd.zip')
+        WorkspaceBagger(self.resolver).bag(self.workspace, 'foo', dest=dest)
+        with ZipFile(dest) as zf_in, ZipFile(join(self.tempdir, 'bad.ocrd.zip'), 'w') as zf_out:
+            for info in zf_in.infolist():
+                content = zf_in.read(info)
+                if info.filename == 'data/OCR-D-IMG/IMG_1.tif':
+                    content = b'not an image'
+                zf_out.writestr(info, content)
+        with self.assertRaisesRegex(Exception, "Checksum mismatch for data/OCR-D-IMG/IMG_1.tif"):
+            WorkspaceBagger(self.resolver).spill(join(self.tempdir, 'bad.ocrd.zip'), join(self.tempdir, 'spilled'), verify=True)
+        self.assertFalse(exists(join(self.tempdir, 'spilled', 'OCR-D-IMG', 'IMG_1.tif')))
+
+    def test_spill_outside_dest(self):
+        with ZipFile(join(self.tempdir, 'evil.ocrd.zip'), 'w') as zf:
+            zf.writestr('data/../../evil', b'')
+        with self.assertRaisesRegex(Exception, "Invalid path in OCRD-ZIP"):
+            WorkspaceBagger(self.resolver).spill(join(self.tempdir, 'evil.ocrd.zip'), join(self.tempdir, 'spilled'))
+
 if __name__ == '__main__':
     main()
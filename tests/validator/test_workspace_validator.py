@@ -1,14 +1,34 @@
 import os
+from io import StringIO
 from tempfile import TemporaryDirectory
 from os.path import join
 from shutil import copytree
 
-from ocrd_utils import pushd_popd
+from PIL import Image
+
+from ocrd_utils import pushd_popd, MIMETYPE_PAGE
 from ocrd.resolver import Resolver
-from ocrd_validators import WorkspaceValidator
+from ocrd_validators import WorkspaceValidator, StreamingValidationReport, ValidationCache
+from ocrd_validators.constants import PAGE_XSD
 from ocrd_validators.page_validator import ConsistencyError
 
-from tests.base import TestCase, assets, main # pylint: disable=import-error,no-name-in-module
+from tests.base import TestCase, assets, main, serve_directory # pylint: disable=import-error,no-name-in-module
+
+PAGE_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<pc:PcGts xmlns:pc="http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15" pcGtsId="%(id)s">
+  <pc:Metadata><pc:Creator>test</pc:Creator><pc:Created>2020-01-01T00:00:00</pc:Created><pc:LastChange>2020-01-01T00:00:00</pc:LastChange></pc:Metadata>
+  <pc:Page imageFilename="img.png" imageWidth="100" imageHeight="100">
+    <pc:TextRegion id="r0">
+      <pc:Coords points="0,0 50,0 50,50 0,50"/>
+      <pc:TextLine id="l0">
+        <pc:Coords points="0,0 40,0 40,40 0,40"/>
+        <pc:TextEquiv><pc:Unicode>%(text)s</pc:Unicode></pc:TextEquiv>
+      </pc:TextLine>
+      <pc:TextEquiv><pc:Unicode>foo</pc:Unicode></pc:TextEquiv>
+    </pc:TextRegion>
+  </pc:Page>
+</pc:PcGts>
+"""
 
 class TestWorkspaceValidator(TestCase):
 
@@ -203,5 +223,98 @@ class TestWorkspaceValidator(TestCase):
         self.assertEqual(len(report.errors), 0)
 
 
+    def test_validate_page_jobs(self):
+        with TemporaryDirectory() as tempdir:
+            workspace = self.resolver.workspace_from_nothing(directory=tempdir)
+            for n in range(6):
+                workspace.add_file('OCR-D-GT', ID='GT_%d' % n, pageId='PHYS_%d' % n, mimetype=MIMETYPE_PAGE,
+                                   local_filename=join('OCR-D-GT', 'GT_%d.xml' % n),
+                                   content=PAGE_TEMPLATE % {'id': 'GT_%d' % n, 'text': 'foo' if n % 2 else 'bar%d' % n})
+            workspace.save_mets()
+            skip = ['mets_unique_identifier', 'imagefilename', 'dimension', 'pixel_density', 'multipage']
+            serial = WorkspaceValidator.validate(self.resolver, join(tempdir, 'mets.xml'), skip=skip)
+            parallel = WorkspaceValidator.validate(self.resolver, join(tempdir, 'mets.xml'), skip=skip, jobs=3)
+            self.assertEqual(len(serial.errors), 3)
+            self.assertIn("GT_0", str(serial.errors[0]))
+            self.assertIn("GT_4", str(serial.errors[2]))
+            self.assertEqual([str(e) for e in serial.errors], [str(e) for e in parallel.errors])
+            self.assertEqual([str(e) for e in serial.warnings], [str(e) for e in parallel.warnings])
+
+    def test_validate_single_pass(self):
+        with TemporaryDirectory() as tempdir:
+            workspace = self.resolver.workspace_from_nothing(directory=tempdir)
+            workspace.mets.unique_identifier = 'foobar'
+            Image.new('L', (100, 80), 255).save(join(tempdir, 'img.png'), dpi=(300, 300))
+            workspace.mets.add_file('OCR-D-IMG', ID='IMG', pageId='PHYS_1', mimetype='image/png', url='img.png')
+            workspace.add_file('OCR-D-GT', ID='GT', pageId='PHYS_1', mimetype=MIMETYPE_PAGE,
+                               local_filename=join('OCR-D-GT', 'GT.xml'),
+                               content=PAGE_TEMPLATE % {'id': 'GT', 'text': 'bar'})
+            workspace.save_mets()
+            validator = WorkspaceValidator(self.resolver, join(tempdir, 'mets.xml'), download=True)
+            report = validator._validate() # pylint: disable=protected-access
+            self.assertEqual([str(e) for e in report.errors], [
+                "PAGE 'GT': @imageHeight != image's actual height (100 != 80)",
+                "INCONSISTENCY in TextRegion ID 'r0' of file 'GT': text results 'foo' != concatenated 'bar'",
+            ])
+            # probed once for pixel_density, multipage and dimension
+            self.assertEqual(list(validator._exifs), ['img.png']) # pylint: disable=protected-access
+
+    def test_validate_max_errors(self):
+        with TemporaryDirectory() as tempdir:
+            workspace = self.resolver.workspace_from_nothing(directory=tempdir)
+            for n in range(6):
+                workspace.add_file('OCR-D-GT', ID='GT_%d' % n, pageId='PHYS_%d' % n, mimetype=MIMETYPE_PAGE,
+                                   local_filename=join('OCR-D-GT', 'GT_%d.xml' % n),
+                                   content=PAGE_TEMPLATE % {'id': 'GT_%d' % n, 'text': 'bar%d' % n})
+            workspace.save_mets()
+            skip = ['imagefilename', 'dimension', 'pixel_density', 'multipage']
+            report = WorkspaceValidator.validate(self.resolver, join(tempdir, 'mets.xml'), skip=skip)
+            self.assertEqual(len(report.errors), 7)
+            for jobs in [1, 3]:
+                report = WorkspaceValidator.validate(self.resolver, join(tempdir, 'mets.xml'), skip=skip, jobs=jobs, max_errors=3)
+                self.assertEqual([str(e) for e in report.errors[1:]], [
+                    "INCONSISTENCY in TextRegion ID 'r0' of file 'GT_0': text results 'foo' != concatenated 'bar0'",
+                    "INCONSISTENCY in TextRegion ID 'r0' of file 'GT_1': text results 'foo' != concatenated 'bar1'",
+                ])
+                self.assertIn('no unique identifier', report.errors[0])
+
+    def test_validate_streaming(self):
+        with TemporaryDirectory() as tempdir:
+            workspace = self.resolver.workspace_from_nothing(directory=tempdir)
+            for n in range(3):
+                workspace.add_file('OCR-D-GT', ID='GT_%d' % n, mimetype=MIMETYPE_PAGE,
+                                   local_filename=join('OCR-D-GT', 'GT_%d.xml' % n),
+                                   content=PAGE_TEMPLATE % {'id': 'GT_%d' % n, 'text': 'bar%d' % n})
+            workspace.save_mets()
+            skip = ['mets_unique_identifier', 'imagefilename', 'dimension', 'pixel_density', 'multipage']
+            stream = StringIO()
+            report = WorkspaceValidator.validate(self.resolver, join(tempdir, 'mets.xml'), skip=skip,
+                                                 report=StreamingValidationReport(stream, format='xml'))
+            self.assertEqual(str(report), 'INVALID[ 6 errors ]')
+            # in the order of the files instead of grouped by check
+            self.assertEqual([line.split("'")[1] for line in stream.getvalue().splitlines()[1:]], [
+                'GT_0', 'r0', 'GT_1', 'r0', 'GT_2', 'r0'])
+            for jobs in [1, 3]:
+                stream = StringIO()
+                report = WorkspaceValidator.validate(self.resolver, join(tempdir, 'mets.xml'), skip=skip, jobs=jobs, max_errors=3,
+                                                     report=StreamingValidationReport(stream))
+                self.assertEqual(str(report), 'INVALID[ 3 errors ]')
+                self.assertEqual(len(stream.getvalue().splitlines()), 3)
+
+    def test_validate_remote_mets(self):
+        with TemporaryDirectory() as src, TemporaryDirectory() as cache_dir:
+            workspace = self.resolver.workspace_from_nothing(directory=src)
+            workspace.mets.unique_identifier = 'foobar'
+            for n in range(2):
+                workspace.add_file('OCR-D-GT', ID='GT_%d' % n, pageId='PHYS_%d' % n, mimetype=MIMETYPE_PAGE,
+                                   local_filename=join('OCR-D-GT', 'GT_%d.xml' % n),
+                                   content=PAGE_TEMPLATE % {'id': 'GT_%d' % n, 'text': 'bar%d' % n})
+            workspace.save_mets()
+            skip = ['imagefilename', 'dimension']
+            with serve_directory(src) as baseurl:
+                for kwargs in [{}, {'jobs': 2}, {'cache': ValidationCache(cache_dir)}, {'page_xsd': PAGE_XSD}]:
+                    report = WorkspaceValidator.validate(self.resolver, baseurl + '/mets.xml', skip=skip, **kwargs)
+                    self.assertEqual([e.ID for e in report.errors], ['r0', 'r0'], kwargs)
+
 if __name__ == '__main__':
     main()